@@ -0,0 +1,285 @@
+import argparse
+import os
+import shutil
+import sys
+from collections import namedtuple
+from datetime import date, timedelta
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import make_url
+
+from database import bump_version, create_database_engine, write_transaction
+from filters import TransactionFilter, month_range, search_terms
+from migrations import upgrade_schema
+from models import DATABASE_URL, Transaction, MonthlySummary
+from summaries import apply_summary_deltas, summary_deltas
+
+# Closed months can be moved out of SQLite into one Arrow IPC file per month, laid out as
+# <db>_archive/year=YYYY/month=MM/. Each partition also keeps its own per-category totals,
+# so unfiltered reports never open the transaction files; filtered ones only open the
+# partitions that overlap the date range, memory-mapped.
+DATA_FILE = 'transactions.arrow'
+SUMMARY_FILE = 'summary.arrow'
+ARCHIVE_COLUMNS = ['id', 'date', 'amount_cents', 'category_id', 'transaction_type', 'description']
+
+ArchivedTransaction = namedtuple('ArchivedTransaction', ARCHIVE_COLUMNS)
+
+
+# The archive tier is optional, and pyarrow is slow to import: it is loaded by
+# require_arrow() the first time a partition is actually read or written
+pa = pc = None
+
+
+def require_arrow():
+    global pa, pc
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError:
+        raise ValueError("Archyvui reikia įdiegti pyarrow") from None
+    pa, pc = pyarrow, pyarrow.compute
+
+
+def transaction_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.date32()),
+        ('amount_cents', pa.int64()),
+        ('category_id', pa.int64()),
+        ('transaction_type', pa.string()),
+        ('description', pa.string()),
+    ])
+
+
+def archive_dir(url):
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return os.path.splitext(url.database)[0] + '_archive'
+
+
+def partition_path(directory, month):
+    year, month_num = month.split('-')
+    return os.path.join(directory, f"year={year}", f"month={month_num}")
+
+
+def archived_months(directory):
+    if directory is None or not os.path.isdir(directory):
+        return []
+    months = []
+    for year in os.scandir(directory):
+        if not (year.is_dir() and year.name.startswith('year=')):
+            continue
+        for month in os.scandir(year.path):
+            if month.name.startswith('month=') and os.path.exists(os.path.join(month.path, DATA_FILE)):
+                months.append(f"{year.name[len('year='):]}-{month.name[len('month='):]}")
+    return sorted(months)
+
+
+def prune(months, date_from=None, date_to=None):
+    # Partition pruning: a month is opened only if it overlaps [date_from, date_to]
+    first = f"{date_from:%Y-%m}" if date_from is not None else None
+    last = f"{date_to:%Y-%m}" if date_to is not None else None
+    return [month for month in months if (first is None or month >= first) and (last is None or month <= last)]
+
+
+def read_table(path):
+    # The memory map stays alive for as long as the returned table references it
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def write_table(table, path):
+    temporary = path + '.tmp'
+    with pa.OSFile(temporary, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(temporary, path)
+
+
+def month_summary(table):
+    return table.group_by(['category_id', 'transaction_type']).aggregate(
+        [('amount_cents', 'sum'), ('amount_cents', 'count')])
+
+
+def filter_table(table, transaction_filter):
+    f = transaction_filter
+    conditions = []
+    if f.date_from is not None:
+        conditions.append(pc.greater_equal(table['date'], pa.scalar(f.date_from, pa.date32())))
+    if f.date_to is not None:
+        conditions.append(pc.less_equal(table['date'], pa.scalar(f.date_to, pa.date32())))
+    if f.amount_min is not None:
+        conditions.append(pc.greater_equal(table['amount_cents'], f.amount_min))
+    if f.amount_max is not None:
+        conditions.append(pc.less_equal(table['amount_cents'], f.amount_max))
+    if f.categories:
+        conditions.append(pc.is_in(table['category_id'], value_set=pa.array(f.categories, pa.int64())))
+    if f.transaction_type:
+        conditions.append(pc.equal(table['transaction_type'], f.transaction_type))
+    for term in search_terms(f.search):
+        conditions.append(pc.match_substring(table['description'], term, ignore_case=True))
+
+    if not conditions:
+        return table
+    mask = conditions[0]
+    for condition in conditions[1:]:
+        mask = pc.and_(mask, condition)
+    return table.filter(mask)
+
+
+def archived_summary_rows(directory, transaction_filter=None):
+    # Same shape as the SQLite summary rows: (month, category_id, transaction_type, total_cents)
+    f = transaction_filter if transaction_filter is not None else TransactionFilter()
+    months = prune(archived_months(directory), f.date_from, f.date_to)
+    if not months:
+        return []
+    require_arrow()
+
+    rows = []
+    for month in months:
+        path = partition_path(directory, month)
+        if f == TransactionFilter():
+            summary = read_table(os.path.join(path, SUMMARY_FILE))
+        else:
+            summary = month_summary(filter_table(read_table(os.path.join(path, DATA_FILE)), f))
+        rows.extend((month, category_id, transaction_type, total) for category_id, transaction_type, total in zip(
+            summary['category_id'].to_pylist(), summary['transaction_type'].to_pylist(),
+            summary['amount_cents_sum'].to_pylist()))
+    return rows
+
+
+def archived_transactions(directory, transaction_filter=None):
+    f = transaction_filter if transaction_filter is not None else TransactionFilter()
+    months = prune(archived_months(directory), f.date_from, f.date_to)
+    if not months:
+        return None
+    require_arrow()
+    tables = [filter_table(read_table(os.path.join(partition_path(directory, month), DATA_FILE)), f)
+              for month in months]
+    return pa.concat_tables(tables).to_pandas()
+
+
+def archived_category_count(directory, category_id):
+    months = archived_months(directory)
+    if months:
+        require_arrow()
+    count = 0
+    for month in months:
+        summary = read_table(os.path.join(partition_path(directory, month), SUMMARY_FILE))
+        count += sum(summary.filter(pc.equal(summary['category_id'], category_id))['amount_cents_count'].to_pylist())
+    return count
+
+
+def last_closed_month():
+    return f"{date.today().replace(day=1) - timedelta(days=1):%Y-%m}"
+
+
+def archive_range(engine, month_from, month_to):
+    require_arrow()
+    directory = archive_dir(engine.url)
+    if directory is None:
+        raise ValueError("Archyvas galimas tik SQLite duomenų bazės failui")
+    month_to = min(month_to, last_closed_month())
+
+    with engine.connect() as connection:
+        months = connection.execute(
+            select(MonthlySummary.month).distinct()
+            .where(MonthlySummary.month.between(month_from, month_to)).order_by(MonthlySummary.month)
+        ).scalars().all()
+
+    archived = 0
+    for month in months:
+        date_from, date_to = month_range(month)
+        in_month = Transaction.date.between(date_from, date_to)
+        # The write lock is taken before the month is read, so no other instance can save a
+        # row into it between the read and the delete below
+        with write_transaction(engine) as connection:
+            rows = connection.execute(
+                select(*(getattr(Transaction, column) for column in ARCHIVE_COLUMNS))
+                .where(in_month).order_by(Transaction.date, Transaction.id)
+            ).all()
+            if not rows:
+                continue
+            table = pa.Table.from_pylist([row._asdict() for row in rows], schema=transaction_schema())
+
+            path = partition_path(directory, month)
+            os.makedirs(path, exist_ok=True)
+            data_path = os.path.join(path, DATA_FILE)
+            if os.path.exists(data_path):
+                # Rows backdated into an already archived month are appended to its partition
+                table = pa.concat_tables([read_table(data_path), table])
+
+            connection.execute(delete(Transaction).where(in_month))
+            # Removing the month through deltas also takes it out of the later running totals
+            apply_summary_deltas(connection, summary_deltas(rows, -1))
+            bump_version(connection)
+            # Files are written last, so a failed delete leaves the partition untouched
+            write_table(month_summary(table), os.path.join(path, SUMMARY_FILE))
+            write_table(table, data_path)
+        archived += len(rows)
+    return archived
+
+
+def restore_range(engine, month_from, month_to):
+    directory = archive_dir(engine.url)
+    months = [month for month in archived_months(directory) if month_from <= month <= month_to]
+    if months:
+        require_arrow()
+
+    restored = 0
+    for month in months:
+        path = partition_path(directory, month)
+        rows = read_table(os.path.join(path, DATA_FILE)).to_pylist()
+        with write_transaction(engine) as connection:
+            if rows:
+                ids = [row['id'] for row in rows]
+                taken = set(connection.execute(
+                    select(Transaction.id).where(Transaction.id.between(min(ids), max(ids)))).scalars())
+                # An id reused since archiving keeps the new row; the restored one gets a fresh id.
+                # An executemany of an empty list would insert one row of defaults, hence the guards
+                fresh = [row for row in rows if row['id'] not in taken]
+                if fresh:
+                    connection.execute(insert(Transaction), fresh)
+                moved = [{column: row[column] for column in ARCHIVE_COLUMNS if column != 'id'}
+                         for row in rows if row['id'] in taken]
+                if moved:
+                    connection.execute(insert(Transaction), moved)
+                apply_summary_deltas(connection, summary_deltas([ArchivedTransaction(**row) for row in rows]))
+                bump_version(connection)
+        shutil.rmtree(path)
+        year_path = os.path.dirname(path)
+        if not os.listdir(year_path):
+            os.rmdir(year_path)
+        restored += len(rows)
+    return restored
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Senų mėnesių perkėlimas į archyvą ir atkūrimas")
+    parser.add_argument('command', choices=['archive', 'restore', 'list'])
+    parser.add_argument('--db', default=DATABASE_URL, help="duomenų bazės adresas")
+    parser.add_argument('--from', dest='month_from', default='0000-00', help="pirmas mėnuo (YYYY-MM)")
+    parser.add_argument('--to', dest='month_to', default='9999-99', help="paskutinis mėnuo (YYYY-MM)")
+    args = parser.parse_args(argv)
+
+    engine = create_database_engine(args.db)
+    upgrade_schema(engine)
+    try:
+        if args.command == 'list':
+            for month in archived_months(archive_dir(engine.url)):
+                print(month)
+        elif args.command == 'archive':
+            print(f"Archyvuota operacijų: {archive_range(engine, args.month_from, args.month_to)}")
+        else:
+            print(f"Atkurta operacijų: {restore_range(engine, args.month_from, args.month_to)}")
+    except ValueError as e:
+        print(f"Klaida: {e}", file=sys.stderr)
+        return 1
+    finally:
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,528 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+
+from archive import archive_range, restore_range
+from categorizer import Rule, RuleMatcher, load_classifier
+from charts import chart_report
+from database import BUSY_TIMEOUT_MS, create_database_engine, write_transaction
+from filters import (SELECTIVE_SEARCH_LIMIT, TransactionFilter, build_criteria, deferred_search_indexing,
+                     month_range)
+from importer import ImportedTransaction, import_statement
+from main import TransactionList, TransactionStore, format_transaction_rows
+from migrations import upgrade_schema
+from models import Transaction, Category
+from money import to_cents
+from reports import REPORT_TYPES, run_report
+from summaries import rebuild_summaries, verify_summaries
+
+# Every path is timed through the same functions the UI hands to the background worker,
+# so no Tk root (real or mocked) is needed and the suite runs on a headless machine.
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+SAMPLES = 200
+REPEATS = 20
+CHUNK_SIZE = 50_000
+DAYS = 3650
+END_DATE = date(2024, 12, 31)
+PAYDAY = 10
+RARE_TERM = '#424242'
+# Descriptions classified per timed batch, about the size of a large bank statement
+CLASSIFY_BATCH = 100_000
+CLASSIFY_REPEATS = 5
+
+# name, relative frequency, median amount in cents and merchants used in descriptions
+CATEGORIES = {
+    'expense': [
+        ('Maistas', 40, 2_500, ['Maxima', 'Rimi', 'Iki', 'Lidl', 'Norfa']),
+        ('Transportas', 15, 3_000, ['Circle K', 'Viada', 'Bolt', 'Trafi']),
+        ('Mokesčiai', 8, 6_000, ['Ignitis', 'Telia', 'Vilniaus vandenys']),
+        ('Pramogos', 12, 2_000, ['Forum Cinemas', 'Spotify', 'Netflix']),
+        ('Būstas', 5, 45_000, ['Nuoma', 'Senukai']),
+    ],
+    'income': [
+        ('Atlyginimas', 12, 180_000, ['Darbdavys']),
+        ('Verslas', 3, 50_000, ['Sąskaita']),
+        ('Investicijos', 2, 8_000, ['Dividendai']),
+        ('Kitos pajamos', 3, 3_000, ['Pervedimas']),
+    ]
+}
+
+
+def create_categories(engine):
+    with engine.begin() as conn:
+        conn.execute(insert(Category), [{'name': name, 'category_type': category_type}
+                                        for category_type, entries in CATEGORIES.items()
+                                        for name, *_ in entries])
+        return dict(conn.execute(select(Category.name, Category.id)).all())
+
+
+def generate_rows(count, category_ids, seed=0):
+    rng = random.Random(seed)
+    choices = [(category_type, entry) for category_type, entries in CATEGORIES.items() for entry in entries]
+    weights = [entry[1] for _, entry in choices]
+    start = END_DATE - timedelta(days=DAYS)
+    for _ in range(count):
+        transaction_type, (name, _, median, merchants) = rng.choices(choices, weights)[0]
+        # Activity grows over the years: the density of days rises linearly towards END_DATE
+        day = start + timedelta(days=int(DAYS * math.sqrt(rng.random())))
+        if name == 'Atlyginimas':
+            day = day.replace(day=PAYDAY)
+        yield {
+            'date': day,
+            'amount_cents': max(1, int(median * math.exp(rng.gauss(0, 0.6)))),
+            'category_id': category_ids[name],
+            'transaction_type': transaction_type,
+            'description': f"{rng.choice(merchants)} #{rng.randrange(1_000_000)}"
+        }
+
+
+def populate(engine, count, category_ids):
+    rows = generate_rows(count, category_ids)
+    with engine.begin() as conn, deferred_search_indexing(conn):
+        while True:
+            chunk = [row for _, row in zip(range(CHUNK_SIZE), rows)]
+            if not chunk:
+                break
+            chunk.sort(key=lambda row: row['date'])
+            conn.execute(insert(Transaction), chunk)
+
+
+def generate_database(path, count):
+    # Built through the real migrations so the indexes, search index and statistics match the app
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        upgrade_schema(engine)
+        populate(engine, count, create_categories(engine))
+        session = sessionmaker(bind=engine)()
+        rebuild_summaries(session)
+        session.close()
+        with engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+    finally:
+        engine.dispose()
+
+
+def ensure_database(directory, count):
+    path = os.path.join(directory, f"finance_tracker_{count}.db")
+    if os.path.exists(path):
+        return path, None
+    started = time.perf_counter()
+    try:
+        generate_database(path, count)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, time.perf_counter() - started
+
+
+def load_page(session, transaction_filter):
+    # What TransactionList does for a new filter: worker page job, row formatting, count job
+    store = TransactionStore(session)
+    criteria = build_criteria(session, transaction_filter)
+    rows, _ = TransactionList.fetch_page(store, criteria)
+    format_transaction_rows(rows, store.categories.names())
+    store.count_query(criteria).scalar()
+    return rows
+
+
+def next_page(session):
+    store = TransactionStore(session)
+    rows, _ = TransactionList.fetch_page(store, [])
+    if rows:
+        TransactionList.fetch_page(store, [], after=(rows[-1].date, rows[-1].id))
+
+
+def ui_paths(category_ids):
+    date_from, date_to = month_range(f"{END_DATE:%Y-%m}")
+    food, housing = category_ids['Maistas'], category_ids['Būstas']
+    filters = {
+        'month': TransactionFilter(date_from=date_from, date_to=date_to),
+        'category': TransactionFilter(categories=(food,)),
+        'combined': TransactionFilter(date_from=date_from - timedelta(days=365), date_to=date_to,
+                                      categories=(food, housing), transaction_type='expense', amount_min=2_000),
+        'search_frequent': TransactionFilter(search='Maxima'),
+        'search_rare': TransactionFilter(search=RARE_TERM),
+    }
+
+    paths = {
+        'load_transactions': lambda session: load_page(session, TransactionFilter()),
+        'scroll_next_page': next_page,
+        'get_months_list': lambda session: TransactionStore(session).months(),
+        'load_classifier': load_classifier,
+    }
+    for name, transaction_filter in filters.items():
+        paths[f"filter_transactions[{name}]"] = (
+            lambda session, transaction_filter=transaction_filter: load_page(session, transaction_filter))
+    for report_type in REPORT_TYPES:
+        paths[f"update_chart[{report_type}]"] = (
+            lambda session, report_type=report_type: chart_report(run_report(session, report_type), report_type))
+    return paths
+
+
+def summarize(latencies, peak_bytes=None):
+    p95 = statistics.quantiles(latencies, n=20, method='inclusive')[-1] if len(latencies) > 1 else latencies[0]
+    result = {
+        'median_ms': statistics.median(latencies) * 1000,
+        'p95_ms': p95 * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+    if peak_bytes is not None:
+        result['peak_kib'] = peak_bytes / 1024
+    return result
+
+
+def measure_peak(function, *args):
+    # A separate untimed run: tracemalloc slows allocation-heavy code down considerably
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def time_path(Session, job, repeats):
+    # Each run gets a fresh session, like a worker job, so no read transaction is reused
+    def run_once():
+        with Session() as session:
+            job(session)
+
+    run_once()
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run_once()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies, measure_peak(run_once))
+
+
+def time_classification(Session, category_ids, repeats=CLASSIFY_REPEATS):
+    with Session() as session:
+        classifier = load_classifier(session)
+    batch = [ImportedTransaction(**row) for row in generate_rows(CLASSIFY_BATCH, category_ids, seed=2)]
+    latencies = []
+    for _ in range(repeats):
+        # Cold per run, as for a fresh import
+        classifier.predictions.clear()
+        started = time.perf_counter()
+        classifier.classify_batch(batch)
+        latencies.append(time.perf_counter() - started)
+    return {f"classify_batch[{CLASSIFY_BATCH}]": summarize(latencies)}
+
+
+def time_saves(store, category_ids, samples=SAMPLES):
+    inserts, deletes = [], []
+    for row in generate_rows(samples, category_ids, seed=1):
+        started = time.perf_counter()
+        saved = store.add(Transaction(**row))
+        inserts.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        store.delete(saved.id)
+        deletes.append(time.perf_counter() - started)
+    return {'insert': summarize(inserts), 'delete': summarize(deletes)}
+
+
+def benchmark_database(path, repeats=REPEATS, samples=SAMPLES):
+    # Same engine configuration (pool, WAL, busy timeout) as the app; databases generated
+    # by an older version are brought up to the current schema first
+    engine = create_database_engine(f"sqlite:///{path}")
+    Session = sessionmaker(bind=engine)
+    try:
+        upgrade_schema(engine)
+        with Session() as session:
+            category_ids = dict(session.query(Category.name, Category.id))
+
+        results = {name: time_path(Session, job, repeats) for name, job in ui_paths(category_ids).items()}
+        results.update(time_classification(Session, category_ids))
+
+        session = Session()
+        try:
+            results.update(time_saves(TransactionStore(session), category_ids, samples))
+        finally:
+            session.close()
+        return results
+    finally:
+        engine.dispose()
+
+
+def schema_objects(connection):
+    return connection.exec_driver_sql("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").all()
+
+
+def check_failed_import(directory):
+    # A statement failing halfway must leave the schema, search triggers included, as it was
+    path = os.path.join(directory, "failed_import.db")
+    generate_database(path, 1_000)
+    valid, invalid = (os.path.join(directory, name) for name in ("valid_import.csv", "failed_import.csv"))
+    with open(valid, 'w', encoding='utf-8') as file:
+        file.write("date,amount,description\n2024-01-02,-10.00,Maxima\n")
+    with open(invalid, 'w', encoding='utf-8') as file:
+        file.write("date,amount,description\n2024-01-02,-10.00,Maxima\n2024-13-01,-5.00,Rimi\n")
+
+    engine = create_database_engine(f"sqlite:///{path}")
+    try:
+        # The first import adds the fallback categories, so the failing one writes nothing
+        # before the search trigger is dropped
+        import_statement(engine, valid)
+        with engine.connect() as connection:
+            schema, rows = schema_objects(connection), connection.execute(select(func.count(Transaction.id))).scalar()
+        try:
+            import_statement(engine, invalid)
+        except ValueError:
+            pass
+        else:
+            return "importas su neteisinga data pavyko"
+        with engine.connect() as connection:
+            if schema_objects(connection) != schema:
+                return "pasikeitė sqlite_master"
+            if connection.execute(select(func.count(Transaction.id))).scalar() != rows:
+                return "liko dalis importuotų operacijų"
+    finally:
+        engine.dispose()
+    return None
+
+
+def check_invalid_amounts(directory):
+    # Anything the INTEGER columns cannot hold is a ValueError, which every input path reports
+    for value in ('inf', '-inf', 'nan', '1e400', 10 ** 17, float('inf')):
+        try:
+            to_cents(value)
+        except ValueError:
+            continue
+        return f"suma {value!r} priimta"
+    return None
+
+
+def check_rule_priority(directory):
+    # The lowest numbered applicable rule wins even where its match overlaps a later rule's
+    # or one of another transaction type or amount range
+    cases = [
+        ([('bar', 'expense', None), ('foob', 'expense', None)], 1),
+        ([('foob', 'income', None), ('bar', 'expense', None)], 2),
+        ([('foob', 'expense', 0), ('bar', 'expense', None)], 2),
+        ([('foo', 'expense', 0), ('fo', 'expense', None)], 2),
+    ]
+    for patterns, expected in cases:
+        rules = [Rule(number, transaction_type, 'regex', pattern, amount_min_cents, None)
+                 for number, (pattern, transaction_type, amount_min_cents) in enumerate(patterns, start=1)]
+        found = RuleMatcher(rules).match('foobar', -100, 'expense')
+        if found != expected:
+            return f"{[rule.pattern for rule in rules]}: 'foobar' priskirta {found}, turi būti {expected}"
+    return None
+
+
+def check_archive_round_trip(directory):
+    # Rows added after a month was archived reuse its ids; restoring it must give the archived
+    # rows fresh ids and leave the summaries matching the transactions
+    path = os.path.join(directory, "archive_round_trip.db")
+    generate_database(path, 0)
+    engine = create_database_engine(f"sqlite:///{path}")
+    Session = sessionmaker(bind=engine)
+    try:
+        with Session() as session:
+            store = TransactionStore(session)
+            category_id = session.query(Category.id).filter_by(category_type='expense').limit(1).scalar()
+            for day in (date(2024, 6, 4), date(2024, 5, 2), date(2024, 5, 3)):
+                store.add(Transaction(date=day, amount_cents=-1000, category_id=category_id,
+                                      transaction_type='expense', description="Maxima"))
+            archive_range(engine, '2024-05', '2024-05')
+            for day in (date(2024, 7, 1), date(2024, 7, 2)):
+                store.add(Transaction(date=day, amount_cents=-500, category_id=category_id,
+                                      transaction_type='expense', description="Rimi"))
+            restore_range(engine, '2024-05', '2024-05')
+
+            rows = session.query(Transaction.date, Transaction.amount_cents).all()
+            if len(rows) != 5 or any(value is None for row in rows for value in row):
+                return f"po atkūrimo operacijos {sorted(rows, key=str)}"
+            if verify_summaries(session):
+                return "suvestinės nesutampa su operacijomis"
+    finally:
+        engine.dispose()
+    return None
+
+
+def check_concurrent_write(directory):
+    # A save while another instance holds the write lock waits for it instead of failing
+    path = os.path.join(directory, "concurrent_write.db")
+    generate_database(path, 1_000)
+    engine = create_database_engine(f"sqlite:///{path}")
+    Session = sessionmaker(bind=engine)
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with write_transaction(engine) as connection:
+            connection.execute(select(func.count(Transaction.id))).scalar()
+            locked.set()
+            release.wait(BUSY_TIMEOUT_MS / 1000)
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    try:
+        locked.wait()
+        threading.Timer(0.5, release.set).start()
+        with Session() as session:
+            store = TransactionStore(session)
+            category_id = session.query(Category.id).filter_by(category_type='expense').limit(1).scalar()
+            session.commit()
+            try:
+                store.add(Transaction(date=date(2024, 1, 2), amount_cents=1000, category_id=category_id,
+                                      transaction_type='expense', description="Maxima"))
+            except SQLAlchemyError as e:
+                return f"įrašymas nepalaukė: {getattr(e, 'orig', e)}"
+    finally:
+        release.set()
+        holder.join()
+        engine.dispose()
+    return None
+
+
+def check_search_case(directory):
+    # Rare terms go through the trigram index, frequent and short ones through LIKE; both fold
+    # Lithuanian letters the same way
+    path = os.path.join(directory, "search_case.db")
+    generate_database(path, 0)
+    engine = create_database_engine(f"sqlite:///{path}")
+    Session = sessionmaker(bind=engine)
+    try:
+        with engine.begin() as connection:
+            rows = [{'date': date(2024, 1, 2), 'amount_cents': 100, 'transaction_type': 'expense',
+                     'description': "ŠVYTURYS alus"}] * SELECTIVE_SEARCH_LIMIT
+            rows.append({'date': date(2024, 1, 3), 'amount_cents': 100, 'transaction_type': 'expense',
+                         'description': "Kavinė ŠIAULIAI"})
+            connection.execute(insert(Transaction), rows)
+        with Session() as session:
+            for search, expected in (('švyturys', SELECTIVE_SEARCH_LIMIT), ('šiauliai', 1), ('ši', 1)):
+                criteria = build_criteria(session, TransactionFilter(search=search))
+                found = session.query(func.count(Transaction.id)).filter(*criteria).scalar()
+                if found != expected:
+                    return f"'{search}' rasta {found}, turi būti {expected}"
+    finally:
+        engine.dispose()
+    return None
+
+
+# name, function(scratch directory) returning None or what went wrong
+CHECKS = [
+    ('failed_import', check_failed_import),
+    ('invalid_amounts', check_invalid_amounts),
+    ('rule_priority', check_rule_priority),
+    ('archive_round_trip', check_archive_round_trip),
+    ('concurrent_write', check_concurrent_write),
+    ('search_case', check_search_case),
+]
+
+
+def run_checks():
+    failed = 0
+    with tempfile.TemporaryDirectory() as scratch:
+        for name, check in CHECKS:
+            problem = check(scratch)
+            print(f"{name:<40} {'gerai' if problem is None else f'KLAIDA: {problem}'}")
+            failed += problem is not None
+    return 1 if failed else 0
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=SIZES, data_dir=None, repeats=REPEATS, samples=SAMPLES):
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for size in sizes:
+            path, generate_s = ensure_database(data_dir or scratch, size)
+            results.append({
+                'rows': size,
+                'generate_s': generate_s,
+                'paths': benchmark_database(path, repeats, samples),
+                # Process-wide high-water mark so far, in KiB on Linux
+                'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            })
+    return {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'repeats': repeats,
+        'samples': samples,
+        'results': results,
+    }
+
+
+def print_report(report):
+    print(f"{'Eilutės':>10}  {'Kelias':<40} {'Mediana, ms':>12} {'p95, ms':>10} {'Atmintis, KiB':>14}")
+    for result in report['results']:
+        for name, timing in result['paths'].items():
+            peak = f"{timing['peak_kib']:>14.0f}" if 'peak_kib' in timing else f"{'':>14}"
+            print(f"{result['rows']:>10}  {name:<40} {timing['median_ms']:>12.3f} {timing['p95_ms']:>10.3f} {peak}")
+
+
+def parse_sizes(value):
+    return [int(size.replace('_', '')) for size in value.split(',') if size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sąsajos duomenų kelių našumo matavimai")
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help="sugeneruoti duomenų bazes ir išmatuoti (numatytoji)")
+    run_parser.add_argument('--sizes', type=parse_sizes, default=SIZES, help="pvz. 10000,100000")
+    run_parser.add_argument('--data-dir', help="kur laikyti sugeneruotas bazes; esamos naudojamos pakartotinai")
+    run_parser.add_argument('--output', '-o', help="JSON rezultatų failas")
+    run_parser.add_argument('--repeats', type=int, default=REPEATS)
+    run_parser.add_argument('--samples', type=int, default=SAMPLES, help="įrašymų ir trynimų skaičius")
+
+    generate_parser = subparsers.add_parser('generate', help="sugeneruoti vieną duomenų bazę")
+    generate_parser.add_argument('rows', type=int)
+    generate_parser.add_argument('--db', default='finance_tracker.db', help="naujos bazės failas")
+
+    subparsers.add_parser('check', help="patikrinti klaidų atvejus mažose sugeneruotose bazėse")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'check':
+        return run_checks()
+
+    if args.command == 'generate':
+        if os.path.exists(args.db):
+            parser.error(f"{args.db} jau yra")
+        started = time.perf_counter()
+        generate_database(args.db, args.rows)
+        print(f"Sugeneruota operacijų: {args.rows} per {time.perf_counter() - started:.1f} s")
+        return 0
+
+    if args.command is None:
+        args = run_parser.parse_args([])
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+    report = run(args.sizes, args.data_dir, args.repeats, args.samples)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,44 @@
+from collections import namedtuple
+
+from sqlalchemy import and_, delete, func, select
+
+from database import upsert
+from models import Budget, MonthlySummary
+
+BudgetUsage = namedtuple('BudgetUsage', ['category_id', 'limit_cents', 'spent_cents'])
+
+
+def budget_usage(session, month, category_id=None):
+    # Spending comes from the maintained monthly summaries: one primary-key lookup per
+    # budget instead of a scan over the month's transactions
+    spent = and_(
+        MonthlySummary.month == month,
+        MonthlySummary.category_id == Budget.category_id,
+        MonthlySummary.transaction_type == 'expense'
+    )
+    query = select(
+        Budget.category_id,
+        Budget.limit_cents,
+        func.coalesce(MonthlySummary.total_cents, 0)
+    ).outerjoin(MonthlySummary, spent)
+    if category_id is not None:
+        query = query.where(Budget.category_id == category_id)
+    return [BudgetUsage(*row) for row in session.execute(query)]
+
+
+def set_budget(session, category_id, limit_cents):
+    if limit_cents <= 0:
+        raise ValueError("biudžetas turi būti teigiamas")
+    statement = upsert(session, Budget).values(category_id=category_id, limit_cents=limit_cents)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[Budget.category_id],
+        set_={'limit_cents': statement.excluded.limit_cents}
+    ))
+
+
+def remove_budget(session, category_id):
+    session.execute(delete(Budget).where(Budget.category_id == category_id))
+
+
+def exceeded(usage):
+    return usage.spent_cents > usage.limit_cents
@@ -0,0 +1,37 @@
+from database import operation
+from models import Category
+
+
+class CategoryCache:
+    # Transactions and summaries only carry category ids; names are resolved here on the
+    # main thread. Every category write must call invalidate() so the next lookup reloads.
+    def __init__(self, session):
+        self.session = session
+        self.entries = None
+
+    @operation
+    def load(self):
+        if self.entries is None:
+            rows = self.session.query(Category.id, Category.name, Category.category_type).order_by(Category.name)
+            self.entries = {category_id: (name, category_type) for category_id, name, category_type in rows}
+        return self.entries
+
+    def name(self, category_id):
+        entry = self.load().get(category_id)
+        return entry[0] if entry is not None else ''
+
+    def names(self):
+        return {category_id: name for category_id, (name, _) in self.load().items()}
+
+    def of_type(self, category_type=None):
+        return [(category_id, name) for category_id, (name, entry_type) in self.load().items()
+                if category_type is None or entry_type == category_type]
+
+    def find(self, name, category_type):
+        for category_id, entry in self.load().items():
+            if entry == (name, category_type):
+                return category_id
+        return None
+
+    def invalidate(self):
+        self.entries = None
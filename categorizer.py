@@ -0,0 +1,428 @@
+import argparse
+import re
+import sys
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque, namedtuple
+
+from sqlalchemy import and_, bindparam, or_, select, update
+from sqlalchemy.orm import sessionmaker
+
+from database import bump_version, create_database_engine, write_transaction
+from migrations import upgrade_schema
+from models import Category, CategoryRule, DATABASE_URL, Transaction
+from money import format_cents, to_cents
+from summaries import apply_summary_deltas, summary_deltas
+
+# Categories given to transactions that neither the statement nor the classifier could place
+FALLBACK_CATEGORIES = {
+    'expense': 'Kitos išlaidos',
+    'income': 'Kitos pajamos'
+}
+
+RULE_KINDS = {
+    'keyword': 'Raktažodis',
+    'regex': 'Reguliarioji išraiška',
+}
+# The model learns from this many of the latest transactions: recent habits matter most and
+# training stays bounded however large the ledger grows
+HISTORY_LIMIT = 100_000
+# A learned category is only offered when at least this share of the matching history agrees
+MIN_SHARE = 0.6
+# While typing, a partial first word is completed against known merchants from this length on
+MIN_PREFIX = 3
+RECLASSIFY_BATCH_SIZE = 50_000
+
+NON_WORD = re.compile(r'[\W\d_]+')
+
+Rule = namedtuple('Rule', ['category_id', 'transaction_type', 'kind', 'pattern',
+                           'amount_min_cents', 'amount_max_cents'])
+MovedTransaction = namedtuple('MovedTransaction',
+                              ['date', 'amount_cents', 'category_id', 'transaction_type'])
+
+
+def normalize_description(description):
+    # "MAXIMA LT #1234, Vilnius" -> "maxima lt vilnius": receipt numbers, dates and card
+    # digits differ on every row while the words stay the same
+    return NON_WORD.sub(' ', description.lower()).strip()
+
+
+# A backslash-escaped group number or a conditional on a group, outside an escaped backslash
+GROUP_REFERENCE = re.compile(r'(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?\()')
+
+
+def validate_rule(rule):
+    if rule.kind not in RULE_KINDS:
+        raise ValueError(f"nežinoma taisyklės rūšis '{rule.kind}'")
+    if not rule.pattern and rule.amount_min_cents is None and rule.amount_max_cents is None:
+        raise ValueError("nurodykite raktažodį, išraišką arba sumų ribas")
+    if (rule.amount_min_cents is not None and rule.amount_max_cents is not None
+            and rule.amount_min_cents > rule.amount_max_cents):
+        raise ValueError("mažiausia suma didesnė už didžiausią")
+    if rule.kind == 'regex' and rule.pattern:
+        # Checked both alone and as one alternative of the combined patterns: inline global
+        # flags, named groups and group references are only valid in the former
+        try:
+            re.compile(rule.pattern)
+            compiled = re.compile(f"(?:{rule.pattern})")
+        except re.error as e:
+            raise ValueError(f"neteisinga reguliarioji išraiška: {e}") from e
+        if compiled.groupindex:
+            raise ValueError("reguliariojoje išraiškoje negali būti vardinių grupių")
+        if GROUP_REFERENCE.search(rule.pattern):
+            raise ValueError("reguliariojoje išraiškoje negali būti nuorodų į grupes")
+
+
+def applies(rule, amount_cents, transaction_type):
+    if rule.transaction_type != transaction_type:
+        return False
+    if rule.amount_min_cents is not None and (amount_cents is None or amount_cents < rule.amount_min_cents):
+        return False
+    if rule.amount_max_cents is not None and (amount_cents is None or amount_cents > rule.amount_max_cents):
+        return False
+    return True
+
+
+class KeywordAutomaton:
+    # Aho-Corasick over the lowercased keywords: every keyword occurring in a description is
+    # found in one pass over its characters, however many keywords there are
+    def __init__(self, keywords):
+        self.transitions = [{}]
+        self.outputs = [[]]
+        for keyword, index in keywords:
+            state = 0
+            for char in keyword.lower():
+                next_state = self.transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions[state][char] = next_state
+                    self.transitions.append({})
+                    self.outputs.append([])
+                state = next_state
+            self.outputs[state].append(index)
+
+        # Failure links, breadth first, so a state's link is known before its children's
+        self.fail = [0] * len(self.transitions)
+        pending = deque(self.transitions[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self.transitions[state].items():
+                pending.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.transitions[fallback].get(char, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+    def search(self, text):
+        transitions, fail, outputs = self.transitions, self.fail, self.outputs
+        state = 0
+        for char in text.lower():
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            yield from outputs[state]
+
+
+RegexNode = namedtuple('RegexNode', ['first', 'pattern', 'left', 'right'])
+
+
+def regex_tree(regexes):
+    # regexes are (rule index, compiled pattern) in priority order; every inner node joins
+    # its rules into one alternation, which only tells whether any of them matches
+    if len(regexes) == 1:
+        index, regex = regexes[0]
+        return RegexNode(index, regex, None, None)
+    middle = len(regexes) // 2
+    pattern = re.compile('|'.join(f"(?:{regex.pattern})" for _, regex in regexes), re.IGNORECASE)
+    return RegexNode(regexes[0][0], pattern, regex_tree(regexes[:middle]), regex_tree(regexes[middle:]))
+
+
+class RuleMatcher:
+    # Rules are numbered in priority order and the lowest applicable number wins. Keywords go
+    # into one automaton. The regex rules of each transaction type form a binary tree: a
+    # description that no rule matches costs one search at the root, otherwise the search
+    # descends into the first half whose alternation matches, which finds the lowest matching
+    # rule in a few searches however the matches overlap.
+    def __init__(self, rules):
+        self.rules = list(rules)
+        keywords = [(rule.pattern, index) for index, rule in enumerate(self.rules)
+                    if rule.pattern and rule.kind == 'keyword']
+        self.keywords = KeywordAutomaton(keywords) if keywords else None
+        by_type = defaultdict(list)
+        for index, rule in enumerate(self.rules):
+            if rule.pattern and rule.kind == 'regex':
+                by_type[rule.transaction_type].append((index, re.compile(rule.pattern, re.IGNORECASE)))
+        self.regexes = {transaction_type: regex_tree(regexes) for transaction_type, regexes in by_type.items()}
+        self.amount_rules = [index for index, rule in enumerate(self.rules) if not rule.pattern]
+
+    def first_regex(self, node, description, amount_cents, transaction_type, best):
+        if node.first >= best or not node.pattern.search(description):
+            return best
+        if node.left is None:
+            return node.first if applies(self.rules[node.first], amount_cents, transaction_type) else best
+        # A match in the left half may still fail its amount bounds, so the right half is
+        # only skipped once the left one has produced a rule
+        best = self.first_regex(node.left, description, amount_cents, transaction_type, best)
+        return self.first_regex(node.right, description, amount_cents, transaction_type, best)
+
+    def candidates(self, description):
+        if self.keywords is not None:
+            yield from self.keywords.search(description)
+        yield from self.amount_rules
+
+    def match(self, description, amount_cents, transaction_type):
+        if not self.rules:
+            return None
+        best = len(self.rules)
+        for index in self.candidates(description):
+            if index < best and applies(self.rules[index], amount_cents, transaction_type):
+                best = index
+
+        regexes = self.regexes.get(transaction_type)
+        if regexes is not None:
+            best = self.first_regex(regexes, description, amount_cents, transaction_type, best)
+        return self.rules[best].category_id if best < len(self.rules) else None
+
+
+class FrequencyModel:
+    # Learned from (description -> category) pairs in the ledger: counts per whole normalized
+    # description and per its first word, which on bank statements is usually the merchant
+    def __init__(self):
+        self.phrases = defaultdict(Counter)
+        self.words = defaultdict(Counter)
+        self.word_index = None
+
+    @classmethod
+    def train(cls, rows):
+        model = cls()
+        # Repeated descriptions (card payments at the same shop) are normalized once
+        for (description, transaction_type, category_id), count in Counter(map(tuple, rows)).items():
+            model.learn(description, transaction_type, category_id, count)
+        return model
+
+    def learn(self, description, transaction_type, category_id, count=1):
+        text = normalize_description(description or '')
+        if not text:
+            return
+        word = text.split(' ', 1)[0]
+        if (transaction_type, word) not in self.words:
+            self.word_index = None
+        self.phrases[(transaction_type, text)][category_id] += count
+        self.words[(transaction_type, word)][category_id] += count
+
+    @staticmethod
+    def best(counts):
+        category_id, count = counts.most_common(1)[0]
+        return category_id if count >= MIN_SHARE * sum(counts.values()) else None
+
+    def predict(self, text, transaction_type):
+        # The whole description decides when it has been seen before, its merchant otherwise
+        if not text:
+            return None
+        counts = self.phrases.get((transaction_type, text))
+        if counts is None:
+            counts = self.words.get((transaction_type, text.split(' ', 1)[0]))
+        return self.best(counts) if counts is not None else None
+
+    def complete(self, text, transaction_type):
+        # "max" -> whatever the merchants starting with "max" were filed under
+        if len(text) < MIN_PREFIX or ' ' in text:
+            return None
+        if self.word_index is None:
+            self.word_index = sorted(self.words)
+        counts = Counter()
+        position = bisect_left(self.word_index, (transaction_type, text))
+        while position < len(self.word_index):
+            key = self.word_index[position]
+            if key[0] != transaction_type or not key[1].startswith(text):
+                break
+            counts.update(self.words[key])
+            position += 1
+        return self.best(counts) if counts else None
+
+
+class Classifier:
+    # User rules first, the learned model for whatever they leave open
+    def __init__(self, rules=(), model=None):
+        self.matcher = RuleMatcher(rules)
+        self.model = model if model is not None else FrequencyModel()
+        # Statements repeat the same merchants, so a learned guess is looked up once per distinct text
+        self.predictions = {}
+
+    def classify(self, description, amount_cents, transaction_type):
+        description = description or ''
+        category_id = self.matcher.match(description, amount_cents, transaction_type)
+        if category_id is not None:
+            return category_id
+        key = (transaction_type, normalize_description(description))
+        if key not in self.predictions:
+            self.predictions[key] = self.model.predict(key[1], transaction_type)
+        return self.predictions[key]
+
+    def classify_batch(self, transactions):
+        return [self.classify(transaction.description, transaction.amount_cents, transaction.transaction_type)
+                for transaction in transactions]
+
+    def suggest(self, description, amount_cents, transaction_type):
+        # As classify, but a half-typed merchant name is completed from the known ones
+        category_id = self.classify(description, amount_cents, transaction_type)
+        if category_id is None:
+            category_id = self.model.complete(normalize_description(description), transaction_type)
+        return category_id
+
+    def learn(self, description, transaction_type, category_id):
+        self.model.learn(description, transaction_type, category_id)
+        self.predictions.clear()
+
+
+def load_rules(bind):
+    rows = bind.execute(select(
+        CategoryRule.category_id,
+        CategoryRule.transaction_type,
+        CategoryRule.kind,
+        CategoryRule.pattern,
+        CategoryRule.amount_min_cents,
+        CategoryRule.amount_max_cents
+    ).order_by(CategoryRule.priority, CategoryRule.id))
+    return [Rule(*row) for row in rows]
+
+
+def fallback_category_ids(bind):
+    return [category_id for category_id, in bind.execute(select(Category.id).where(or_(*(
+        and_(Category.category_type == category_type, Category.name == name)
+        for category_type, name in FALLBACK_CATEGORIES.items()))))]
+
+
+def load_history(bind, limit=HISTORY_LIMIT):
+    # The fallback categories are left out: they mean "nobody knew", not a choice worth repeating
+    query = select(Transaction.description, Transaction.transaction_type, Transaction.category_id).where(
+        Transaction.category_id.is_not(None)
+    ).order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit)
+    ignored = fallback_category_ids(bind)
+    if ignored:
+        query = query.where(Transaction.category_id.not_in(ignored))
+    return bind.execute(query)
+
+
+def load_classifier(bind):
+    return Classifier(load_rules(bind), FrequencyModel.train(load_history(bind)))
+
+
+def reclassify(engine, batch_size=RECLASSIFY_BATCH_SIZE):
+    # Moves transactions out of the fallback categories wherever the rules or the history
+    # now know better; summaries are adjusted in the same transaction. The rows are read
+    # under the write lock (and locked on PostgreSQL), so an instance doing the same cannot
+    # move them, and their summaries, a second time
+    moved = 0
+    with write_transaction(engine) as connection:
+        classifier = load_classifier(connection)
+        rows = connection.execute(select(
+            Transaction.id,
+            Transaction.date,
+            Transaction.amount_cents,
+            Transaction.category_id,
+            Transaction.transaction_type,
+            Transaction.description
+        ).where(Transaction.category_id.in_(fallback_category_ids(connection))).with_for_update()).all()
+
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            changes = [(row, category_id) for row, category_id in zip(batch, classifier.classify_batch(batch))
+                       if category_id is not None and category_id != row.category_id]
+            if not changes:
+                continue
+            connection.execute(
+                update(Transaction).where(Transaction.id == bindparam('transaction_id')).values(
+                    category_id=bindparam('new_category_id')),
+                [{'transaction_id': row.id, 'new_category_id': category_id} for row, category_id in changes]
+            )
+            apply_summary_deltas(connection, summary_deltas([row for row, _ in changes], -1))
+            apply_summary_deltas(connection, summary_deltas([
+                MovedTransaction(row.date, row.amount_cents, category_id, row.transaction_type)
+                for row, category_id in changes
+            ]))
+            moved += len(changes)
+        if moved:
+            bump_version(connection)
+    return moved
+
+
+def describe_amounts(rule):
+    if rule.amount_min_cents is None and rule.amount_max_cents is None:
+        return ''
+    return ' – '.join(format_cents(value) if value is not None else '…'
+                      for value in (rule.amount_min_cents, rule.amount_max_cents))
+
+
+def add_rule_from_command_line(engine, args):
+    session = sessionmaker(bind=engine)()
+    try:
+        category = session.query(Category).filter_by(name=args.category, category_type=args.type).first()
+        if category is None:
+            print(f"Nežinoma kategorija „{args.category}“", file=sys.stderr)
+            return 1
+        try:
+            rule = CategoryRule(
+                category_id=category.id,
+                transaction_type=category.category_type,
+                kind='regex' if args.regex else 'keyword',
+                pattern=args.pattern or None,
+                amount_min_cents=to_cents(args.min) if args.min else None,
+                amount_max_cents=to_cents(args.max) if args.max else None,
+                priority=args.priority
+            )
+            validate_rule(rule)
+        except ValueError as e:
+            print(f"Netinkama taisyklė: {e}", file=sys.stderr)
+            return 1
+        session.add(rule)
+        bump_version(session)
+        session.commit()
+        return 0
+    finally:
+        session.close()
+
+
+def print_rules(engine):
+    with engine.connect() as connection:
+        names = dict(connection.execute(select(Category.id, Category.name)).all())
+        for rule in load_rules(connection):
+            print(f"{names.get(rule.category_id, '?'):<20} {RULE_KINDS[rule.kind]:<22} {rule.pattern or '':<30} "
+                  f"{describe_amounts(rule)}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Operacijų kategorizavimas pagal aprašymą")
+    parser.add_argument('--db', default=DATABASE_URL, help="duomenų bazės adresas")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rules', help="išvardyti kategorizavimo taisykles")
+    rule_parser = subparsers.add_parser('add-rule', help="pridėti kategorizavimo taisyklę")
+    rule_parser.add_argument('category', help="kategorijos pavadinimas")
+    rule_parser.add_argument('pattern', nargs='?', help="raktažodis (arba išraiška su --regex)")
+    rule_parser.add_argument('--type', choices=['expense', 'income'], default='expense')
+    rule_parser.add_argument('--regex', action='store_true', help="šablonas yra reguliarioji išraiška")
+    rule_parser.add_argument('--min', help="mažiausia suma")
+    rule_parser.add_argument('--max', help="didžiausia suma")
+    rule_parser.add_argument('--priority', type=int, default=0, help="mažesnis skaičius tikrinamas anksčiau")
+    subparsers.add_parser('reclassify', help="perkategorizuoti operacijas iš atsarginių kategorijų")
+    args = parser.parse_args(argv)
+
+    engine = create_database_engine(args.db)
+    upgrade_schema(engine)
+    try:
+        if args.command == 'rules':
+            return print_rules(engine)
+        if args.command == 'add-rule':
+            return add_rule_from_command_line(engine, args)
+        started = time.perf_counter()
+        moved = reclassify(engine)
+        print(f"Perkategorizuota operacijų: {moved} per {time.perf_counter() - started:.1f} s", file=sys.stderr)
+        return 0
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
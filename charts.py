@@ -0,0 +1,144 @@
+import tkinter as tk
+from collections import namedtuple
+
+from money import to_units
+
+Report = namedtuple('Report', ['title', 'labels', 'values', 'color', 'xlabel', 'ylabel', 'rotation'])
+
+
+def empty_report(title):
+    return Report(title, [], [], 'gray', '', '', 0)
+
+
+# Presentation of each report: title, message when it has no data, colour and axes
+REPORT_STYLES = {
+    'expenses_by_category': ('Išlaidų pasiskirstymas pagal kategorijas', 'Nėra išlaidų duomenų',
+                             'red', 'Suma', '', 0),
+    'income_by_category': ('Pajamų pasiskirstymas pagal kategorijas', 'Nėra pajamų duomenų',
+                           'green', 'Suma', '', 0),
+    'monthly_expenses': ('Mėnesinės išlaidos', 'Nėra išlaidų duomenų', 'red', '', 'Suma', 45),
+    'monthly_income': ('Mėnesinės pajamos', 'Nėra pajamų duomenų', 'green', '', 'Suma', 45),
+    'balance': ('Mėnesinis balansas (Pajamos - Išlaidos)', 'Nėra duomenų balansui skaičiuoti',
+                'blue', '', 'Suma', 45),
+    'cumulative_balance': ('Sukauptas balansas', 'Nėra duomenų balansui skaičiuoti', 'blue', '', 'Suma', 45),
+    'moving_average_3': ('Vidutinės išlaidos per mėnesį (paskutiniai 3 užbaigti mėn.)',
+                         'Nėra išlaidų duomenų', 'orange', 'Suma', '', 0),
+    'moving_average_12': ('Vidutinės išlaidos per mėnesį (paskutiniai 12 užbaigti mėn.)',
+                          'Nėra išlaidų duomenų', 'orange', 'Suma', '', 0),
+    'year_over_year': ('Išlaidų pokytis, palyginti su praėjusiais metais', 'Nėra kelių metų duomenų',
+                       'purple', '', 'Suma', 0),
+}
+
+
+def import_backend():
+    # matplotlib is the slowest import of the app, so it is loaded on first chart use;
+    # the chart job calls this on the worker thread, leaving the Tk thread a cache hit
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from matplotlib.figure import Figure
+    return Figure, FigureCanvasTkAgg
+
+
+def chart_report(totals, report_type):
+    # Totals come from the report service in integer cents; only the bar heights are converted
+    title, empty_title, color, xlabel, ylabel, rotation = REPORT_STYLES[report_type]
+    if totals.empty:
+        return empty_report(empty_title)
+    return Report(title, [str(label) for label in totals.index], to_units(totals).tolist(),
+                  color, xlabel, ylabel, rotation)
+
+
+class ReportChart:
+    # One figure, axes and Tk canvas for the lifetime of the window. Bars are animated
+    # artists: when only their heights change they are blitted over the saved axes
+    # background, and finished frames are kept per report key for instant switching back.
+    def __init__(self, master):
+        Figure, FigureCanvasTkAgg = import_backend()
+        self.figure = Figure(figsize=(8, 4), dpi=100)
+        self.ax = self.figure.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.mpl_connect('resize_event', self.on_resize)
+
+        self.bars = []
+        self.labels = []
+        self.background = None
+        self.current_key = None
+        self.rendered = {}
+        self.pending_report = None
+
+    def show(self, report, key):
+        self.current_key = key
+
+        cached = self.rendered.get(key)
+        if cached is not None and cached[0] == self.canvas_size():
+            # The artists are only brought up to date before the next real draw
+            self.pending_report = report
+            _, frame, self.background = cached
+            self.canvas.restore_region(frame)
+            self.canvas.blit(self.figure.bbox)
+            return
+
+        self.apply_pending()
+        layout_changed = self.update_artists(report)
+        if not layout_changed and self.background is not None:
+            self.canvas.restore_region(self.background)
+            self.draw_bars()
+            self.canvas.blit(self.ax.bbox)
+            self.remember_frame()
+        else:
+            self.canvas.draw()
+
+    def update_artists(self, report):
+        previous = (self.labels, self.ax.get_title(), self.ax.get_ylim())
+
+        if report.labels == self.labels:
+            for bar, value in zip(self.bars, report.values):
+                bar.set_height(value)
+                bar.set_color(report.color)
+        else:
+            for bar in self.bars:
+                bar.remove()
+            positions = range(len(report.values))
+            self.bars = list(self.ax.bar(positions, report.values, width=0.5, color=report.color, animated=True))
+            self.ax.set_xticks(positions)
+            self.ax.set_xticklabels(report.labels, rotation=report.rotation)
+            self.labels = list(report.labels)
+
+        self.ax.set_title(report.title, fontweight='bold' if report.labels else 'normal')
+        self.ax.set_xlabel(report.xlabel, fontweight='bold')
+        self.ax.set_ylabel(report.ylabel, fontweight='bold')
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+        return previous != (self.labels, self.ax.get_title(), self.ax.get_ylim())
+
+    def apply_pending(self):
+        if self.pending_report is None:
+            return False
+        report, self.pending_report = self.pending_report, None
+        return self.update_artists(report)
+
+    def on_resize(self, event):
+        self.apply_pending()
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_bars()
+        self.remember_frame()
+
+    def draw_bars(self):
+        for bar in self.bars:
+            self.ax.draw_artist(bar)
+
+    def remember_frame(self):
+        if self.current_key is not None:
+            self.rendered[self.current_key] = (self.canvas_size(),
+                                               self.canvas.copy_from_bbox(self.figure.bbox),
+                                               self.background)
+
+    def canvas_size(self):
+        return tuple(self.figure.bbox.size)
+
+    def invalidate(self):
+        self.rendered.clear()
@@ -0,0 +1,124 @@
+import functools
+
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from diagnostics import TimedConnection
+from models import LedgerState
+
+# A writer waits this long for another instance to release the SQLite write lock
+BUSY_TIMEOUT_MS = 5000
+# Server databases: connections shared by the Tk thread, the background worker and imports
+POOL_SIZE = 5
+MAX_OVERFLOW = 5
+POOL_RECYCLE_S = 1800
+
+
+def unicode_lower(value):
+    # Folds case as PostgreSQL's lower() and the trigram search index do, so that a search
+    # finds 'švyturys' in 'ŠVYTURYS' whether it goes through the index or LIKE
+    return value.lower() if isinstance(value, str) else value
+
+
+def create_database_engine(url):
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite':
+        # Pre-ping replaces connections the server dropped while the app sat idle
+        return create_engine(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_pre_ping=True,
+                             pool_recycle=POOL_RECYCLE_S)
+
+    # Cursors that time and count fetched rows; see diagnostics.TimedCursor. pysqlite's own
+    # transaction handling is switched off: it only opens a transaction before DML, so DDL and
+    # SELECTs ran in autocommit, and a read followed by a write saw two different snapshots
+    engine = create_engine(url, connect_args={'factory': TimedConnection, 'isolation_level': None})
+    in_memory = url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        # Every SQLAlchemy transaction is a real one, DROP TRIGGER and the first SELECT included.
+        # See write_transaction for IMMEDIATE
+        immediate = connection.get_execution_options().get('immediate_transaction', False)
+        connection.exec_driver_sql('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+
+    @event.listens_for(engine, 'connect')
+    def configure(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            # Readers in other instances keep working while one of them writes
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        # Concurrent writers queue for the lock instead of failing with "database is locked"
+        cursor.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        cursor.close()
+        # SQLite's own lower() and LIKE fold ASCII only; see unicode_lower
+        dbapi_connection.create_function('lower', 1, unicode_lower, deterministic=True)
+
+    return engine
+
+
+def write_transaction(engine):
+    # For bulk writers that read before they write. A deferred SQLite transaction cannot take
+    # the write lock once another instance has committed since its first read, so the lock is
+    # taken (waiting out busy_timeout) at BEGIN. Other databases ignore the option.
+    return engine.execution_options(immediate_transaction=True).begin()
+
+
+def session_registry(engine):
+    # Objects stay readable after commit, since their session is closed right after
+    return scoped_session(sessionmaker(bind=engine, expire_on_commit=False))
+
+
+def operation(method):
+    # For objects whose self.session is a scoped_session: each call gets a session of its
+    # own and closes it when done, returning the connection to the pool, so no transaction
+    # outlives a click and the next call sees what other instances committed. Nested calls
+    # share the outer session; a plain Session (a worker job's) is left to its owner.
+    @functools.wraps(method)
+    def run(self, *args, **kwargs):
+        owner = isinstance(self.session, scoped_session) and not self.session.registry.has()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            if owner:
+                self.session.remove()
+    return run
+
+
+def write_operation(method):
+    # operation() for methods that write. The write lock is taken at BEGIN, as in
+    # write_transaction: the first insert into transactions already reads (the search index
+    # trigger does), and a deferred transaction that read first fails at once with "database is
+    # locked" instead of waiting out busy_timeout. A session already in a transaction (a nested
+    # call, a worker job's) keeps the one it has.
+    @operation
+    @functools.wraps(method)
+    def run(self, *args, **kwargs):
+        if not self.session.in_transaction():
+            self.session.connection(execution_options={'immediate_transaction': True})
+        return method(self, *args, **kwargs)
+    return run
+
+
+def dialect_name(bind):
+    # bind is a Core Connection or an ORM session, scoped or not
+    return bind.dialect.name if isinstance(bind, Connection) else bind.get_bind().dialect.name
+
+
+def upsert(bind, table):
+    # INSERT ... ON CONFLICT has the same interface in both dialects
+    dialect = postgresql if dialect_name(bind) == 'postgresql' else sqlite
+    return dialect.insert(table)
+
+
+def current_version(bind):
+    return bind.execute(select(LedgerState.version).where(LedgerState.id == 1)).scalar_one()
+
+
+def bump_version(bind):
+    # Runs inside the writer's transaction, so the counter moves exactly when the data does
+    return bind.execute(
+        update(LedgerState).where(LedgerState.id == 1)
+        .values(version=LedgerState.version + 1).returning(LedgerState.version)
+    ).scalar_one()
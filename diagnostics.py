@@ -0,0 +1,338 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Queries at least this slow are logged and kept in the slow query list
+SLOW_QUERY_MS = float(os.environ.get('FINANCE_TRACKER_SLOW_QUERY_MS', 100))
+# Upper bounds of the histogram buckets in ms; one more bucket holds everything slower
+BUCKET_BOUNDS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+SLOW_QUERY_LOG = 100
+
+# "IN (?, ?, ?)" of any length, in qmark (SQLite) or pyformat (psycopg2) style
+PLACEHOLDER_LIST = re.compile(r'\((?:\?|%\(\w+\)s)(?:, (?:\?|%\(\w+\)s))+\)')
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(statement):
+    # Expanded IN lists would otherwise make a separate entry for every list length
+    return PLACEHOLDER_LIST.sub('(?…)', ' '.join(statement.split()))
+
+
+class Histogram:
+    # Fixed logarithmic buckets: recording is a bisect and an increment, and percentiles
+    # are read off the bucket bounds (at most one bucket too high)
+    __slots__ = ('buckets', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, ms):
+        self.buckets[bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.maximum:
+            self.maximum = ms
+
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS_MS + (self.maximum,), self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total,
+            'mean_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': self.maximum,
+            'buckets': {f"<={bound}" if index < len(BUCKET_BOUNDS_MS) else f">{BUCKET_BOUNDS_MS[-1]}": count
+                        for index, (bound, count) in enumerate(zip(BUCKET_BOUNDS_MS + (None,), self.buckets))
+                        if count},
+        }
+
+
+class Phase:
+    __slots__ = ('name', 'sql_ms', 'queries')
+
+    def __init__(self, name):
+        self.name = name
+        self.sql_ms = 0.0
+        self.queries = 0
+
+
+class QueryTiming:
+    __slots__ = ('metrics', 'statement', 'phases', 'started', 'elapsed_ms', 'rows')
+
+    def __init__(self, metrics, statement, phases):
+        self.metrics = metrics
+        self.statement = statement
+        self.phases = phases
+        self.started = 0.0
+        self.elapsed_ms = 0.0
+        self.rows = None
+
+    def finish(self):
+        self.metrics.record_query(self)
+
+
+class StatementStats:
+    __slots__ = ('histogram', 'rows')
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.rows = 0
+
+
+class Metrics:
+    # Process-wide and thread-safe: phases run on the Tk thread, the background worker and
+    # import threads. SQL executed inside a phase is also added to it and recorded as
+    # "<phase>.sql", so a phase's own work (pandas, drawing, Treeview) is the difference.
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.slow_query_ms = slow_query_ms
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = datetime.now()
+            self.phases = {}
+            self.counters = Counter()
+            self.statements = {}
+            self.slow_queries = deque(maxlen=SLOW_QUERY_LOG)
+
+    def record(self, name, ms):
+        with self.lock:
+            histogram = self.phases.get(name)
+            if histogram is None:
+                histogram = self.phases[name] = Histogram()
+            histogram.record(ms)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def active_phases(self):
+        stack = getattr(self.local, 'phases', None)
+        return tuple(stack) if stack else ()
+
+    @contextmanager
+    def phase(self, name):
+        stack = self.local.__dict__.setdefault('phases', [])
+        current = Phase(name)
+        stack.append(current)
+        started = time.perf_counter()
+        try:
+            yield current
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            stack.pop()
+            self.record(name, elapsed)
+            if current.queries:
+                self.record(f"{name}.sql", current.sql_ms)
+
+    def record_query(self, query):
+        for phase in query.phases:
+            phase.sql_ms += query.elapsed_ms
+            phase.queries += 1
+        statement = normalize_statement(query.statement)
+        slow = query.elapsed_ms >= self.slow_query_ms
+        with self.lock:
+            stats = self.statements.get(statement)
+            if stats is None:
+                stats = self.statements[statement] = StatementStats()
+            stats.histogram.record(query.elapsed_ms)
+            stats.rows += query.rows or 0
+            if slow:
+                self.slow_queries.append({
+                    'time': datetime.now().isoformat(timespec='seconds'),
+                    'ms': query.elapsed_ms,
+                    'rows': query.rows,
+                    'phase': query.phases[-1].name if query.phases else None,
+                    'statement': statement,
+                })
+        if slow:
+            logger.warning("Lėta užklausa: %.1f ms, eilučių %s: %s", query.elapsed_ms,
+                           query.rows if query.rows is not None else '?', statement)
+
+    def snapshot(self):
+        with self.lock:
+            queries = [{'statement': statement, 'rows': stats.rows, **stats.histogram.as_dict()}
+                       for statement, stats in self.statements.items()]
+            return {
+                'started': self.started.isoformat(timespec='seconds'),
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'slow_query_ms': self.slow_query_ms,
+                'phases': {name: histogram.as_dict() for name, histogram in sorted(self.phases.items())},
+                'counters': dict(sorted(self.counters.items())),
+                'queries': sorted(queries, key=lambda query: query['total_ms'], reverse=True),
+                'slow_queries': list(self.slow_queries),
+            }
+
+    def export_json(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.snapshot(), file, ensure_ascii=False, indent=2)
+
+
+metrics = Metrics()
+
+
+class TimedCursor(sqlite3.Cursor):
+    # SQLite runs a SELECT lazily: execute() stops at the first row and the rest of the work
+    # happens while rows are fetched. Fetches are therefore timed and counted here, and the
+    # query is recorded when SQLAlchemy closes the cursor.
+    query = None
+
+    def fetched(self, started, rows):
+        if self.query is not None:
+            self.query.elapsed_ms += (time.perf_counter() - started) * 1000
+            self.query.rows = (self.query.rows or 0) + rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(started, len(rows))
+        return rows
+
+    def close(self):
+        if self.query is not None:
+            query, self.query = self.query, None
+            query.finish()
+        super().close()
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+
+def instrument_engine(engine, target=metrics):
+    # Statement timing through the engine's cursor events; the DBAPI connection holds the
+    # query in flight, since one connection runs one statement at a time
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        query = QueryTiming(target, statement, target.active_phases())
+        conn.info['diagnostics_query'] = query
+        if isinstance(cursor, TimedCursor):
+            cursor.query = query
+        query.started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        query = conn.info.pop('diagnostics_query', None)
+        if query is None:
+            return
+        query.elapsed_ms += (time.perf_counter() - query.started) * 1000
+        if cursor.rowcount >= 0:
+            query.rows = cursor.rowcount
+        # Statements without a result (and every statement on drivers that fetch eagerly)
+        # are complete here; SQLite SELECTs finish when their cursor is closed
+        if not isinstance(cursor, TimedCursor) or cursor.description is None:
+            if isinstance(cursor, TimedCursor):
+                cursor.query = None
+            query.finish()
+
+    @event.listens_for(engine, 'handle_error')
+    def discard_failed(context):
+        if context.connection is not None:
+            context.connection.info.pop('diagnostics_query', None)
+        if isinstance(context.cursor, TimedCursor):
+            context.cursor.query = None
+
+    return engine
+
+
+class Profiler:
+    # cProfile follows only the thread that enabled it (before Python 3.12), so the Tk thread
+    # and each worker thread get a profile of their own and the dump merges them. Worker
+    # profiles are only enabled while a job runs, leaving idle waiting out.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.profiles = {}
+        self.main_profile = None
+
+    def enable(self):
+        thread = threading.get_ident()
+        with self.lock:
+            profile = self.profiles.get(thread)
+            if profile is None:
+                profile = self.profiles[thread] = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+: only one profiler may be active, and it already sees every thread
+            return None
+        return profile
+
+    def start(self):
+        with self.lock:
+            self.profiles = {}
+        self.active = True
+        self.main_profile = self.enable()
+
+    def stop(self):
+        self.active = False
+        if self.main_profile is not None:
+            self.main_profile.disable()
+            self.main_profile = None
+
+    @contextmanager
+    def thread_profile(self):
+        profile = self.enable() if self.active else None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+
+    def dump(self, path):
+        with self.lock:
+            profiles = list(self.profiles.values())
+        stats = None
+        for profile in profiles:
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if stats is None or not stats.stats:
+            raise ValueError("profilis tuščias")
+        stats.dump_stats(path)
+
+
+profiler = Profiler()
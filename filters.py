@@ -0,0 +1,133 @@
+import calendar
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import column, func, select, table
+
+from models import Transaction
+
+# FTS5 trigram tokens are three characters long; shorter terms fall back to LIKE on the
+# lowercased description, which folds case the same way (see database.unicode_lower)
+MIN_SEARCH_TERM = 3
+# A term matching at least this many rows is cheaper to check with LIKE while walking
+# the (date, id) index than to collect and sort every match from the FTS index
+SELECTIVE_SEARCH_LIMIT = 2000
+
+SearchMatch = namedtuple('SearchMatch', ['ids', 'terms'])
+
+TransactionFilter = namedtuple(
+    'TransactionFilter',
+    ['date_from', 'date_to', 'amount_min', 'amount_max', 'categories', 'transaction_type', 'search'],
+    defaults=[None, None, None, None, (), '', '']
+)
+
+search_index = table('transactions_fts', column('rowid'), column('description'))
+
+# The index itself and its other triggers are made by migrations; bulk writers drop this
+# one and recreate it (see deferred_search_indexing)
+SEARCH_INSERT_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN "
+    "INSERT INTO transactions_fts(rowid, description) VALUES (new.id, new.description); END"
+)
+
+
+def has_search_index(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'transactions_fts_insert'").first() is not None
+
+
+@contextmanager
+def deferred_search_indexing(connection):
+    # Per-row trigger inserts into the trigram index are far slower than a single
+    # INSERT ... SELECT, so bulk writers index their new rows once at the end.
+    # The trigger is also recreated when the writer fails: SQLite connections from
+    # database.create_database_engine roll the DROP back with the rest, but other engines
+    # would leave the index silently missing every later insert.
+    if not has_search_index(connection):
+        yield
+        return
+
+    last_id = connection.execute(select(func.max(Transaction.id))).scalar() or 0
+    connection.exec_driver_sql("DROP TRIGGER transactions_fts_insert")
+    try:
+        yield
+        connection.exec_driver_sql(
+            "INSERT INTO transactions_fts(rowid, description) SELECT id, description FROM transactions WHERE id > ?",
+            (last_id,))
+    finally:
+        connection.exec_driver_sql(SEARCH_INSERT_TRIGGER)
+
+
+def month_range(month):
+    year, month_num = map(int, month.split('-'))
+    return date(year, month_num, 1), date(year, month_num, calendar.monthrange(year, month_num)[1])
+
+
+def search_terms(text):
+    return [term for term in text.split() if term]
+
+
+def indexed_terms(terms):
+    return [term for term in terms if len(term) >= MIN_SEARCH_TERM]
+
+
+def fts_query(terms):
+    return ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search_matches(terms):
+    return select(search_index.c.rowid).where(search_index.c.description.op('MATCH')(fts_query(terms)))
+
+
+def find_search_match(session, terms):
+    # Each term is probed separately: rare terms resolve to an id list through FTS,
+    # frequent ones are left to LIKE so the query can stop after the first page
+    if session.bind.dialect.name != 'sqlite':
+        return None
+
+    ids, matched_terms = None, []
+    for term in indexed_terms(terms):
+        found = session.execute(search_matches([term]).limit(SELECTIVE_SEARCH_LIMIT)).scalars().all()
+        if len(found) < SELECTIVE_SEARCH_LIMIT:
+            ids = set(found) if ids is None else ids & set(found)
+            matched_terms.append(term)
+    return SearchMatch(sorted(ids), matched_terms) if matched_terms else None
+
+
+def build_criteria(session, transaction_filter):
+    return filter_criteria(transaction_filter, find_search_match(session, search_terms(transaction_filter.search)))
+
+
+def filter_criteria(transaction_filter, search_match=None):
+    criteria = []
+
+    if transaction_filter.date_from is not None:
+        criteria.append(Transaction.date >= transaction_filter.date_from)
+    if transaction_filter.date_to is not None:
+        criteria.append(Transaction.date <= transaction_filter.date_to)
+
+    if transaction_filter.amount_min is not None:
+        criteria.append(Transaction.amount_cents >= transaction_filter.amount_min)
+    if transaction_filter.amount_max is not None:
+        criteria.append(Transaction.amount_cents <= transaction_filter.amount_max)
+
+    if len(transaction_filter.categories) == 1:
+        criteria.append(Transaction.category_id == transaction_filter.categories[0])
+    elif transaction_filter.categories:
+        criteria.append(Transaction.category_id.in_(transaction_filter.categories))
+
+    if transaction_filter.transaction_type:
+        criteria.append(Transaction.transaction_type == transaction_filter.transaction_type)
+
+    matched_terms = []
+    if search_match is not None:
+        criteria.append(Transaction.id.in_(search_match.ids))
+        matched_terms = search_match.terms
+    for term in search_terms(transaction_filter.search):
+        if term not in matched_terms:
+            criteria.append(Transaction.description.icontains(term, autoescape=True))
+
+    return criteria
@@ -0,0 +1,233 @@
+import csv
+import os
+import re
+from collections import namedtuple
+from datetime import date, datetime
+from itertools import chain, islice
+
+from sqlalchemy import insert, select
+
+from categorizer import FALLBACK_CATEGORIES, load_classifier
+from database import bump_version, write_transaction
+from filters import deferred_search_indexing
+from models import Transaction, Category
+from money import to_cents
+from summaries import apply_summary_deltas, summary_deltas
+
+# Rows per committed batch: the write lock is held for one batch, far below database.BUSY_TIMEOUT_MS
+BATCH_SIZE = 10_000
+# Page cache for the import connection, in KiB; keeps the index B-trees in memory during large imports
+IMPORT_CACHE_KIB = 200_000
+
+CSV_COLUMNS = {
+    'date': ('date', 'data', 'operacijos data'),
+    'amount': ('amount', 'suma'),
+    'description': ('description', 'aprašymas', 'paskirtis', 'mokėjimo paskirtis'),
+    'category': ('category', 'kategorija'),
+    'transaction_type': ('type', 'transaction_type', 'tipas')
+}
+
+TRANSACTION_TYPES = {
+    'income': 'income',
+    'pajamos': 'income',
+    'credit': 'income',
+    'expense': 'expense',
+    'išlaidos': 'expense',
+    'debit': 'expense'
+}
+
+DATE_FORMATS = ('%Y.%m.%d', '%d.%m.%Y', '%Y/%m/%d', '%d/%m/%Y')
+
+OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)')
+
+ParsedTransaction = namedtuple('ParsedTransaction',
+                               ['date', 'amount_cents', 'category', 'transaction_type', 'description'])
+ImportedTransaction = namedtuple('ImportedTransaction',
+                                 ['date', 'amount_cents', 'category_id', 'transaction_type', 'description'])
+
+
+class ImportProgress:
+    def __init__(self, path):
+        self.total_bytes = os.path.getsize(path) or 1
+        self.bytes_read = 0
+
+    @property
+    def fraction(self):
+        return min(self.bytes_read / self.total_bytes, 1.0)
+
+
+def detect_format(path):
+    return 'ofx' if os.path.splitext(path)[1].lower() in ('.ofx', '.qfx') else 'csv'
+
+
+def read_lines(path, progress, encoding='utf-8'):
+    with open(path, 'rb') as f:
+        for number, line in enumerate(f):
+            progress.bytes_read += len(line)
+            text = line.decode(encoding)
+            yield text.lstrip('\ufeff') if number == 0 else text
+
+
+def parse_date(value):
+    value = value.strip()
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"neatpažinta data '{value}'")
+
+
+def parse_csv(lines):
+    header_line = next(lines, None)
+    if header_line is None:
+        return
+    try:
+        dialect = csv.Sniffer().sniff(header_line, delimiters=',;\t')
+    except csv.Error:
+        # Single-column or non-CSV files have no delimiter to detect
+        raise ValueError("nepavyko atpažinti CSV failo skirtuko") from None
+    reader = csv.reader(chain([header_line], lines), dialect)
+
+    header = [name.strip().lower() for name in next(reader)]
+    positions = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in header:
+                positions[field] = header.index(alias)
+                break
+    missing = [field for field in ('date', 'amount') if field not in positions]
+    if missing:
+        raise ValueError(f"CSV faile trūksta stulpelių: {', '.join(missing)}")
+
+    try:
+        for record in reader:
+            if not record:
+                continue
+            yield {field: record[position] for field, position in positions.items() if position < len(record)}
+    except csv.Error as e:
+        raise ValueError(f"neteisinga CSV eilutė {reader.line_num}: {e}") from None
+
+
+def parse_ofx(lines):
+    # Handles both SGML (OFX 1.x, unclosed tags) and XML (OFX 2.x) statements
+    current = None
+    for line in lines:
+        for closing, tag, value in OFX_TAG.findall(line):
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield {
+                        'date': current.get('DTPOSTED', '')[:8],
+                        'amount': current.get('TRNAMT', ''),
+                        'description': ' '.join(filter(None, (current.get('NAME'), current.get('MEMO'))))
+                    }
+                current = None if closing else {}
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+
+def normalize(records):
+    for number, record in enumerate(records, start=1):
+        try:
+            raw_date = record['date']
+            transaction_date = (datetime.strptime(raw_date, '%Y%m%d').date() if raw_date.isdigit()
+                                else parse_date(raw_date))
+            amount = to_cents(record['amount'])
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"Įrašas {number}: {e}") from e
+
+        transaction_type = TRANSACTION_TYPES.get(record.get('transaction_type', '').strip().lower())
+        if transaction_type is None:
+            transaction_type = 'expense' if amount < 0 else 'income'
+
+        yield ParsedTransaction(
+            transaction_date,
+            abs(amount),
+            record.get('category', '').strip(),
+            transaction_type,
+            record.get('description', '').strip()
+        )
+
+
+def categorize(transactions, categories, classifier=None):
+    # A category named in the statement wins; otherwise the description is classified by the
+    # user's rules and the ledger's history, and only what neither knows goes to the fallback
+    fallbacks = {category_type: categories[(category_type, name.lower())]
+                 for category_type, name in FALLBACK_CATEGORIES.items()}
+    for transaction in transactions:
+        category_id = categories.get((transaction.transaction_type, transaction.category.lower()))
+        if category_id is None and classifier is not None:
+            category_id = classifier.classify(transaction.description, transaction.amount_cents,
+                                              transaction.transaction_type)
+        if category_id is None:
+            category_id = fallbacks[transaction.transaction_type]
+        yield ImportedTransaction(*transaction._replace(category=category_id))
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def load_categories(connection):
+    existing = {(category_type, name) for name, category_type in
+                connection.execute(select(Category.name, Category.category_type))}
+    missing = [{'name': name, 'category_type': category_type}
+               for category_type, name in FALLBACK_CATEGORIES.items() if (category_type, name) not in existing]
+    if missing:
+        connection.execute(insert(Category), missing)
+    # Ordered by id so that of two categories differing only in case the older one wins
+    rows = connection.execute(select(Category.id, Category.name, Category.category_type).order_by(Category.id.desc()))
+    return {(category_type, name.lower()): category_id for category_id, name, category_type in rows}
+
+
+def read_statement(path, file_format, tracker):
+    lines = read_lines(path, tracker)
+    return normalize(parse_ofx(lines) if file_format == 'ofx' else parse_csv(lines))
+
+
+def import_statement(engine, path, file_format=None, progress=None, batch_size=BATCH_SIZE):
+    file_format = file_format or detect_format(path)
+
+    # The statement is read through once before anything is written, so a malformed row
+    # leaves the database untouched without holding the write lock while the file is parsed
+    tracker = ImportProgress(path)
+    for number, _ in enumerate(read_statement(path, file_format, tracker), start=1):
+        if progress is not None and number % batch_size == 0:
+            progress(tracker.fraction / 2, 0)
+
+    with write_transaction(engine) as connection:
+        categories = load_categories(connection)
+    with engine.connect() as connection:
+        classifier = load_classifier(connection)
+
+    tracker = ImportProgress(path)
+    imported = 0
+    for batch in batches(categorize(read_statement(path, file_format, tracker), categories, classifier), batch_size):
+        # Each batch commits on its own, so writers in other instances wait for one batch
+        # rather than the whole file, well within their busy timeout
+        with write_transaction(engine) as connection, deferred_search_indexing(connection):
+            if engine.dialect.name == 'sqlite':
+                connection.exec_driver_sql(f'PRAGMA cache_size=-{IMPORT_CACHE_KIB}')
+            # Date-ordered batches touch neighbouring index pages instead of random ones
+            batch.sort(key=lambda transaction: transaction.date)
+            connection.execute(insert(Transaction), [transaction._asdict() for transaction in batch])
+            apply_summary_deltas(connection, summary_deltas(batch))
+            bump_version(connection)
+        imported += len(batch)
+        if progress is not None:
+            progress(0.5 + tracker.fraction / 2, imported)
+
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            connection.exec_driver_sql('PRAGMA optimize')
+
+    return imported
@@ -0,0 +1,53 @@
+import json
+import os
+import re
+
+from models import DATABASE_URL
+
+# Each ledger (a household or an entity) is a database of its own; this file maps ledger
+# names to database URLs. The same ledger may be open in several instances at once.
+LEDGERS_PATH = os.environ.get('FINANCE_TRACKER_LEDGERS', 'ledgers.json')
+DEFAULT_LEDGER = 'Pagrindinė'
+
+
+def load_ledgers(path=LEDGERS_PATH):
+    try:
+        with open(path, encoding='utf-8') as file:
+            ledgers = json.load(file)
+    except FileNotFoundError:
+        ledgers = {}
+    return ledgers or {DEFAULT_LEDGER: DATABASE_URL}
+
+
+def save_ledgers(ledgers, path=LEDGERS_PATH):
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump(ledgers, file, ensure_ascii=False, indent=2)
+    os.replace(temporary, path)
+
+
+def default_url(name):
+    slug = re.sub(r'\W+', '_', name.lower()).strip('_')
+    return f"sqlite:///finance_tracker_{slug}.db"
+
+
+def add_ledger(name, url=None, path=LEDGERS_PATH):
+    name = name.strip()
+    if not name:
+        raise ValueError("įveskite knygos pavadinimą")
+    ledgers = load_ledgers(path)
+    if name in ledgers:
+        raise ValueError(f"knyga „{name}“ jau yra")
+    ledgers[name] = url or default_url(name)
+    save_ledgers(ledgers, path)
+    return ledgers[name]
+
+
+def resolve_ledger(name=None, path=LEDGERS_PATH):
+    # Without a name the first ledger in the file is opened
+    ledgers = load_ledgers(path)
+    if name is None:
+        name = next(iter(ledgers))
+    if name not in ledgers:
+        raise ValueError(f"nežinoma knyga „{name}“")
+    return name, ledgers[name]
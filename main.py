@@ -1,476 +1,1968 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-from datetime import datetime
-import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-
-Base = declarative_base()
-
-
-class Transaction(Base):
-    __tablename__ = 'transactions'
-    id = Column(Integer, primary_key=True)
-    date = Column(Date)
-    amount = Column(Float)
-    category = Column(String)
-    transaction_type = Column(String)
-    description = Column(String)
-
-
-class Category(Base):
-    __tablename__ = 'categories'
-    id = Column(Integer, primary_key=True)
-    name = Column(String)
-    category_type = Column(String)
-
-
-class FinanceTracker:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Finansų sekiklis")
-        self.root.geometry("1200x1200")
-        self.engine = create_engine('sqlite:///finance_tracker.db')
-        Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
-        self.create_default_categories()
-        self.create_widgets()
-        self.update_data()
-
-    def create_default_categories(self):
-        if not self.session.query(Category).first():
-            default_categories = [
-                ('Maistas', 'expense'),
-                ('Transportas', 'expense'),
-                ('Mokesčiai', 'expense'),
-                ('Pramogos', 'expense'),
-                ('Būstas', 'expense'),
-                ('Atlyginimas', 'income'),
-                ('Verslas', 'income'),
-                ('Investicijos', 'income'),
-                ('Kitos pajamos', 'income')
-            ]
-
-            for name, cat_type in default_categories:
-                category = Category(name=name, category_type=cat_type)
-                self.session.add(category)
-
-            self.session.commit()
-
-    def create_widgets(self):
-        main_frame = ttk.Frame(self.root, padding="10")
-        main_frame.pack(fill=tk.BOTH, expand=True)
-
-        input_frame = ttk.LabelFrame(main_frame, text="Naujas įrašas", padding="10")
-        input_frame.pack(fill=tk.X, pady=5)
-
-        ttk.Label(input_frame, text="Tipas:").grid(row=0, column=0, sticky=tk.W)
-        self.transaction_type = tk.StringVar(value="expense")
-        ttk.Radiobutton(input_frame, text="Išlaidos", variable=self.transaction_type, value="expense").grid(row=0,
-                                                                                                            column=1,
-                                                                                                            sticky=tk.W)
-        ttk.Radiobutton(input_frame, text="Pajamos", variable=self.transaction_type, value="income").grid(row=0,
-                                                                                                          column=2,
-                                                                                                          sticky=tk.W)
-        self.transaction_type.trace_add('write', lambda *args: self.update_category_combobox())
-
-        ttk.Label(input_frame, text="Data:").grid(row=1, column=0, sticky=tk.W)
-        self.date_entry = ttk.Entry(input_frame)
-        self.date_entry.grid(row=1, column=1, padx=5, pady=2, sticky=tk.W)
-        self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
-
-        ttk.Label(input_frame, text="Suma:").grid(row=2, column=0, sticky=tk.W)
-        self.amount_entry = ttk.Entry(input_frame)
-        self.amount_entry.grid(row=2, column=1, padx=5, pady=2, sticky=tk.W)
-
-        ttk.Label(input_frame, text="Kategorija:").grid(row=3, column=0, sticky=tk.W)
-        self.category_combobox = ttk.Combobox(input_frame, state="readonly")
-        self.category_combobox.grid(row=3, column=1, padx=5, pady=2, sticky=tk.W)
-        self.update_category_combobox()
-
-        ttk.Label(input_frame, text="Aprašymas:").grid(row=4, column=0, sticky=tk.W)
-        self.description_entry = ttk.Entry(input_frame, width=40)
-        self.description_entry.grid(row=4, column=1, padx=5, pady=2, sticky=tk.W)
-
-        button_frame = ttk.Frame(input_frame)
-        button_frame.grid(row=5, column=0, columnspan=3, pady=10)
-
-        save_btn = ttk.Button(button_frame, text="Išsaugoti", command=self.save_transaction)
-        save_btn.pack(side=tk.LEFT, padx=5)
-
-        clear_btn = ttk.Button(button_frame, text="Išvalyti", command=self.clear_fields)
-        clear_btn.pack(side=tk.LEFT, padx=5)
-
-        manage_cat_btn = ttk.Button(button_frame, text="Valdyti kategorijas", command=self.manage_categories)
-        manage_cat_btn.pack(side=tk.LEFT, padx=5)
-
-        analysis_frame = ttk.LabelFrame(main_frame, text="Analizė", padding="10")
-        analysis_frame.pack(fill=tk.BOTH, expand=True, pady=5)
-
-        self.figure_frame = ttk.Frame(analysis_frame)
-        self.figure_frame.pack(fill=tk.BOTH, expand=True)
-
-        control_frame = ttk.Frame(analysis_frame)
-        control_frame.pack(fill=tk.X, pady=5)
-
-        ttk.Label(control_frame, text="Ataskaita:").pack(side=tk.LEFT)
-        self.report_type = tk.StringVar(value="expenses_by_category")
-        reports = [
-            ("Išlaidų kategorijos", "expenses_by_category"),
-            ("Pajamų kategorijos", "income_by_category"),
-            ("Mėnesio išlaidos", "monthly_expenses"),
-            ("Mėnesio pajamos", "monthly_income"),
-            ("Balansas", "balance")
-        ]
-
-        for text, value in reports:
-            ttk.Radiobutton(control_frame, text=text, variable=self.report_type,
-                            value=value, command=self.update_chart).pack(side=tk.LEFT, padx=5)
-
-        list_frame = ttk.LabelFrame(main_frame, text="Operacijos", padding="10")
-        list_frame.pack(fill=tk.BOTH, expand=True, pady=5)
-
-        self.tree = ttk.Treeview(list_frame, columns=("date", "type", "amount", "category", "description"),
-                                 show="headings")
-        self.tree.heading("date", text="Data")
-        self.tree.heading("type", text="Tipas")
-        self.tree.heading("amount", text="Suma")
-        self.tree.heading("category", text="Kategorija")
-        self.tree.heading("description", text="Aprašymas")
-        self.tree.column("date", width=100)
-        self.tree.column("type", width=80)
-        self.tree.column("amount", width=80)
-        self.tree.column("category", width=120)
-        self.tree.column("description", width=250)
-        self.tree.pack(fill=tk.BOTH, expand=True)
-
-        manage_frame = ttk.Frame(list_frame)
-        manage_frame.pack(fill=tk.X, pady=5)
-
-        delete_btn = ttk.Button(manage_frame, text="Ištrinti", command=self.delete_transaction)
-        delete_btn.pack(side=tk.LEFT, padx=5)
-
-        filter_frame = ttk.Frame(manage_frame)
-        filter_frame.pack(side=tk.RIGHT)
-
-        ttk.Label(filter_frame, text="Filtruoti:").pack(side=tk.LEFT)
-        self.filter_month = ttk.Combobox(filter_frame, values=self.get_months_list(), width=10)
-        self.filter_month.pack(side=tk.LEFT, padx=5)
-        self.filter_month.bind("<<ComboboxSelected>>", self.filter_transactions)
-
-        ttk.Label(filter_frame, text="Kategorija:").pack(side=tk.LEFT)
-        self.filter_category = ttk.Combobox(filter_frame, values=self.get_all_categories(), width=15)
-        self.filter_category.pack(side=tk.LEFT, padx=5)
-        self.filter_category.bind("<<ComboboxSelected>>", self.filter_transactions)
-
-        clear_filter_btn = ttk.Button(filter_frame, text="Išvalyti filtrą", command=self.clear_filter)
-        clear_filter_btn.pack(side=tk.LEFT, padx=5)
-
-    def update_category_combobox(self, *args):
-        categories = self.session.query(Category).filter_by(category_type=self.transaction_type.get()).all()
-        self.category_combobox['values'] = [cat.name for cat in categories]
-        if categories:
-            self.category_combobox.current(0)
-
-    def save_transaction(self):
-        try:
-            date = datetime.strptime(self.date_entry.get(), "%Y-%m-%d").date()
-            amount = float(self.amount_entry.get())
-            category = self.category_combobox.get()
-            description = self.description_entry.get()
-            transaction_type = self.transaction_type.get()
-
-            if not category:
-                messagebox.showwarning("Klaida", "Pasirinkite kategoriją")
-                return
-
-            transaction = Transaction(
-                date=date,
-                amount=amount,
-                category=category,
-                transaction_type=transaction_type,
-                description=description
-            )
-
-            self.session.add(transaction)
-            self.session.commit()
-
-            messagebox.showinfo("Sėkmingai", "Operacija išsaugota")
-            self.clear_fields()
-            self.update_data()
-        except ValueError as e:
-            messagebox.showerror("Klaida", f"Neteisingi duomenys: {str(e)}")
-
-    def clear_fields(self):
-        self.date_entry.delete(0, tk.END)
-        self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
-        self.amount_entry.delete(0, tk.END)
-        self.description_entry.delete(0, tk.END)
-        self.update_category_combobox()
-
-    def update_data(self):
-        self.load_transactions()
-        self.update_chart()
-        self.filter_month['values'] = self.get_months_list()
-        self.filter_category['values'] = self.get_all_categories()
-
-    def load_transactions(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        transactions = self.session.query(Transaction).order_by(Transaction.date.desc()).all()
-
-        for trans in transactions:
-            trans_type = "Pajamos" if trans.transaction_type == "income" else "Išlaidos"
-            amount = f"+{trans.amount:.2f}" if trans.transaction_type == "income" else f"-{trans.amount:.2f}"
-            self.tree.insert("", tk.END, values=(
-                trans.date.strftime("%Y-%m-%d"),
-                trans_type,
-                amount,
-                trans.category,
-                trans.description
-            ), iid=trans.id)
-
-    def update_chart(self):
-        for widget in self.figure_frame.winfo_children():
-            widget.destroy()
-
-        query = self.session.query(
-            Transaction.date,
-            Transaction.amount,
-            Transaction.category,
-            Transaction.transaction_type
-        )
-
-        df = pd.read_sql(query.statement, self.session.bind)
-
-        if df.empty:
-            ttk.Label(self.figure_frame, text="Nėra duomenų diagramai rodyti").pack(expand=True)
-            return
-
-        df['date'] = pd.to_datetime(df['date'])
-        df['month'] = df['date'].dt.to_period('M')
-
-        fig = plt.Figure(figsize=(8, 4), dpi=100)
-        ax = fig.add_subplot(111)
-
-        report_type = self.report_type.get()
-
-        if report_type == "expenses_by_category":
-            expenses = df[df['transaction_type'] == 'expense']
-            if not expenses.empty:
-                expenses_by_cat = expenses.groupby('category')['amount'].sum().sort_values()
-                expenses_by_cat.plot(kind='bar', ax=ax, color='red')
-                ax.set_title('Išlaidų pasiskirstymas pagal kategorijas', fontweight='bold')
-                ax.set_xlabel('Suma', fontweight='bold')
-                ax.tick_params(axis='x', labelrotation=360)
-            else:
-                ax.set_title('Nėra išlaidų duomenų')
-
-        elif report_type == "income_by_category":
-            income = df[df['transaction_type'] == 'income']
-            if not income.empty:
-                income_by_cat = income.groupby('category')['amount'].sum().sort_values()
-                income_by_cat.plot(kind='bar', ax=ax, color='green')
-                ax.set_title('Pajamų pasiskirstymas pagal kategorijas', fontweight='bold')
-                ax.set_xlabel('Suma', fontweight='bold')
-                ax.tick_params(axis='x', labelrotation=360)
-            else:
-                ax.set_title('Nėra pajamų duomenų')
-
-        elif report_type == "monthly_expenses":
-            expenses = df[df['transaction_type'] == 'expense']
-            if not expenses.empty:
-                monthly_expenses = expenses.groupby('month')['amount'].sum()
-                monthly_expenses.plot(kind='bar', ax=ax, color='red')
-                ax.set_title('Mėnesinės išlaidos', fontweight='bold')
-                ax.set_ylabel('Suma', fontweight='bold')
-                ax.set_xticklabels([str(period) for period in monthly_expenses.index], rotation=45)
-            else:
-                ax.set_title('Nėra išlaidų duomenų')
-
-        elif report_type == "monthly_income":
-            income = df[df['transaction_type'] == 'income']
-            if not income.empty:
-                monthly_income = income.groupby('month')['amount'].sum()
-                monthly_income.plot(kind='bar', ax=ax, color='green')
-                ax.set_title('Mėnesinės pajamos', fontweight='bold')
-                ax.set_ylabel('Suma', fontweight='bold')
-                ax.set_xticklabels([str(period) for period in monthly_income.index], rotation=45)
-            else:
-                ax.set_title('Nėra pajamų duomenų')
-
-        elif report_type == "balance":
-            income = df[df['transaction_type'] == 'income'].groupby('month')['amount'].sum()
-            expenses = df[df['transaction_type'] == 'expense'].groupby('month')['amount'].sum()
-
-            balance = income.subtract(expenses, fill_value=0)
-
-            if not balance.empty:
-                balance.plot(kind='bar', ax=ax, color='blue')
-                ax.set_title('Mėnesinis balansas (Pajamos - Išlaidos)', fontweight='bold')
-                ax.set_ylabel('Suma', fontweight='bold')
-                ax.set_xticklabels([str(period) for period in balance.index], rotation=45)
-            else:
-                ax.set_title('Nėra duomenų balansui skaičiuoti')
-
-        canvas = FigureCanvasTkAgg(fig, master=self.figure_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-
-    def manage_categories(self):
-        cat_window = tk.Toplevel(self.root)
-        cat_window.title("Kategorijų valdymas")
-        cat_window.geometry("500x400")
-
-        list_frame = ttk.Frame(cat_window, padding="10")
-        list_frame.pack(fill=tk.BOTH, expand=True)
-
-        tree = ttk.Treeview(list_frame, columns=("name", "type"), show="headings")
-        tree.heading("name", text="Pavadinimas")
-        tree.heading("type", text="Tipas")
-        tree.column("name", width=200)
-        tree.column("type", width=100)
-        tree.pack(fill=tk.BOTH, expand=True)
-
-        categories = self.session.query(Category).order_by(Category.category_type, Category.name).all()
-        for cat in categories:
-            cat_type = "Pajamos" if cat.category_type == "income" else "Išlaidos"
-            tree.insert("", tk.END, values=(cat.name, cat_type), iid=cat.id)
-
-        button_frame = ttk.Frame(list_frame)
-        button_frame.pack(fill=tk.X, pady=5)
-
-        add_btn = ttk.Button(button_frame, text="Pridėti", command=lambda: self.add_category(cat_window, tree))
-        add_btn.pack(side=tk.LEFT, padx=5)
-
-        delete_btn = ttk.Button(button_frame, text="Ištrinti", command=lambda: self.delete_category(tree))
-        delete_btn.pack(side=tk.LEFT, padx=5)
-
-        close_btn = ttk.Button(button_frame, text="Uždaryti", command=cat_window.destroy)
-        close_btn.pack(side=tk.RIGHT, padx=5)
-
-    def add_category(self, parent_window, tree):
-        add_window = tk.Toplevel(parent_window)
-        add_window.title("Pridėti kategoriją")
-        add_window.geometry("300x200")
-
-        ttk.Label(add_window, text="Pavadinimas:").pack(pady=5)
-        name_entry = ttk.Entry(add_window, width=30)
-        name_entry.pack(pady=5)
-
-        ttk.Label(add_window, text="Tipas:").pack(pady=5)
-        cat_type = tk.StringVar(value="expense")
-        ttk.Radiobutton(add_window, text="Išlaidos", variable=cat_type, value="expense").pack()
-        ttk.Radiobutton(add_window, text="Pajamos", variable=cat_type, value="income").pack()
-
-        def save_category():
-            name = name_entry.get()
-            if not name:
-                messagebox.showwarning("Klaida", "Įveskite kategorijos pavadinimą")
-                return
-
-            category = Category(name=name, category_type=cat_type.get())
-            self.session.add(category)
-            self.session.commit()
-
-            cat_type_display = "Pajamos" if cat_type.get() == "income" else "Išlaidos"
-            tree.insert("", tk.END, values=(name, cat_type_display), iid=category.id)
-
-            self.update_category_combobox()
-            self.filter_category['values'] = self.get_all_categories()
-
-            add_window.destroy()
-
-        save_btn = ttk.Button(add_window, text="Išsaugoti", command=save_category)
-        save_btn.pack(pady=10)
-
-    def delete_category(self, tree):
-        selected_item = tree.focus()
-        if not selected_item:
-            messagebox.showwarning("Klaida", "Pasirinkite kategoriją, kurią norite ištrinti")
-            return
-
-        transactions_count = self.session.query(Transaction).filter_by(
-            category=tree.item(selected_item)['values'][0]).count()
-
-        if transactions_count > 0:
-            messagebox.showwarning("Klaida",
-                                   f"Ši kategorija naudojama {transactions_count} operacijose. "
-                                   "Pirmiausia pakeiskite šių operacijų kategorijas.")
-            return
-
-        if messagebox.askyesno("Patvirtinimas", "Ar tikrai norite ištrinti šią kategoriją?"):
-            self.session.query(Category).filter_by(id=selected_item).delete()
-            self.session.commit()
-            tree.delete(selected_item)
-
-            self.update_category_combobox()
-            self.filter_category['values'] = self.get_all_categories()
-
-    def delete_transaction(self):
-        selected_item = self.tree.focus()
-        if not selected_item:
-            messagebox.showwarning("Klaida", "Pasirinkite operaciją, kurią norite ištrinti")
-            return
-
-        if messagebox.askyesno("Patvirtinimas", "Ar tikrai norite ištrinti šią operaciją?"):
-            self.session.query(Transaction).filter_by(id=selected_item).delete()
-            self.session.commit()
-            self.update_data()
-
-    def get_months_list(self):
-        dates = self.session.query(Transaction.date).distinct().all()
-        months = set(datetime.strptime(str(date[0]), "%Y-%m-%d").strftime("%Y-%m") for date in dates)
-        return sorted(months, reverse=True)
-
-    def get_all_categories(self):
-        categories = self.session.query(Category.name).order_by(Category.name).all()
-        return [cat[0] for cat in categories]
-
-    def filter_transactions(self, event=None):
-        month = self.filter_month.get()
-        category = self.filter_category.get()
-
-        query = self.session.query(Transaction)
-
-        if month:
-            year, month_num = map(int, month.split('-'))
-            query = query.filter(
-                Transaction.date >= f"{year}-{month_num:02d}-01",
-                Transaction.date <= f"{year}-{month_num:02d}-31"
-            )
-
-        if category:
-            query = query.filter_by(category=category)
-
-        transactions = query.order_by(Transaction.date.desc()).all()
-
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        for trans in transactions:
-            trans_type = "Pajamos" if trans.transaction_type == "income" else "Išlaidos"
-            amount = f"+{trans.amount:.2f}" if trans.transaction_type == "income" else f"-{trans.amount:.2f}"
-            self.tree.insert("", tk.END, values=(
-                trans.date.strftime("%Y-%m-%d"),
-                trans_type,
-                amount,
-                trans.category,
-                trans.description
-            ), iid=trans.id)
-
-    def clear_filter(self):
-        self.filter_month.set('')
-        self.filter_category.set('')
-        self.load_transactions()
-
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = FinanceTracker(root)
-    root.mainloop()
+import argparse
+import queue
+import re
+import sys
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
+from datetime import date, datetime
+
+# Taken before the third-party imports so that --startup-timing includes them
+STARTED = time.perf_counter()
+
+import numpy as np
+from sqlalchemy import func, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+
+from archive import archive_dir, archived_category_count
+from budgets import budget_usage, exceeded, remove_budget, set_budget
+from categories import CategoryCache
+from categorizer import RULE_KINDS, describe_amounts, load_classifier, reclassify, validate_rule
+from database import (bump_version, create_database_engine, current_version, operation, session_registry,
+                      write_operation)
+from diagnostics import instrument_engine, metrics, profiler
+from charts import ReportChart, chart_report, import_backend
+from filters import SearchMatch, TransactionFilter, build_criteria, filter_criteria, month_range
+from importer import import_statement
+from ledgers import add_ledger, load_ledgers, resolve_ledger
+from migrations import upgrade_schema
+from models import Transaction, Category, CategoryRule, MonthlySummary, RecurringRule
+from money import format_amounts, format_cents, to_cents
+from recurring import SCHEDULES, describe_schedule, first_occurrence, materialize_due, validate_schedule
+from summaries import apply_summary_deltas, summary_deltas
+from worker import BackgroundWorker
+
+SEARCH_DELAY_MS = 300
+# Pause in typing after which the description is classified into a suggested category
+SUGGEST_DELAY_MS = 150
+# How often the ledger's change counter is checked for other instances' writes
+CHANGE_POLL_MS = 2000
+# How often the recurring rules are re-evaluated while the window stays open
+RECURRING_INTERVAL_MS = 15 * 60 * 1000
+
+DEFAULT_CATEGORIES = [
+    ('Maistas', 'expense'),
+    ('Transportas', 'expense'),
+    ('Mokesčiai', 'expense'),
+    ('Pramogos', 'expense'),
+    ('Būstas', 'expense'),
+    ('Atlyginimas', 'income'),
+    ('Verslas', 'income'),
+    ('Investicijos', 'income'),
+    ('Kitos pajamos', 'income')
+]
+
+FILTER_TYPES = {
+    "Visi": '',
+    "Išlaidos": 'expense',
+    "Pajamos": 'income'
+}
+
+
+def chart_job(report_type):
+    def build_chart(session):
+        # pandas (through reports) and matplotlib are first imported here, on the worker,
+        # so neither is paid for before the window appears
+        from reports import run_report
+        import_backend()
+        with metrics.phase("update_chart.report"):
+            totals = run_report(session, report_type)
+        with metrics.phase("update_chart.prepare"):
+            return chart_report(totals, report_type)
+    return build_chart
+
+
+class StartupTimer:
+    # Prints each startup phase once, with its own duration and the time since the
+    # first import of this module; disabled unless --startup-timing is given
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.last = STARTED
+        self.seen = set()
+
+    def mark(self, phase):
+        if not self.enabled or phase in self.seen:
+            return
+        self.seen.add(phase)
+        now = time.perf_counter()
+        print(f"{phase:<30} {(now - self.last) * 1000:8.1f} ms {(now - STARTED) * 1000:10.1f} ms",
+              file=sys.stderr, flush=True)
+        self.last = now
+
+
+def category_tag(category_id):
+    return f"category-{category_id}"
+
+
+def format_transaction_rows(rows, category_names):
+    # A page is formatted in one pass over integer cents; no float ever reaches the list
+    if not rows:
+        return []
+    with metrics.phase("format_transaction_rows"):
+        return format_rows(rows, category_names)
+
+
+def format_rows(rows, category_names):
+    incomes = np.array([trans.transaction_type == "income" for trans in rows])
+    dates = np.array([trans.date for trans in rows], dtype='datetime64[D]').astype(str)
+    amounts = format_amounts([trans.amount_cents for trans in rows], np.where(incomes, '+', '-'))
+    types = np.where(incomes, "Pajamos", "Išlaidos")
+    return [
+        (str(day), str(trans_type), str(amount), category_names.get(trans.category_id, ''), trans.description)
+        for day, trans_type, amount, trans in zip(dates, types, amounts, rows)
+    ]
+
+
+def descending_index(keys, key):
+    low, high = 0, len(keys)
+    while low < high:
+        mid = (low + high) // 2
+        if keys[mid] > key:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+class TransactionStore:
+    # Writes go through the store so that the monthly summaries are updated in the same
+    # database transaction and listeners only have to patch the affected row.
+    TRANSACTION_COLUMNS = (
+        Transaction.id,
+        Transaction.date,
+        Transaction.amount_cents,
+        Transaction.category_id,
+        Transaction.transaction_type,
+        Transaction.description
+    )
+
+    def __init__(self, session):
+        # A scoped session on the Tk thread (see database.operation), a plain one in worker jobs
+        self.session = session
+        self.categories = CategoryCache(session)
+        self.listeners = []
+        # The ledger's change counter as of the last load, so cached reports can be keyed
+        # by (report_type, version) and other instances' writes are told apart from ours
+        self.version = 0
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def page_query(self, criteria=(), after=None, before=None, limit=None):
+        key = tuple_(Transaction.date, Transaction.id)
+        query = self.session.query(*self.TRANSACTION_COLUMNS).filter(*criteria)
+
+        if before is not None:
+            query = query.filter(key > before).order_by(Transaction.date, Transaction.id)
+        else:
+            if after is not None:
+                query = query.filter(key < after)
+            query = query.order_by(Transaction.date.desc(), Transaction.id.desc())
+
+        return query.limit(limit) if limit is not None else query
+
+    def count_query(self, criteria=()):
+        return self.session.query(func.count(Transaction.id)).filter(*criteria)
+
+    def category_usage_query(self, category_id):
+        return self.count_query([Transaction.category_id == category_id])
+
+    @operation
+    def category_usage(self, category_id):
+        return self.category_usage_query(category_id).scalar()
+
+    @operation
+    def category_rule_count(self, category_id):
+        return self.session.query(func.count(RecurringRule.id)).filter(
+            RecurringRule.category_id == category_id).scalar()
+
+    @operation
+    def matches(self, transaction_id, criteria):
+        if not criteria:
+            return True
+        return self.session.query(Transaction.id).filter(Transaction.id == transaction_id,
+                                                         *criteria).first() is not None
+
+    @operation
+    def months(self):
+        months = self.session.query(MonthlySummary.month).distinct().order_by(MonthlySummary.month.desc())
+        return [month for month, in months]
+
+    @operation
+    def refresh_version(self):
+        # One primary-key read; True when anyone else has written since the last load
+        version = current_version(self.session)
+        changed = version != self.version
+        self.version = version
+        return changed
+
+    def commit(self):
+        # Every write moves the change counter in its own transaction. When the new value
+        # skips one, another instance wrote in between: the version is then left behind
+        # so that the next poll reloads
+        version = bump_version(self.session)
+        self.session.commit()
+        if version == self.version + 1:
+            self.version = version
+
+    @write_operation
+    def add(self, transaction):
+        self.session.add(transaction)
+        self.session.flush()
+        row = self.session.query(*self.TRANSACTION_COLUMNS).filter(Transaction.id == transaction.id).one()
+        apply_summary_deltas(self.session, summary_deltas([row]))
+        self.commit()
+        self.notify('insert', row)
+        return row
+
+    @write_operation
+    def delete(self, transaction_id):
+        row = self.session.query(*self.TRANSACTION_COLUMNS).filter(Transaction.id == transaction_id).first()
+        if row is None:
+            return None
+        if self.session.query(Transaction).filter_by(id=transaction_id).delete() != 1:
+            # Another instance deleted it in the meantime and took it out of the summaries
+            self.session.rollback()
+            return None
+        apply_summary_deltas(self.session, summary_deltas([row], -1))
+        self.commit()
+        self.notify('delete', row)
+        return row
+
+    @write_operation
+    def add_default_categories(self, categories):
+        if self.session.query(Category).first() is None:
+            self.session.add_all(Category(name=name, category_type=category_type)
+                                 for name, category_type in categories)
+            self.commit()
+            self.categories.invalidate()
+
+    @write_operation
+    def add_category(self, name, category_type):
+        category = Category(name=name, category_type=category_type)
+        self.session.add(category)
+        self.commit()
+        self.categories.invalidate()
+        return category
+
+    @write_operation
+    def delete_category(self, category_id):
+        remove_budget(self.session, category_id)
+        self.session.query(CategoryRule).filter_by(category_id=category_id).delete()
+        self.session.query(Category).filter_by(id=category_id).delete()
+        self.commit()
+        self.categories.invalidate()
+
+    @write_operation
+    def rename_category(self, category_id, name):
+        # Transactions and summaries reference the id, so a rename touches a single row
+        self.session.query(Category).filter_by(id=category_id).update({'name': name})
+        self.commit()
+        self.categories.invalidate()
+        self.notify('rename', category_id)
+
+    @operation
+    def recurring_rules(self):
+        return self.session.query(RecurringRule).order_by(RecurringRule.next_date, RecurringRule.id).all()
+
+    @write_operation
+    def add_recurring_rule(self, rule):
+        validate_schedule(rule.schedule, rule.start_date)
+        rule.next_date = first_occurrence(rule.schedule, rule.start_date)
+        self.session.add(rule)
+        self.commit()
+        return rule
+
+    @write_operation
+    def delete_recurring_rule(self, rule_id):
+        self.session.query(RecurringRule).filter_by(id=rule_id).delete()
+        self.commit()
+
+    @write_operation
+    def materialize_recurring(self, today):
+        # Occurrences are inserted in bulk, so listeners get one reload instead of a row each.
+        # Runs that only move next dates along leave the change counter alone.
+        count = materialize_due(self.session.connection(), today)
+        if count:
+            self.commit()
+        else:
+            self.session.commit()
+        return count
+
+    @operation
+    def category_rules(self):
+        return self.session.query(CategoryRule).order_by(CategoryRule.priority, CategoryRule.id).all()
+
+    @write_operation
+    def add_category_rule(self, rule):
+        validate_rule(rule)
+        self.session.add(rule)
+        self.commit()
+        return rule
+
+    @write_operation
+    def delete_category_rule(self, rule_id):
+        self.session.query(CategoryRule).filter_by(id=rule_id).delete()
+        self.commit()
+
+    @operation
+    def budget_usage(self, month, category_id=None):
+        return budget_usage(self.session, month, category_id)
+
+    @write_operation
+    def set_budget(self, category_id, limit_cents):
+        set_budget(self.session, category_id, limit_cents)
+        self.commit()
+
+    @write_operation
+    def remove_budget(self, category_id):
+        remove_budget(self.session, category_id)
+        self.commit()
+
+    def notify(self, change, row):
+        for callback in self.listeners:
+            callback(change, row)
+
+
+class TransactionList:
+    # Only a bounded window of pages is kept in the Treeview; neighbouring pages are
+    # fetched with keyset pagination on (date, id) as the user scrolls towards an edge.
+    PAGE_SIZE = 200
+    MAX_PAGES = 3
+    EDGE_FRACTION = 0.1
+
+    def __init__(self, master, store, worker, on_loaded=None):
+        self.store = store
+        self.worker = worker
+        self.on_loaded = on_loaded
+        self.transaction_filter = TransactionFilter()
+        self.criteria = []
+        self.pages = []
+        self.has_more_before = False
+        self.has_more_after = False
+        self.total_count = 0
+        self._check_pending = False
+        self._page_loading = False
+
+        tree_frame = ttk.Frame(master)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.tree = ttk.Treeview(tree_frame, columns=("date", "type", "amount", "category", "description"),
+                                 show="headings")
+        self.tree.heading("date", text="Data")
+        self.tree.heading("type", text="Tipas")
+        self.tree.heading("amount", text="Suma")
+        self.tree.heading("category", text="Kategorija")
+        self.tree.heading("description", text="Aprašymas")
+        self.tree.column("date", width=100)
+        self.tree.column("type", width=80)
+        self.tree.column("amount", width=80)
+        self.tree.column("category", width=120)
+        self.tree.column("description", width=250)
+
+        self.scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.count_label = ttk.Label(master)
+        self.count_label.pack(anchor=tk.W)
+
+    def set_filter(self, transaction_filter):
+        self.transaction_filter = transaction_filter
+        self.reload("filter_transactions")
+
+    def reload(self, phase="load_transactions"):
+        # phase names the diagnostics timings: "<phase>.query" and ".count" on the worker,
+        # ".treeview" on the Tk thread, and "<phase>" itself from request to filled list
+        transaction_filter = self.transaction_filter
+        self.worker.cancel('transaction-page')
+        self.worker.cancel('transaction-count')
+        self._page_loading = False
+        requested = time.perf_counter()
+
+        def load_first_page(session):
+            # Criteria are built on the worker: choosing the search strategy probes the FTS index
+            with metrics.phase(f"{phase}.query"):
+                criteria = build_criteria(session, transaction_filter)
+                return criteria, self.fetch_page(TransactionStore(session), criteria)
+
+        self.worker.submit('transactions', load_first_page,
+                           lambda result: self.show_first_page(result, phase, requested), self.show_load_error)
+
+    def show_first_page(self, result, phase="load_transactions", requested=None):
+        # The page is shown as soon as it arrives; the total count follows in a separate job
+        self.criteria, (rows, self.has_more_after) = result
+        self.count_label.config(text="Skaičiuojama...")
+        self.request_count(f"{phase}.count")
+
+        with metrics.phase(f"{phase}.treeview"):
+            self.tree.delete(*self.tree.get_children())
+            self.pages = []
+            self.has_more_before = False
+            if rows:
+                self.append_page(rows)
+            self.tree.yview_moveto(0)
+        if requested is not None:
+            metrics.record(phase, (time.perf_counter() - requested) * 1000)
+        if self.on_loaded is not None:
+            self.on_loaded()
+
+    @classmethod
+    def fetch_page(cls, reader, criteria, after=None, before=None):
+        # Runs on the worker without touching widgets, so the benchmark can call it headless
+        rows = reader.page_query(criteria, after, before, cls.PAGE_SIZE + 1).all()
+        has_more = len(rows) > cls.PAGE_SIZE
+        rows = rows[:cls.PAGE_SIZE]
+        if before is not None:
+            rows.reverse()
+        return rows, has_more
+
+    def append_page(self, rows):
+        metrics.count("treeview.rows", len(rows))
+        for trans, values in zip(rows, format_transaction_rows(rows, self.store.categories.names())):
+            self.tree.insert("", tk.END, values=values, iid=trans.id, tags=(category_tag(trans.category_id),))
+        self.pages.append([(trans.date, trans.id) for trans in rows])
+
+    def prepend_page(self, rows):
+        metrics.count("treeview.rows", len(rows))
+        formatted = format_transaction_rows(rows, self.store.categories.names())
+        for index, (trans, values) in enumerate(zip(rows, formatted)):
+            self.tree.insert("", index, values=values, iid=trans.id, tags=(category_tag(trans.category_id),))
+        self.pages.insert(0, [(trans.date, trans.id) for trans in rows])
+
+    def drop_page(self, index):
+        page = self.pages.pop(index)
+        self.tree.delete(*[trans_id for _, trans_id in page if self.tree.exists(trans_id)])
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if not self._check_pending:
+            self._check_pending = True
+            self.tree.after_idle(self.check_window)
+
+    def check_window(self):
+        self._check_pending = False
+        # Scheduled from a scroll just before a ledger switch destroyed the list
+        if not self.tree.winfo_exists():
+            return
+        if not self.pages or self._page_loading:
+            return
+
+        first, last = self.tree.yview()
+        if last >= 1 - self.EDGE_FRACTION and self.has_more_after:
+            self.request_page(forward=True, key=self.pages[-1][-1])
+        elif first <= self.EDGE_FRACTION and self.has_more_before:
+            self.request_page(forward=False, key=self.pages[0][0])
+
+    def request_page(self, forward, key):
+        criteria = list(self.criteria)
+        self._page_loading = True
+
+        def load_page(session):
+            reader = TransactionStore(session)
+            if forward:
+                return self.fetch_page(reader, criteria, after=key)
+            return self.fetch_page(reader, criteria, before=key)
+
+        self.worker.submit('transaction-page', load_page, lambda result: self.shift_window(result, forward),
+                           self.show_load_error)
+
+    def show_load_error(self, error):
+        self._page_loading = False
+        messagebox.showerror("Klaida", f"Nepavyko įkelti operacijų: {error}")
+
+    def shift_window(self, result, forward):
+        self._page_loading = False
+        rows, has_more = result
+        if forward:
+            self.has_more_after = has_more
+        else:
+            self.has_more_before = has_more
+        if not rows:
+            return
+
+        # Keep the first visible row in place while pages are added and evicted
+        anchor = self.tree.identify_row(1)
+
+        if forward:
+            self.append_page(rows)
+            if len(self.pages) > self.MAX_PAGES:
+                self.drop_page(0)
+                self.has_more_before = True
+        else:
+            self.prepend_page(rows)
+            if len(self.pages) > self.MAX_PAGES:
+                self.drop_page(-1)
+                self.has_more_after = True
+
+        if anchor and self.tree.exists(anchor):
+            self.tree.yview_moveto(self.tree.index(anchor) / len(self.tree.get_children()))
+        self.on_scroll(*self.tree.yview())
+
+    def insert_row(self, trans):
+        if not self.store.matches(trans.id, self.criteria):
+            return
+
+        self.total_count += 1
+        self.update_count_label()
+
+        key = (trans.date, trans.id)
+        if not self.pages:
+            if not self.has_more_before and not self.has_more_after:
+                self.append_page([trans])
+            return
+        if key > self.pages[0][0] and self.has_more_before:
+            return
+        if key < self.pages[-1][-1] and self.has_more_after:
+            return
+
+        offset = 0
+        for page in self.pages:
+            if key > page[-1] or page is self.pages[-1]:
+                position = descending_index(page, key)
+                page.insert(position, key)
+                values = format_transaction_rows([trans], self.store.categories.names())[0]
+                self.tree.insert("", offset + position, values=values, iid=trans.id,
+                                 tags=(category_tag(trans.category_id),))
+                return
+            offset += len(page)
+
+    def rename_category(self, category_id):
+        # Rows are tagged with their category id, so only the visible rows of that category change
+        name = self.store.categories.name(category_id)
+        for item in self.tree.tag_has(category_tag(category_id)):
+            self.tree.set(item, "category", name)
+
+    def remove_row(self, trans):
+        key = (trans.date, trans.id)
+        if self.tree.exists(trans.id):
+            self.tree.delete(trans.id)
+            for index, page in enumerate(self.pages):
+                if key in page:
+                    page.remove(key)
+                    if not page:
+                        self.pages.pop(index)
+                    break
+            self.total_count -= 1
+        elif not self.criteria:
+            self.total_count -= 1
+        else:
+            self.request_count()
+            return
+        self.update_count_label()
+
+    def request_count(self, phase="transaction_count"):
+        criteria = list(self.criteria)
+
+        def count(session):
+            with metrics.phase(phase):
+                return TransactionStore(session).count_query(criteria).scalar()
+
+        self.worker.submit('transaction-count', count, self.set_total_count, self.show_load_error)
+
+    def set_total_count(self, total_count):
+        self.total_count = total_count
+        self.update_count_label()
+
+    def update_count_label(self):
+        self.count_label.config(text=f"Iš viso operacijų: {self.total_count}")
+
+
+class DiagnosticsWindow:
+    # Phase timings, per-statement SQL statistics and slow queries from diagnostics.metrics,
+    # refreshed while the window is open
+    REFRESH_MS = 1000
+    PHASE_COLUMNS = (("name", "Etapas", 260), ("count", "Kartai", 70), ("mean", "Vidurkis, ms", 90),
+                     ("p50", "p50, ms", 80), ("p95", "p95, ms", 80), ("max", "Maks., ms", 80),
+                     ("sql", "Iš jų SQL, ms", 100))
+    QUERY_COLUMNS = (("count", "Kartai", 70), ("total", "Iš viso, ms", 90), ("mean", "Vidurkis, ms", 90),
+                     ("p95", "p95, ms", 80), ("rows", "Eilutės", 80), ("statement", "Užklausa", 600))
+    SLOW_COLUMNS = (("time", "Laikas", 150), ("ms", "Trukmė, ms", 90), ("rows", "Eilutės", 80),
+                    ("phase", "Etapas", 180), ("statement", "Užklausa", 600))
+
+    def __init__(self, root, on_close):
+        self.window = tk.Toplevel(root)
+        self.window.title("Našumo diagnostika")
+        self.window.geometry("1000x600")
+        self.window.protocol("WM_DELETE_WINDOW", on_close)
+        self.refresh_job = None
+
+        control_frame = ttk.Frame(self.window, padding="10")
+        control_frame.pack(fill=tk.X)
+
+        ttk.Label(control_frame, text="Lėtos užklausos nuo, ms:").pack(side=tk.LEFT)
+        self.threshold_entry = ttk.Entry(control_frame, width=8)
+        self.threshold_entry.insert(0, f"{metrics.slow_query_ms:g}")
+        self.threshold_entry.bind("<Return>", self.set_threshold)
+        self.threshold_entry.pack(side=tk.LEFT, padx=5)
+
+        ttk.Button(control_frame, text="Išvalyti", command=self.reset).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Eksportuoti JSON...", command=self.export_json).pack(side=tk.LEFT, padx=5)
+        self.profile_button = ttk.Button(control_frame, command=self.toggle_profiling)
+        self.profile_button.pack(side=tk.LEFT, padx=5)
+        self.update_profile_button()
+
+        notebook = ttk.Notebook(self.window)
+        notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        self.phase_tree = self.add_table(notebook, "Etapai", self.PHASE_COLUMNS)
+        self.query_tree = self.add_table(notebook, "Užklausos", self.QUERY_COLUMNS)
+        self.slow_tree = self.add_table(notebook, "Lėtos užklausos", self.SLOW_COLUMNS)
+
+        self.refresh()
+
+    @staticmethod
+    def add_table(notebook, title, columns):
+        frame = ttk.Frame(notebook)
+        notebook.add(frame, text=title)
+        tree = ttk.Treeview(frame, columns=[column for column, _, _ in columns], show="headings")
+        for column, heading, width in columns:
+            tree.heading(column, text=heading)
+            tree.column(column, width=width, stretch=column == columns[-1][0])
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        return tree
+
+    @staticmethod
+    def fill(tree, rows):
+        # Rows are overwritten in place, so the scroll position survives a refresh
+        items = tree.get_children()
+        for index, values in enumerate(rows):
+            if index < len(items):
+                tree.item(items[index], values=values)
+            else:
+                tree.insert("", tk.END, values=values)
+        if len(items) > len(rows):
+            tree.delete(*items[len(rows):])
+
+    def refresh(self):
+        snapshot = metrics.snapshot()
+        phases = snapshot['phases']
+        phase_rows = []
+        for name, timing in phases.items():
+            if name.endswith('.sql'):
+                continue
+            sql = phases.get(f"{name}.sql")
+            phase_rows.append((name, timing['count'], f"{timing['mean_ms']:.2f}", f"{timing['p50_ms']:.2f}",
+                               f"{timing['p95_ms']:.2f}", f"{timing['max_ms']:.2f}",
+                               f"{sql['mean_ms']:.2f}" if sql is not None else ""))
+        phase_rows.extend((name, value, "", "", "", "", "") for name, value in snapshot['counters'].items())
+        self.fill(self.phase_tree, phase_rows)
+
+        self.fill(self.query_tree, [
+            (query['count'], f"{query['total_ms']:.1f}", f"{query['mean_ms']:.2f}", f"{query['p95_ms']:.2f}",
+             query['rows'], query['statement'])
+            for query in snapshot['queries']
+        ])
+        self.fill(self.slow_tree, [
+            (query['time'], f"{query['ms']:.1f}", query['rows'] if query['rows'] is not None else "",
+             query['phase'] or "", query['statement'])
+            for query in reversed(snapshot['slow_queries'])
+        ])
+        self.refresh_job = self.window.after(self.REFRESH_MS, self.refresh)
+
+    def set_threshold(self, event=None):
+        try:
+            threshold = float(self.threshold_entry.get().replace(',', '.'))
+        except ValueError:
+            messagebox.showerror("Klaida", "Neteisinga riba", parent=self.window)
+            return
+        metrics.slow_query_ms = threshold
+
+    def reset(self):
+        metrics.reset()
+        self.window.after_cancel(self.refresh_job)
+        self.refresh()
+
+    def export_json(self):
+        path = filedialog.asksaveasfilename(parent=self.window, title="Matavimų eksportas",
+                                            defaultextension=".json", filetypes=[("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            metrics.export_json(path)
+        except OSError as e:
+            messagebox.showerror("Klaida", f"Nepavyko įrašyti: {e}", parent=self.window)
+
+    def toggle_profiling(self):
+        # cProfile runs on the Tk thread and inside worker jobs until stopped; the merged
+        # profile opens with pstats or snakeviz
+        if not profiler.active:
+            profiler.start()
+            self.update_profile_button()
+            return
+
+        profiler.stop()
+        self.update_profile_button()
+        path = filedialog.asksaveasfilename(parent=self.window, title="Profilio įrašymas",
+                                            defaultextension=".prof", filetypes=[("cProfile", "*.prof")])
+        if not path:
+            return
+        try:
+            profiler.dump(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Klaida", f"Nepavyko įrašyti profilio: {e}", parent=self.window)
+
+    def update_profile_button(self):
+        self.profile_button.config(text="Sustabdyti ir įrašyti profilį..." if profiler.active
+                                   else "Pradėti profiliavimą")
+
+    def destroy(self):
+        if self.refresh_job is not None:
+            self.window.after_cancel(self.refresh_job)
+        if profiler.active:
+            profiler.stop()
+        self.window.destroy()
+
+
+class FinanceTracker:
+    def __init__(self, root, ledger, database_url, timer=None):
+        self.timer = timer if timer is not None else StartupTimer()
+        self.root = root
+        self.ledger = ledger
+        self.root.title(f"Finansų sekiklis – {ledger}")
+        self.root.geometry("1200x1200")
+        # One pooled engine per ledger, shared by the Tk thread, the worker and imports
+        self.engine = instrument_engine(create_database_engine(database_url))
+        upgrade_schema(self.engine)
+        self.store = TransactionStore(session_registry(self.engine))
+        self.store.add_default_categories(DEFAULT_CATEGORIES)
+        self.store.subscribe(self.on_transaction_change)
+        self.worker = BackgroundWorker(self.root, self.engine)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        # Pending Tk callbacks of this instance; shutdown cancels them all, since after a ledger
+        # switch they would run against destroyed widgets
+        self.load_job = None
+        self.recurring_job = None
+        self.change_job = None
+        # Rules and the model learned from history; trained on the worker after startup
+        self.classifier = None
+        self.diagnostics = None
+        self.timer.mark("duomenų bazė")
+        self.create_widgets()
+        self.timer.mark("valdikliai")
+        # Staged startup: the window and the input form come first; everything else is
+        # scheduled for once the window has been drawn, and the list and the chart are
+        # filled in by the background worker
+        self.load_job = self.root.after_idle(self.load_initial_data)
+
+    def load_initial_data(self):
+        self.load_job = None
+        self.timer.mark("langas parodytas")
+        self.store.refresh_version()
+        # Occurrences that fell due while the app was closed are in place before the first load
+        self.materialize_recurring()
+        self.timer.mark("pasikartojančios operacijos")
+        self.update_data()
+        self.load_classifier()
+        self.recurring_job = self.root.after(RECURRING_INTERVAL_MS, self.run_recurring)
+        self.change_job = self.root.after(CHANGE_POLL_MS, self.poll_changes)
+
+    def shutdown(self):
+        for job in (self.load_job, self.recurring_job, self.change_job, self.suggestion_job, self.search_job):
+            if job is not None:
+                self.root.after_cancel(job)
+        self.load_job = self.recurring_job = self.change_job = self.suggestion_job = self.search_job = None
+        if self.diagnostics is not None:
+            self.diagnostics.destroy()
+            self.diagnostics = None
+        self.worker.shutdown()
+        if self.engine.dialect.name == 'sqlite':
+            with self.engine.connect() as connection:
+                connection.exec_driver_sql('PRAGMA optimize')
+        self.engine.dispose()
+
+    def close(self):
+        self.shutdown()
+        self.root.destroy()
+
+    def switch_ledger(self, ledger):
+        if ledger == self.ledger:
+            return
+        try:
+            ledger, database_url = resolve_ledger(ledger)
+        except ValueError as e:
+            messagebox.showerror("Klaida", str(e))
+            return
+        self.shutdown()
+        for child in self.root.winfo_children():
+            child.destroy()
+        FinanceTracker(self.root, ledger, database_url)
+
+    def open_new_ledger_dialog(self):
+        ledger_window = tk.Toplevel(self.root)
+        ledger_window.title("Nauja knyga")
+        ledger_window.geometry("400x180")
+
+        ttk.Label(ledger_window, text="Pavadinimas:").pack(pady=5)
+        name_entry = ttk.Entry(ledger_window, width=40)
+        name_entry.pack(pady=5)
+
+        ttk.Label(ledger_window, text="Duomenų bazės adresas (nebūtina):").pack(pady=5)
+        url_entry = ttk.Entry(ledger_window, width=40)
+        url_entry.pack(pady=5)
+
+        def save_ledger():
+            name = name_entry.get().strip()
+            try:
+                add_ledger(name, url_entry.get().strip() or None)
+            except (ValueError, OSError) as e:
+                messagebox.showerror("Klaida", str(e), parent=ledger_window)
+                return
+            ledger_window.destroy()
+            self.switch_ledger(name)
+
+        ttk.Button(ledger_window, text="Sukurti ir atidaryti", command=save_ledger).pack(pady=10)
+
+    def poll_changes(self):
+        # Other instances on the same ledger are noticed through its change counter: one
+        # primary-key read per interval, and a reload of the visible data only when it moved
+        if self.store.refresh_version():
+            self.store.categories.invalidate()
+            self.update_category_combobox()
+            self.update_data()
+            self.load_classifier()
+        self.change_job = self.root.after(CHANGE_POLL_MS, self.poll_changes)
+
+    def create_widgets(self):
+        menu_bar = tk.Menu(self.root)
+        file_menu = tk.Menu(menu_bar, tearoff=0)
+        file_menu.add_command(label="Importuoti banko išrašą...", command=self.open_import_dialog)
+        menu_bar.add_cascade(label="Failas", menu=file_menu)
+        planning_menu = tk.Menu(menu_bar, tearoff=0)
+        planning_menu.add_command(label="Pasikartojančios operacijos...", command=self.manage_recurring)
+        planning_menu.add_command(label="Biudžetai...", command=self.manage_budgets)
+        planning_menu.add_command(label="Kategorizavimo taisyklės...", command=self.manage_category_rules)
+        menu_bar.add_cascade(label="Planavimas", menu=planning_menu)
+        ledger_menu = tk.Menu(menu_bar, tearoff=0)
+        self.ledger_var = tk.StringVar(value=self.ledger)
+        for ledger in load_ledgers():
+            ledger_menu.add_radiobutton(label=ledger, variable=self.ledger_var, value=ledger,
+                                        command=lambda ledger=ledger: self.switch_ledger(ledger))
+        ledger_menu.add_separator()
+        ledger_menu.add_command(label="Nauja knyga...", command=self.open_new_ledger_dialog)
+        menu_bar.add_cascade(label="Knyga", menu=ledger_menu)
+        diagnostics_menu = tk.Menu(menu_bar, tearoff=0)
+        self.diagnostics_visible = tk.BooleanVar(value=False)
+        diagnostics_menu.add_checkbutton(label="Našumo diagnostika", accelerator="F12",
+                                         variable=self.diagnostics_visible, command=self.toggle_diagnostics)
+        menu_bar.add_cascade(label="Diagnostika", menu=diagnostics_menu)
+        self.root.bind("<F12>", self.toggle_diagnostics)
+        self.root.config(menu=menu_bar)
+
+        main_frame = ttk.Frame(self.root, padding="10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        input_frame = ttk.LabelFrame(main_frame, text="Naujas įrašas", padding="10")
+        input_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(input_frame, text="Tipas:").grid(row=0, column=0, sticky=tk.W)
+        self.transaction_type = tk.StringVar(value="expense")
+        ttk.Radiobutton(input_frame, text="Išlaidos", variable=self.transaction_type, value="expense").grid(row=0,
+                                                                                                            column=1,
+                                                                                                            sticky=tk.W)
+        ttk.Radiobutton(input_frame, text="Pajamos", variable=self.transaction_type, value="income").grid(row=0,
+                                                                                                          column=2,
+                                                                                                          sticky=tk.W)
+        self.transaction_type.trace_add('write', self.change_transaction_type)
+
+        ttk.Label(input_frame, text="Data:").grid(row=1, column=0, sticky=tk.W)
+        self.date_entry = ttk.Entry(input_frame)
+        self.date_entry.grid(row=1, column=1, padx=5, pady=2, sticky=tk.W)
+        self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
+
+        ttk.Label(input_frame, text="Suma:").grid(row=2, column=0, sticky=tk.W)
+        self.amount_entry = ttk.Entry(input_frame)
+        self.amount_entry.grid(row=2, column=1, padx=5, pady=2, sticky=tk.W)
+        self.amount_entry.bind("<KeyRelease>", self.schedule_suggestion)
+
+        ttk.Label(input_frame, text="Kategorija:").grid(row=3, column=0, sticky=tk.W)
+        self.category_combobox = ttk.Combobox(input_frame, state="readonly")
+        self.category_combobox.grid(row=3, column=1, padx=5, pady=2, sticky=tk.W)
+        self.category_combobox.bind("<<ComboboxSelected>>", self.choose_category)
+        # A category picked by hand is never overwritten by a suggestion
+        self.category_chosen = False
+        self.suggestion_label = ttk.Label(input_frame, foreground="gray")
+        self.suggestion_label.grid(row=3, column=2, padx=5, sticky=tk.W)
+        self.update_category_combobox()
+
+        ttk.Label(input_frame, text="Aprašymas:").grid(row=4, column=0, sticky=tk.W)
+        self.description_entry = ttk.Entry(input_frame, width=40)
+        self.description_entry.grid(row=4, column=1, padx=5, pady=2, sticky=tk.W)
+        self.description_entry.bind("<KeyRelease>", self.schedule_suggestion)
+        self.suggestion_job = None
+
+        button_frame = ttk.Frame(input_frame)
+        button_frame.grid(row=5, column=0, columnspan=3, pady=10)
+
+        save_btn = ttk.Button(button_frame, text="Išsaugoti", command=self.save_transaction)
+        save_btn.pack(side=tk.LEFT, padx=5)
+
+        clear_btn = ttk.Button(button_frame, text="Išvalyti", command=self.clear_fields)
+        clear_btn.pack(side=tk.LEFT, padx=5)
+
+        manage_cat_btn = ttk.Button(button_frame, text="Valdyti kategorijas", command=self.manage_categories)
+        manage_cat_btn.pack(side=tk.LEFT, padx=5)
+
+        analysis_frame = ttk.LabelFrame(main_frame, text="Analizė", padding="10")
+        analysis_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+
+        self.figure_frame = ttk.Frame(analysis_frame)
+        self.figure_frame.pack(fill=tk.BOTH, expand=True)
+        # The chart (and matplotlib with it) is created when the first report arrives
+        self.chart = None
+        self.chart_placeholder = ttk.Label(self.figure_frame, text="Įkeliama diagrama...")
+        self.chart_placeholder.pack(expand=True)
+        self.report_cache = {}
+
+        control_frame = ttk.Frame(analysis_frame)
+        control_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(control_frame, text="Ataskaita:").pack(side=tk.LEFT)
+        self.report_type = tk.StringVar(value="expenses_by_category")
+        reports = [
+            ("Išlaidų kategorijos", "expenses_by_category"),
+            ("Pajamų kategorijos", "income_by_category"),
+            ("Mėnesio išlaidos", "monthly_expenses"),
+            ("Mėnesio pajamos", "monthly_income"),
+            ("Balansas", "balance"),
+            ("Sukauptas balansas", "cumulative_balance"),
+            ("Vidurkis 3 mėn.", "moving_average_3"),
+            ("Vidurkis 12 mėn.", "moving_average_12"),
+            ("Metų palyginimas", "year_over_year")
+        ]
+
+        for text, value in reports:
+            ttk.Radiobutton(control_frame, text=text, variable=self.report_type,
+                            value=value, command=self.update_chart).pack(side=tk.LEFT, padx=5)
+
+        list_frame = ttk.LabelFrame(main_frame, text="Operacijos", padding="10")
+        list_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+
+        self.transaction_list = TransactionList(list_frame, self.store, self.worker,
+                                                lambda: self.timer.mark("operacijų sąrašas"))
+        self.tree = self.transaction_list.tree
+
+        manage_frame = ttk.Frame(list_frame)
+        manage_frame.pack(fill=tk.X, pady=5)
+
+        delete_btn = ttk.Button(manage_frame, text="Ištrinti", command=self.delete_transaction)
+        delete_btn.pack(side=tk.LEFT, padx=5)
+
+        filter_frame = ttk.Frame(list_frame)
+        filter_frame.pack(fill=tk.X)
+
+        ttk.Label(filter_frame, text="Paieška:").grid(row=0, column=0, sticky=tk.W)
+        self.search_entry = ttk.Entry(filter_frame, width=30)
+        self.search_entry.grid(row=0, column=1, columnspan=3, padx=5, pady=2, sticky=tk.W + tk.E)
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
+        self.search_job = None
+
+        ttk.Label(filter_frame, text="Mėnuo:").grid(row=0, column=4, sticky=tk.W)
+        self.filter_month = ttk.Combobox(filter_frame, width=10, state="readonly")
+        self.filter_month.grid(row=0, column=5, padx=5, pady=2, sticky=tk.W)
+        self.filter_month.bind("<<ComboboxSelected>>", self.select_filter_month)
+
+        ttk.Label(filter_frame, text="Tipas:").grid(row=0, column=6, sticky=tk.W)
+        self.filter_type = ttk.Combobox(filter_frame, values=list(FILTER_TYPES), width=10, state="readonly")
+        self.filter_type.current(0)
+        self.filter_type.grid(row=0, column=7, padx=5, pady=2, sticky=tk.W)
+        self.filter_type.bind("<<ComboboxSelected>>", self.filter_transactions)
+
+        ttk.Label(filter_frame, text="Kategorijos:").grid(row=0, column=8, sticky=tk.W)
+        self.filter_category_button = ttk.Menubutton(filter_frame, text="Visos", width=15)
+        self.filter_category_menu = tk.Menu(self.filter_category_button, tearoff=0)
+        self.filter_category_button['menu'] = self.filter_category_menu
+        self.filter_category_button.grid(row=0, column=9, padx=5, pady=2, sticky=tk.W)
+        self.filter_categories = {}
+        self.update_filter_categories()
+
+        ttk.Label(filter_frame, text="Data nuo:").grid(row=1, column=0, sticky=tk.W)
+        self.filter_date_from = ttk.Entry(filter_frame, width=12)
+        self.filter_date_from.grid(row=1, column=1, padx=5, pady=2, sticky=tk.W)
+        ttk.Label(filter_frame, text="iki:").grid(row=1, column=2, sticky=tk.W)
+        self.filter_date_to = ttk.Entry(filter_frame, width=12)
+        self.filter_date_to.grid(row=1, column=3, padx=5, pady=2, sticky=tk.W)
+
+        ttk.Label(filter_frame, text="Suma nuo:").grid(row=1, column=4, sticky=tk.W)
+        self.filter_amount_min = ttk.Entry(filter_frame, width=12)
+        self.filter_amount_min.grid(row=1, column=5, padx=5, pady=2, sticky=tk.W)
+        ttk.Label(filter_frame, text="iki:").grid(row=1, column=6, sticky=tk.W)
+        self.filter_amount_max = ttk.Entry(filter_frame, width=12)
+        self.filter_amount_max.grid(row=1, column=7, padx=5, pady=2, sticky=tk.W)
+
+        for entry in (self.filter_date_from, self.filter_date_to, self.filter_amount_min, self.filter_amount_max):
+            entry.bind("<Return>", self.filter_transactions)
+
+        filter_btn = ttk.Button(filter_frame, text="Filtruoti", command=self.filter_transactions)
+        filter_btn.grid(row=1, column=8, padx=5, pady=2)
+
+        clear_filter_btn = ttk.Button(filter_frame, text="Išvalyti filtrą", command=self.clear_filter)
+        clear_filter_btn.grid(row=1, column=9, padx=5, pady=2)
+
+    def toggle_diagnostics(self, event=None):
+        if self.diagnostics is None:
+            self.diagnostics = DiagnosticsWindow(self.root, self.toggle_diagnostics)
+        else:
+            self.diagnostics.destroy()
+            self.diagnostics = None
+        self.diagnostics_visible.set(self.diagnostics is not None)
+
+    def update_category_combobox(self, *args):
+        categories = self.store.categories.of_type(self.transaction_type.get())
+        self.category_ids = [category_id for category_id, _ in categories]
+        self.category_combobox['values'] = [name for _, name in categories]
+        if categories:
+            self.category_combobox.current(0)
+
+    def change_transaction_type(self, *args):
+        self.category_chosen = False
+        self.update_category_combobox()
+        self.suggest_category()
+
+    def choose_category(self, event=None):
+        self.category_chosen = True
+        self.suggestion_label.config(text="")
+
+    def schedule_suggestion(self, event=None):
+        if self.suggestion_job is not None:
+            self.root.after_cancel(self.suggestion_job)
+        self.suggestion_job = self.root.after(SUGGEST_DELAY_MS, self.suggest_category)
+
+    def suggest_category(self):
+        # Runs on the Tk thread: one pass over the description and a few dictionary lookups
+        self.suggestion_job = None
+        if self.classifier is None or self.category_chosen:
+            return
+        try:
+            amount_cents = to_cents(self.amount_entry.get())
+        except ValueError:
+            amount_cents = None
+        category_id = self.classifier.suggest(self.description_entry.get(), amount_cents,
+                                              self.transaction_type.get())
+        if category_id in self.category_ids:
+            self.category_combobox.current(self.category_ids.index(category_id))
+            self.suggestion_label.config(text="Pasiūlyta pagal aprašymą")
+        else:
+            self.suggestion_label.config(text="")
+
+    def load_classifier(self):
+        self.worker.submit('classifier', load_classifier, self.set_classifier, self.show_background_error)
+
+    def set_classifier(self, classifier):
+        self.classifier = classifier
+
+    def save_transaction(self):
+        try:
+            date = datetime.strptime(self.date_entry.get(), "%Y-%m-%d").date()
+            amount_cents = to_cents(self.amount_entry.get())
+            selected = self.category_combobox.current()
+            description = self.description_entry.get()
+            transaction_type = self.transaction_type.get()
+
+            if selected < 0:
+                messagebox.showwarning("Klaida", "Pasirinkite kategoriją")
+                return
+
+            transaction = Transaction(
+                date=date,
+                amount_cents=amount_cents,
+                category_id=self.category_ids[selected],
+                transaction_type=transaction_type,
+                description=description
+            )
+
+            self.store.add(transaction)
+
+            messagebox.showinfo("Sėkmingai", "Operacija išsaugota")
+            if transaction_type == 'expense':
+                self.check_budget(transaction.category_id, f"{date:%Y-%m}")
+            self.clear_fields()
+        except ValueError as e:
+            messagebox.showerror("Klaida", f"Neteisingi duomenys: {str(e)}")
+        except SQLAlchemyError as e:
+            messagebox.showerror("Klaida", f"Nepavyko įrašyti: {e}")
+
+    def clear_fields(self):
+        self.date_entry.delete(0, tk.END)
+        self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
+        self.amount_entry.delete(0, tk.END)
+        self.description_entry.delete(0, tk.END)
+        self.category_chosen = False
+        self.suggestion_label.config(text="")
+        self.update_category_combobox()
+
+    def check_budget(self, category_id, month):
+        for usage in self.store.budget_usage(month, category_id):
+            if exceeded(usage):
+                messagebox.showwarning(
+                    "Biudžetas viršytas",
+                    f"{self.store.categories.name(category_id)}: {month} išleista {format_cents(usage.spent_cents)} "
+                    f"iš {format_cents(usage.limit_cents)}")
+
+    def materialize_recurring(self):
+        # A locked database (another instance importing) only postpones the occurrences to
+        # the next run, so the error is shown and the count taken as none
+        try:
+            return self.store.materialize_recurring(date.today())
+        except SQLAlchemyError as e:
+            messagebox.showerror("Klaida", f"Nepavyko sukurti pasikartojančių operacijų: {e}")
+            return 0
+
+    def run_recurring(self):
+        try:
+            if self.materialize_recurring():
+                self.update_data()
+        finally:
+            # Re-armed whatever happened, or no occurrence would be created for the rest of the session
+            self.recurring_job = self.root.after(RECURRING_INTERVAL_MS, self.run_recurring)
+
+    def update_data(self):
+        self.load_transactions()
+        self.update_chart()
+        self.update_months()
+        self.update_filter_categories()
+
+    def on_transaction_change(self, change, row):
+        if change == 'rename':
+            self.transaction_list.rename_category(row)
+            self.update_chart()
+            return
+
+        if change == 'insert':
+            self.transaction_list.insert_row(row)
+            if self.classifier is not None:
+                self.classifier.learn(row.description, row.transaction_type, row.category_id)
+        else:
+            self.transaction_list.remove_row(row)
+        self.update_months()
+        self.update_chart()
+
+    def update_months(self):
+        self.worker.submit('months', lambda session: TransactionStore(session).months(), self.show_months)
+
+    def show_months(self, months):
+        self.filter_month['values'] = months
+        self.timer.mark("mėnesių sąrašas")
+
+    def show_background_error(self, error):
+        messagebox.showerror("Klaida", f"Nepavyko įkelti duomenų: {error}")
+
+    def load_transactions(self):
+        self.transaction_list.reload()
+
+    def update_chart(self):
+        key = (self.report_type.get(), self.store.version)
+        if key in self.report_cache:
+            self.worker.cancel('chart')
+            metrics.count("update_chart.cached")
+            with metrics.phase("update_chart.draw"):
+                self.chart.show(self.report_cache[key], key)
+            return
+
+        report_type = key[0]
+        requested = time.perf_counter()
+        self.worker.submit(
+            'chart',
+            chart_job(report_type),
+            lambda report: self.show_report(key, report, requested),
+            self.show_background_error
+        )
+
+    def show_report(self, key, report, requested=None):
+        with metrics.phase("update_chart.draw"):
+            if self.chart is None:
+                self.chart_placeholder.destroy()
+                self.chart = ReportChart(self.figure_frame)
+            if any(cached_version != key[1] for _, cached_version in self.report_cache):
+                self.report_cache.clear()
+                self.chart.invalidate()
+            self.report_cache[key] = report
+            self.chart.show(report, key)
+        if requested is not None:
+            metrics.record("update_chart", (time.perf_counter() - requested) * 1000)
+        self.timer.mark("diagrama")
+
+    def manage_categories(self):
+        cat_window = tk.Toplevel(self.root)
+        cat_window.title("Kategorijų valdymas")
+        cat_window.geometry("500x400")
+
+        list_frame = ttk.Frame(cat_window, padding="10")
+        list_frame.pack(fill=tk.BOTH, expand=True)
+
+        tree = ttk.Treeview(list_frame, columns=("name", "type"), show="headings")
+        tree.heading("name", text="Pavadinimas")
+        tree.heading("type", text="Tipas")
+        tree.column("name", width=200)
+        tree.column("type", width=100)
+        tree.pack(fill=tk.BOTH, expand=True)
+
+        for category_type in ("expense", "income"):
+            cat_type = "Pajamos" if category_type == "income" else "Išlaidos"
+            for category_id, name in self.store.categories.of_type(category_type):
+                tree.insert("", tk.END, values=(name, cat_type), iid=category_id)
+
+        button_frame = ttk.Frame(list_frame)
+        button_frame.pack(fill=tk.X, pady=5)
+
+        add_btn = ttk.Button(button_frame, text="Pridėti", command=lambda: self.add_category(cat_window, tree))
+        add_btn.pack(side=tk.LEFT, padx=5)
+
+        rename_btn = ttk.Button(button_frame, text="Pervadinti", command=lambda: self.rename_category(cat_window, tree))
+        rename_btn.pack(side=tk.LEFT, padx=5)
+
+        delete_btn = ttk.Button(button_frame, text="Ištrinti", command=lambda: self.delete_category(tree))
+        delete_btn.pack(side=tk.LEFT, padx=5)
+
+        close_btn = ttk.Button(button_frame, text="Uždaryti", command=cat_window.destroy)
+        close_btn.pack(side=tk.RIGHT, padx=5)
+
+    def add_category(self, parent_window, tree):
+        add_window = tk.Toplevel(parent_window)
+        add_window.title("Pridėti kategoriją")
+        add_window.geometry("300x200")
+
+        ttk.Label(add_window, text="Pavadinimas:").pack(pady=5)
+        name_entry = ttk.Entry(add_window, width=30)
+        name_entry.pack(pady=5)
+
+        ttk.Label(add_window, text="Tipas:").pack(pady=5)
+        cat_type = tk.StringVar(value="expense")
+        ttk.Radiobutton(add_window, text="Išlaidos", variable=cat_type, value="expense").pack()
+        ttk.Radiobutton(add_window, text="Pajamos", variable=cat_type, value="income").pack()
+
+        def save_category():
+            name = name_entry.get()
+            if not name:
+                messagebox.showwarning("Klaida", "Įveskite kategorijos pavadinimą")
+                return
+
+            try:
+                category = self.store.add_category(name, cat_type.get())
+            except SQLAlchemyError as e:
+                messagebox.showerror("Klaida", f"Nepavyko įrašyti: {e}", parent=add_window)
+                return
+
+            cat_type_display = "Pajamos" if cat_type.get() == "income" else "Išlaidos"
+            tree.insert("", tk.END, values=(name, cat_type_display), iid=category.id)
+
+            self.update_category_combobox()
+            self.update_filter_categories()
+
+            add_window.destroy()
+
+        save_btn = ttk.Button(add_window, text="Išsaugoti", command=save_category)
+        save_btn.pack(pady=10)
+
+    def delete_category(self, tree):
+        selected_item = tree.focus()
+        if not selected_item:
+            messagebox.showwarning("Klaida", "Pasirinkite kategoriją, kurią norite ištrinti")
+            return
+
+        transactions_count = (self.store.category_usage(int(selected_item))
+                              + archived_category_count(archive_dir(self.engine.url), int(selected_item)))
+
+        if transactions_count > 0:
+            messagebox.showwarning("Klaida",
+                                   f"Ši kategorija naudojama {transactions_count} operacijose. "
+                                   "Pirmiausia pakeiskite šių operacijų kategorijas.")
+            return
+
+        rules_count = self.store.category_rule_count(int(selected_item))
+        if rules_count > 0:
+            messagebox.showwarning("Klaida",
+                                   f"Ši kategorija naudojama {rules_count} pasikartojančiose operacijose. "
+                                   "Pirmiausia ištrinkite šias taisykles.")
+            return
+
+        if messagebox.askyesno("Patvirtinimas", "Ar tikrai norite ištrinti šią kategoriją?"):
+            try:
+                self.store.delete_category(int(selected_item))
+            except SQLAlchemyError as e:
+                messagebox.showerror("Klaida", f"Nepavyko ištrinti: {e}")
+                return
+            tree.delete(selected_item)
+
+            self.update_category_combobox()
+            self.update_filter_categories()
+
+    def rename_category(self, parent_window, tree):
+        selected_item = tree.focus()
+        if not selected_item:
+            messagebox.showwarning("Klaida", "Pasirinkite kategoriją, kurią norite pervadinti")
+            return
+
+        rename_window = tk.Toplevel(parent_window)
+        rename_window.title("Pervadinti kategoriją")
+        rename_window.geometry("300x120")
+
+        ttk.Label(rename_window, text="Naujas pavadinimas:").pack(pady=5)
+        name_entry = ttk.Entry(rename_window, width=30)
+        name_entry.insert(0, self.store.categories.name(int(selected_item)))
+        name_entry.pack(pady=5)
+
+        def save_name():
+            name = name_entry.get()
+            if not name:
+                messagebox.showwarning("Klaida", "Įveskite kategorijos pavadinimą")
+                return
+
+            try:
+                self.store.rename_category(int(selected_item), name)
+            except SQLAlchemyError as e:
+                messagebox.showerror("Klaida", f"Nepavyko įrašyti: {e}", parent=rename_window)
+                return
+            tree.set(selected_item, "name", name)
+
+            self.update_category_combobox()
+            self.update_filter_categories()
+
+            rename_window.destroy()
+
+        save_btn = ttk.Button(rename_window, text="Išsaugoti", command=save_name)
+        save_btn.pack(pady=10)
+
+    def manage_recurring(self):
+        rules_window = tk.Toplevel(self.root)
+        rules_window.title("Pasikartojančios operacijos")
+        rules_window.geometry("800x400")
+
+        list_frame = ttk.Frame(rules_window, padding="10")
+        list_frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = ("description", "category", "amount", "schedule", "next_date")
+        tree = ttk.Treeview(list_frame, columns=columns, show="headings")
+        for column, heading, width in zip(columns, ("Aprašymas", "Kategorija", "Suma", "Periodiškumas", "Kita data"),
+                                          (200, 120, 100, 150, 100)):
+            tree.heading(column, text=heading)
+            tree.column(column, width=width)
+        tree.pack(fill=tk.BOTH, expand=True)
+
+        for rule in self.store.recurring_rules():
+            self.insert_rule_row(tree, rule)
+
+        button_frame = ttk.Frame(list_frame)
+        button_frame.pack(fill=tk.X, pady=5)
+
+        add_btn = ttk.Button(button_frame, text="Pridėti", command=lambda: self.add_recurring_rule(rules_window, tree))
+        add_btn.pack(side=tk.LEFT, padx=5)
+
+        delete_btn = ttk.Button(button_frame, text="Ištrinti", command=lambda: self.delete_recurring_rule(tree))
+        delete_btn.pack(side=tk.LEFT, padx=5)
+
+        close_btn = ttk.Button(button_frame, text="Uždaryti", command=rules_window.destroy)
+        close_btn.pack(side=tk.RIGHT, padx=5)
+
+    def insert_rule_row(self, tree, rule):
+        sign = '+' if rule.transaction_type == 'income' else '-'
+        next_date = rule.next_date.strftime("%Y-%m-%d") if rule.next_date is not None else "Baigta"
+        tree.insert("", tk.END, iid=rule.id, values=(
+            rule.description, self.store.categories.name(rule.category_id),
+            f"{sign}{format_cents(rule.amount_cents)}", describe_schedule(rule.schedule), next_date))
+
+    def add_recurring_rule(self, parent_window, tree):
+        add_window = tk.Toplevel(parent_window)
+        add_window.title("Pridėti pasikartojančią operaciją")
+        add_window.geometry("350x480")
+
+        transaction_type = tk.StringVar(value="expense")
+        ttk.Label(add_window, text="Tipas:").pack(pady=5)
+        ttk.Radiobutton(add_window, text="Išlaidos", variable=transaction_type, value="expense").pack()
+        ttk.Radiobutton(add_window, text="Pajamos", variable=transaction_type, value="income").pack()
+
+        ttk.Label(add_window, text="Kategorija:").pack(pady=5)
+        category_combobox = ttk.Combobox(add_window, width=27, state="readonly")
+        category_combobox.pack(pady=5)
+        category_ids = []
+
+        def update_categories(*args):
+            categories = self.store.categories.of_type(transaction_type.get())
+            category_ids[:] = [category_id for category_id, _ in categories]
+            category_combobox['values'] = [name for _, name in categories]
+            if categories:
+                category_combobox.current(0)
+
+        transaction_type.trace_add('write', update_categories)
+        update_categories()
+
+        entries = {}
+        for key, label, default in (("amount", "Suma:", ""),
+                                    ("description", "Aprašymas:", ""),
+                                    ("start_date", "Pradžia (YYYY-MM-DD):", datetime.now().strftime("%Y-%m-%d")),
+                                    ("end_date", "Pabaiga (nebūtina):", "")):
+            ttk.Label(add_window, text=label).pack(pady=2)
+            entries[key] = ttk.Entry(add_window, width=30)
+            entries[key].insert(0, default)
+            entries[key].pack(pady=2)
+
+        ttk.Label(add_window, text="Periodiškumas (arba cron: diena mėnuo savaitės_diena):").pack(pady=2)
+        schedule_combobox = ttk.Combobox(add_window, width=27, values=list(SCHEDULES.values()))
+        schedule_combobox.current(0)
+        schedule_combobox.pack(pady=2)
+
+        def save_rule():
+            try:
+                if category_combobox.current() < 0:
+                    messagebox.showwarning("Klaida", "Pasirinkite kategoriją", parent=add_window)
+                    return
+                schedule = schedule_combobox.get().strip()
+                schedule = {label: key for key, label in SCHEDULES.items()}.get(schedule, schedule)
+                end_date = entries["end_date"].get().strip()
+                rule = RecurringRule(
+                    category_id=category_ids[category_combobox.current()],
+                    transaction_type=transaction_type.get(),
+                    amount_cents=to_cents(entries["amount"].get()),
+                    description=entries["description"].get(),
+                    schedule=schedule,
+                    start_date=datetime.strptime(entries["start_date"].get(), "%Y-%m-%d").date(),
+                    end_date=datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+                )
+                self.store.add_recurring_rule(rule)
+            except ValueError as e:
+                messagebox.showerror("Klaida", f"Neteisingi duomenys: {str(e)}", parent=add_window)
+                return
+            except SQLAlchemyError as e:
+                messagebox.showerror("Klaida", f"Nepavyko įrašyti: {e}", parent=add_window)
+                return
+
+            add_window.destroy()
+            if self.materialize_recurring():
+                self.update_data()
+            tree.delete(*tree.get_children())
+            for rule in self.store.recurring_rules():
+                self.insert_rule_row(tree, rule)
+
+        save_btn = ttk.Button(add_window, text="Išsaugoti", command=save_rule)
+        save_btn.pack(pady=10)
+
+    def delete_recurring_rule(self, tree):
+        selected_item = tree.focus()
+        if not selected_item:
+            messagebox.showwarning("Klaida", "Pasirinkite taisyklę, kurią norite ištrinti")
+            return
+
+        # Occurrences already created stay; only future ones are no longer generated
+        if messagebox.askyesno("Patvirtinimas", "Ar tikrai norite ištrinti šią taisyklę? "
+                                                "Jau sukurtos operacijos liks."):
+            try:
+                self.store.delete_recurring_rule(int(selected_item))
+            except SQLAlchemyError as e:
+                messagebox.showerror("Klaida", f"Nepavyko ištrinti: {e}")
+                return
+            tree.delete(selected_item)
+
+    def manage_budgets(self):
+        budget_window = tk.Toplevel(self.root)
+        budget_window.title("Biudžetai")
+        budget_window.geometry("500x400")
+        month = datetime.now().strftime("%Y-%m")
+
+        list_frame = ttk.Frame(budget_window, padding="10")
+        list_frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Label(list_frame, text=f"Išlaidos per {month}").pack(anchor=tk.W)
+        columns = ("category", "limit", "spent")
+        tree = ttk.Treeview(list_frame, columns=columns, show="headings")
+        for column, heading, width in zip(columns, ("Kategorija", "Biudžetas", "Išleista"), (200, 100, 100)):
+            tree.heading(column, text=heading)
+            tree.column(column, width=width)
+        tree.tag_configure('exceeded', foreground='red')
+        tree.pack(fill=tk.BOTH, expand=True)
+
+        def show_budgets():
+            usage = {row.category_id: row for row in self.store.budget_usage(month)}
+            tree.delete(*tree.get_children())
+            for category_id, name in self.store.categories.of_type('expense'):
+                row = usage.get(category_id)
+                if row is None:
+                    tree.insert("", tk.END, iid=category_id, values=(name, "", ""))
+                else:
+                    tree.insert("", tk.END, iid=category_id, tags=('exceeded',) if exceeded(row) else (),
+                                values=(name, format_cents(row.limit_cents), format_cents(row.spent_cents)))
+
+        def set_limit():
+            selected_item = tree.focus()
+            if not selected_item:
+                messagebox.showwarning("Klaida", "Pasirinkite kategoriją", parent=budget_window)
+                return
+
+            limit_window = tk.Toplevel(budget_window)
+            limit_window.title("Mėnesio biudžetas")
+            limit_window.geometry("300x120")
+
+            ttk.Label(limit_window, text="Suma per mėnesį:").pack(pady=5)
+            limit_entry = ttk.Entry(limit_window, width=30)
+            limit_entry.insert(0, tree.set(selected_item, "limit"))
+            limit_entry.pack(pady=5)
+
+            def save_limit():
+                try:
+                    self.store.set_budget(int(selected_item), to_cents(limit_entry.get()))
+                except ValueError as e:
+                    messagebox.showerror("Klaida", f"Neteisingi duomenys: {str(e)}", parent=limit_window)
+                    return
+                except SQLAlchemyError as e:
+                    messagebox.showerror("Klaida", f"Nepavyko įrašyti: {e}", parent=limit_window)
+                    return
+                show_budgets()
+                limit_window.destroy()
+
+            ttk.Button(limit_window, text="Išsaugoti", command=save_limit).pack(pady=10)
+
+        def remove_limit():
+            selected_item = tree.focus()
+            if selected_item:
+                try:
+                    self.store.remove_budget(int(selected_item))
+                except SQLAlchemyError as e:
+                    messagebox.showerror("Klaida", f"Nepavyko ištrinti: {e}", parent=budget_window)
+                    return
+                show_budgets()
+
+        show_budgets()
+
+        button_frame = ttk.Frame(list_frame)
+        button_frame.pack(fill=tk.X, pady=5)
+
+        set_btn = ttk.Button(button_frame, text="Nustatyti", command=set_limit)
+        set_btn.pack(side=tk.LEFT, padx=5)
+
+        remove_btn = ttk.Button(button_frame, text="Pašalinti", command=remove_limit)
+        remove_btn.pack(side=tk.LEFT, padx=5)
+
+        close_btn = ttk.Button(button_frame, text="Uždaryti", command=budget_window.destroy)
+        close_btn.pack(side=tk.RIGHT, padx=5)
+
+    def manage_category_rules(self):
+        rules_window = tk.Toplevel(self.root)
+        rules_window.title("Kategorizavimo taisyklės")
+        rules_window.geometry("800x400")
+
+        list_frame = ttk.Frame(rules_window, padding="10")
+        list_frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Label(list_frame, text="Taisyklės tikrinamos pagal prioritetą; aprašymai, kuriems netinka nė viena, "
+                                   "kategorizuojami pagal ankstesnes operacijas.").pack(anchor=tk.W)
+        columns = ("category", "kind", "pattern", "amounts", "priority")
+        tree = ttk.Treeview(list_frame, columns=columns, show="headings")
+        for column, heading, width in zip(columns, ("Kategorija", "Rūšis", "Šablonas", "Sumos", "Prioritetas"),
+                                          (150, 150, 250, 150, 80)):
+            tree.heading(column, text=heading)
+            tree.column(column, width=width)
+        tree.pack(fill=tk.BOTH, expand=True)
+
+        def show_rules():
+            tree.delete(*tree.get_children())
+            for rule in self.store.category_rules():
+                tree.insert("", tk.END, iid=rule.id, values=(
+                    self.store.categories.name(rule.category_id), RULE_KINDS[rule.kind], rule.pattern or "",
+                    describe_amounts(rule), rule.priority))
+
+        def delete_rule():
+            selected_item = tree.focus()
+            if not selected_item:
+                messagebox.showwarning("Klaida", "Pasirinkite taisyklę, kurią norite ištrinti", parent=rules_window)
+                return
+            try:
+                self.store.delete_category_rule(int(selected_item))
+            except SQLAlchemyError as e:
+                messagebox.showerror("Klaida", f"Nepavyko ištrinti: {e}", parent=rules_window)
+                return
+            tree.delete(selected_item)
+            self.load_classifier()
+
+        show_rules()
+
+        button_frame = ttk.Frame(list_frame)
+        button_frame.pack(fill=tk.X, pady=5)
+
+        add_btn = ttk.Button(button_frame, text="Pridėti",
+                             command=lambda: self.add_category_rule(rules_window, show_rules))
+        add_btn.pack(side=tk.LEFT, padx=5)
+
+        delete_btn = ttk.Button(button_frame, text="Ištrinti", command=delete_rule)
+        delete_btn.pack(side=tk.LEFT, padx=5)
+
+        reclassify_btn = ttk.Button(button_frame, text="Perkategorizuoti nepriskirtas",
+                                    command=lambda: self.reclassify_transactions(rules_window))
+        reclassify_btn.pack(side=tk.LEFT, padx=5)
+
+        close_btn = ttk.Button(button_frame, text="Uždaryti", command=rules_window.destroy)
+        close_btn.pack(side=tk.RIGHT, padx=5)
+
+    def add_category_rule(self, parent_window, on_saved):
+        add_window = tk.Toplevel(parent_window)
+        add_window.title("Pridėti kategorizavimo taisyklę")
+        add_window.geometry("350x480")
+
+        transaction_type = tk.StringVar(value="expense")
+        ttk.Label(add_window, text="Tipas:").pack(pady=5)
+        ttk.Radiobutton(add_window, text="Išlaidos", variable=transaction_type, value="expense").pack()
+        ttk.Radiobutton(add_window, text="Pajamos", variable=transaction_type, value="income").pack()
+
+        ttk.Label(add_window, text="Kategorija:").pack(pady=5)
+        category_combobox = ttk.Combobox(add_window, width=27, state="readonly")
+        category_combobox.pack(pady=5)
+        category_ids = []
+
+        def update_categories(*args):
+            categories = self.store.categories.of_type(transaction_type.get())
+            category_ids[:] = [category_id for category_id, _ in categories]
+            category_combobox['values'] = [name for _, name in categories]
+            if categories:
+                category_combobox.current(0)
+
+        transaction_type.trace_add('write', update_categories)
+        update_categories()
+
+        ttk.Label(add_window, text="Rūšis:").pack(pady=2)
+        kind_combobox = ttk.Combobox(add_window, width=27, state="readonly", values=list(RULE_KINDS.values()))
+        kind_combobox.current(0)
+        kind_combobox.pack(pady=2)
+
+        entries = {}
+        for key, label, default in (("pattern", "Raktažodis arba išraiška:", ""),
+                                    ("amount_min", "Suma nuo (nebūtina):", ""),
+                                    ("amount_max", "Suma iki (nebūtina):", ""),
+                                    ("priority", "Prioritetas (mažesnis tikrinamas anksčiau):", "0")):
+            ttk.Label(add_window, text=label).pack(pady=2)
+            entries[key] = ttk.Entry(add_window, width=30)
+            entries[key].insert(0, default)
+            entries[key].pack(pady=2)
+
+        def read_amount(key):
+            value = entries[key].get().strip()
+            return to_cents(value) if value else None
+
+        def save_rule():
+            try:
+                if category_combobox.current() < 0:
+                    messagebox.showwarning("Klaida", "Pasirinkite kategoriją", parent=add_window)
+                    return
+                rule = CategoryRule(
+                    category_id=category_ids[category_combobox.current()],
+                    transaction_type=transaction_type.get(),
+                    kind=list(RULE_KINDS)[kind_combobox.current()],
+                    pattern=entries["pattern"].get().strip() or None,
+                    amount_min_cents=read_amount("amount_min"),
+                    amount_max_cents=read_amount("amount_max"),
+                    priority=int(entries["priority"].get() or 0)
+                )
+                self.store.add_category_rule(rule)
+            except ValueError as e:
+                messagebox.showerror("Klaida", f"Neteisingi duomenys: {str(e)}", parent=add_window)
+                return
+            except SQLAlchemyError as e:
+                messagebox.showerror("Klaida", f"Nepavyko įrašyti: {e}", parent=add_window)
+                return
+
+            add_window.destroy()
+            on_saved()
+            self.load_classifier()
+
+        save_btn = ttk.Button(add_window, text="Išsaugoti", command=save_rule)
+        save_btn.pack(pady=10)
+
+    def reclassify_transactions(self, parent_window):
+        if not messagebox.askyesno("Patvirtinimas",
+                                   "Operacijos kategorijose „Kitos išlaidos“ ir „Kitos pajamos“ bus "
+                                   "perkategorizuotos pagal taisykles ir ankstesnes operacijas. Tęsti?",
+                                   parent=parent_window):
+            return
+
+        def show_result(moved):
+            self.store.refresh_version()
+            self.update_data()
+            self.load_classifier()
+            messagebox.showinfo("Sėkmingai", f"Perkategorizuota operacijų: {moved}", parent=parent_window)
+
+        # The worker's session is not used: reclassify runs in a transaction of its own on the shared engine
+        self.worker.submit('reclassify', lambda session: reclassify(self.engine), show_result,
+                           self.show_background_error)
+
+    def open_import_dialog(self):
+        path = filedialog.askopenfilename(parent=self.root, title="Banko išrašas",
+                                          filetypes=[("Banko išrašai", "*.csv *.ofx *.qfx"), ("Visi failai", "*.*")])
+        if not path:
+            return
+
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("Importuojama")
+        progress_window.geometry("400x100")
+        progress_window.transient(self.root)
+
+        progress_label = ttk.Label(progress_window, text="Skaitomas failas...")
+        progress_label.pack(pady=10)
+        progress_bar = ttk.Progressbar(progress_window, length=360, mode='determinate', maximum=100)
+        progress_bar.pack(pady=5)
+
+        updates = queue.Queue()
+
+        def run_import():
+            # The import thread checks its own connection out of the shared pool
+            try:
+                imported = import_statement(self.engine, path,
+                                            progress=lambda fraction, count: updates.put(('progress', fraction, count)))
+                updates.put(('done', 1.0, imported))
+            except Exception as e:
+                # Anything uncaught would end the thread silently and leave the dialog open
+                updates.put(('error', 0.0, str(e)))
+
+        def poll_updates():
+            # The dialog is gone after a ledger switch; the import itself still finishes
+            if not progress_window.winfo_exists():
+                return
+            try:
+                while True:
+                    kind, fraction, value = updates.get_nowait()
+                    if kind == 'progress':
+                        progress_bar['value'] = fraction * 100
+                        progress_label.config(text=f"Importuota operacijų: {value}")
+                        continue
+
+                    progress_window.destroy()
+                    if kind == 'error':
+                        messagebox.showerror("Klaida", f"Importuoti nepavyko: {value}")
+                    else:
+                        self.store.refresh_version()
+                        self.store.categories.invalidate()
+                        self.update_category_combobox()
+                        self.update_filter_categories()
+                        self.update_data()
+                        self.load_classifier()
+                        messagebox.showinfo("Sėkmingai", f"Importuota operacijų: {value}")
+                    return
+            except queue.Empty:
+                pass
+            self.root.after(100, poll_updates)
+
+        threading.Thread(target=run_import, daemon=True).start()
+        poll_updates()
+
+    def delete_transaction(self):
+        selected_item = self.tree.focus()
+        if not selected_item:
+            messagebox.showwarning("Klaida", "Pasirinkite operaciją, kurią norite ištrinti")
+            return
+
+        if messagebox.askyesno("Patvirtinimas", "Ar tikrai norite ištrinti šią operaciją?"):
+            try:
+                self.store.delete(int(selected_item))
+            except SQLAlchemyError as e:
+                messagebox.showerror("Klaida", f"Nepavyko ištrinti: {e}")
+
+    def get_months_list(self):
+        return self.store.months()
+
+    def get_all_categories(self):
+        return self.store.categories.of_type()
+
+    def update_filter_categories(self):
+        selected = {category_id for category_id, var in self.filter_categories.items() if var.get()}
+        self.filter_category_menu.delete(0, tk.END)
+        self.filter_categories = {}
+        for category_id, name in self.get_all_categories():
+            var = tk.BooleanVar(value=category_id in selected)
+            self.filter_category_menu.add_checkbutton(label=name, variable=var, command=self.filter_transactions)
+            self.filter_categories[category_id] = var
+
+    def select_filter_month(self, event=None):
+        date_from, date_to = month_range(self.filter_month.get())
+        for entry, value in ((self.filter_date_from, date_from), (self.filter_date_to, date_to)):
+            entry.delete(0, tk.END)
+            entry.insert(0, value.strftime("%Y-%m-%d"))
+        self.filter_transactions()
+
+    def schedule_search(self, event=None):
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DELAY_MS, self.filter_transactions)
+
+    def read_filter(self):
+        def parse_date(entry):
+            value = entry.get().strip()
+            return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+        def parse_amount(entry):
+            value = entry.get().strip()
+            return to_cents(value) if value else None
+
+        categories = tuple(category_id for category_id, var in self.filter_categories.items() if var.get())
+        return TransactionFilter(
+            date_from=parse_date(self.filter_date_from),
+            date_to=parse_date(self.filter_date_to),
+            amount_min=parse_amount(self.filter_amount_min),
+            amount_max=parse_amount(self.filter_amount_max),
+            categories=categories,
+            transaction_type=FILTER_TYPES[self.filter_type.get()],
+            search=self.search_entry.get().strip()
+        )
+
+    def filter_transactions(self, event=None):
+        self.search_job = None
+        try:
+            transaction_filter = self.read_filter()
+        except ValueError as e:
+            messagebox.showerror("Klaida", f"Neteisingas filtras: {str(e)}")
+            return
+
+        categories = transaction_filter.categories
+        if not categories:
+            self.filter_category_button.config(text="Visos")
+        elif len(categories) == 1:
+            self.filter_category_button.config(text=self.store.categories.name(categories[0]))
+        else:
+            self.filter_category_button.config(text=f"Pasirinkta: {len(categories)}")
+        self.transaction_list.set_filter(transaction_filter)
+
+    def clear_filter(self):
+        self.filter_month.set('')
+        self.filter_type.current(0)
+        for entry in (self.search_entry, self.filter_date_from, self.filter_date_to,
+                      self.filter_amount_min, self.filter_amount_max):
+            entry.delete(0, tk.END)
+        for var in self.filter_categories.values():
+            var.set(False)
+        self.filter_category_button.config(text="Visos")
+        self.transaction_list.set_filter(TransactionFilter())
+
+
+def ui_queries(store):
+    key = (datetime.now().date(), 0)
+    limit = TransactionList.PAGE_SIZE + 1
+    date_from, date_to = month_range(datetime.now().strftime("%Y-%m"))
+    # Any category ids will do: only the query plans are inspected
+    category, other_category = 1, 2
+    month_filter = TransactionFilter(date_from=date_from, date_to=date_to)
+    category_filter = TransactionFilter(categories=(category,))
+    combined_filter = TransactionFilter(date_from=date_from, date_to=date_to, categories=(category, other_category),
+                                        transaction_type='expense', amount_min=1000)
+    search_filter = TransactionFilter(search='parduotuvė')
+    rare_match = SearchMatch(list(range(1, 50)), ['parduotuvė'])
+    return [
+        ("Operacijų sąrašas", store.page_query(limit=limit)),
+        ("Kitas puslapis", store.page_query(after=key, limit=limit)),
+        ("Ankstesnis puslapis", store.page_query(before=key, limit=limit)),
+        ("Filtras pagal mėnesį", store.page_query(filter_criteria(month_filter), limit=limit)),
+        ("Filtras pagal kategoriją", store.page_query(filter_criteria(category_filter), limit=limit)),
+        ("Filtras pagal datą, kategorijas, tipą ir sumą",
+         store.page_query(filter_criteria(combined_filter), limit=limit)),
+        ("Filtruotų operacijų skaičius", store.count_query(filter_criteria(combined_filter))),
+        ("Paieška (retas žodis)", store.page_query(filter_criteria(search_filter, rare_match), limit=limit)),
+        ("Paieška (dažnas žodis)", store.page_query(filter_criteria(search_filter), limit=limit)),
+        ("Kategorijos naudojimas", store.category_usage_query(category)),
+        ("Mėnesių sąrašas", store.session.query(MonthlySummary.month).distinct()),
+    ]
+
+
+def explain_query(session, query):
+    compiled = query.statement.compile(dialect=session.bind.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    return [row[-1] for row in rows]
+
+
+def is_full_scan(detail):
+    # "SCAN transactions" without "USING ... INDEX" means every row is visited
+    return re.fullmatch(r'SCAN \w+', detail) is not None
+
+
+def explain_ui_queries(engine):
+    upgrade_schema(engine)
+    session = sessionmaker(bind=engine)()
+    store = TransactionStore(session)
+    full_scans = 0
+    for name, query in ui_queries(store):
+        details = explain_query(session, query)
+        scans = [detail for detail in details if is_full_scan(detail)]
+        full_scans += len(scans)
+        print(f"{name}: {'PILNAS SKENAVIMAS' if scans else 'naudoja indeksą'}")
+        for detail in details:
+            print(f"    {detail}")
+    session.close()
+    return 1 if full_scans else 0
+
+
+def import_from_command_line(engine, path, file_format=None):
+    upgrade_schema(engine)
+    started = time.perf_counter()
+
+    def report(fraction, imported):
+        print(f"\rImportuota operacijų: {imported} ({fraction:.0%})", end='', file=sys.stderr, flush=True)
+
+    try:
+        imported = import_statement(engine, path, file_format, progress=report)
+    except (ValueError, OSError, SQLAlchemyError) as e:
+        print(f"\nImportuoti nepavyko: {e}", file=sys.stderr)
+        return 1
+
+    elapsed = time.perf_counter() - started
+    print(f"\nImportuota operacijų: {imported} per {elapsed:.1f} s", file=sys.stderr)
+    return 0
+
+
+def recurring_from_command_line(engine):
+    upgrade_schema(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        started = time.perf_counter()
+        created = TransactionStore(session).materialize_recurring(date.today())
+        print(f"Sukurta operacijų: {created} per {time.perf_counter() - started:.2f} s", file=sys.stderr)
+    finally:
+        session.close()
+        engine.dispose()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Finansų sekiklis")
+    parser.add_argument('--db', help="duomenų bazės adresas; numatytoji – pirmoji knyga iš ledgers.json")
+    parser.add_argument('--ledger', help="knygos pavadinimas iš ledgers.json")
+    parser.add_argument('--startup-timing', action='store_true', help="spausdinti paleidimo etapų trukmę")
+    parser.add_argument('--slow-query-ms', type=float,
+                        help="nuo kokios trukmės užklausos registruojamos kaip lėtos (numatytoji "
+                             f"{metrics.slow_query_ms:g} ms arba FINANCE_TRACKER_SLOW_QUERY_MS)")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('explain', help="patikrinti, ar sąsajos užklausos naudoja indeksus")
+    import_parser = subparsers.add_parser('import', help="importuoti banko išrašą (CSV arba OFX)")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=['csv', 'ofx'])
+    subparsers.add_parser('recurring', help="sukurti suėjusias pasikartojančias operacijas")
+    args = parser.parse_args(argv)
+
+    if args.slow_query_ms is not None:
+        metrics.slow_query_ms = args.slow_query_ms
+
+    if args.db is not None:
+        ledger, database_url = args.db, args.db
+    else:
+        try:
+            ledger, database_url = resolve_ledger(args.ledger)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.command == 'explain':
+        return explain_ui_queries(create_database_engine(database_url))
+
+    if args.command == 'import':
+        return import_from_command_line(create_database_engine(database_url), args.path, args.format)
+
+    if args.command == 'recurring':
+        return recurring_from_command_line(create_database_engine(database_url))
+
+    timer = StartupTimer(args.startup_timing)
+    timer.mark("moduliai")
+    root = tk.Tk()
+    app = FinanceTracker(root, ledger, database_url, timer)
+    root.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,170 @@
+from sqlalchemy import func, inspect
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, SchemaVersion
+
+# Steps carry their own SQL for the tables as they were when each step was written, never the
+# live models or summary code: those move on, and an old database must still upgrade step by
+# step. create_all runs first and may already have made a table in its newest shape, so a
+# step that needs an older shape checks the columns it finds.
+
+# Trigram search index and triggers, as create_description_search_index made them. The triggers
+# keep the index in step with every write path, including bulk imports
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5("
+    "description, content='transactions', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN "
+    "INSERT INTO transactions_fts(rowid, description) VALUES (new.id, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN "
+    "INSERT INTO transactions_fts(transactions_fts, rowid, description) "
+    "VALUES ('delete', old.id, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF description ON transactions BEGIN "
+    "INSERT INTO transactions_fts(transactions_fts, rowid, description) "
+    "VALUES ('delete', old.id, old.description); "
+    "INSERT INTO transactions_fts(rowid, description) VALUES (new.id, new.description); END",
+    "INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')",
+]
+
+
+def transaction_columns(connection):
+    return {column['name'] for column in inspect(connection).get_columns('transactions')}
+
+
+def replace_summaries(connection, key, key_type, total, total_type, amount, running=False):
+    # Summaries are derived data, so each of their shapes is recreated and refilled from
+    # the transactions table rather than altered
+    month = "to_char(date, 'YYYY-MM')" if connection.dialect.name == 'postgresql' else "strftime('%Y-%m', date)"
+    columns = (f"month VARCHAR NOT NULL, {key} {key_type} NOT NULL, transaction_type VARCHAR NOT NULL, "
+               f"{total} {total_type} NOT NULL, count INTEGER NOT NULL")
+    names = f"month, {key}, transaction_type, {total}, count"
+    rows = (f"SELECT {month} AS month, {key}, transaction_type, sum({amount}) AS total, count(id) AS count "
+            f"FROM transactions GROUP BY {month}, {key}, transaction_type")
+    if running:
+        columns += ", cumulative_cents INTEGER NOT NULL DEFAULT 0"
+        names += ", cumulative_cents"
+        rows = (f"SELECT month, {key}, transaction_type, total, count, "
+                f"sum(total) OVER (PARTITION BY {key}, transaction_type ORDER BY month) FROM ({rows}) totals")
+
+    connection.exec_driver_sql("DROP TABLE IF EXISTS monthly_summaries")
+    connection.exec_driver_sql(
+        f"CREATE TABLE monthly_summaries ({columns}, PRIMARY KEY (month, {key}, transaction_type))")
+    connection.exec_driver_sql(f"INSERT INTO monthly_summaries ({names}) {rows}")
+
+
+def build_monthly_summaries(session):
+    connection = session.connection()
+    if {'amount', 'category'} <= transaction_columns(connection):
+        replace_summaries(connection, 'category', 'VARCHAR', 'total', 'FLOAT', 'amount')
+
+
+def create_transaction_indexes(session):
+    connection = session.connection()
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_transactions_date_id ON transactions (date, id)")
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_transactions_type_date ON transactions (transaction_type, date)")
+    if 'category' in transaction_columns(connection):
+        connection.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_transactions_category_date ON transactions (category, date)")
+
+
+def create_description_search_index(session):
+    if session.bind.dialect.name == 'sqlite':
+        for statement in SEARCH_INDEX_DDL:
+            session.connection().exec_driver_sql(statement)
+
+
+def analyze_statistics(session):
+    # Without sqlite_stat1 the planner may walk a non-selective category index instead
+    # of looking up a short list of search matches by id
+    if session.bind.dialect.name == 'sqlite':
+        session.connection().exec_driver_sql('ANALYZE')
+
+
+def convert_amounts_to_cents(session):
+    connection = session.connection()
+    columns = transaction_columns(connection)
+    if 'amount' in columns and 'amount_cents' not in columns:
+        connection.exec_driver_sql("ALTER TABLE transactions ADD COLUMN amount_cents INTEGER")
+        connection.exec_driver_sql("UPDATE transactions SET amount_cents = CAST(ROUND(amount * 100) AS INTEGER)")
+        connection.exec_driver_sql("ALTER TABLE transactions DROP COLUMN amount")
+    if 'category' in columns:
+        replace_summaries(connection, 'category', 'VARCHAR', 'total_cents', 'INTEGER', 'amount_cents')
+
+
+def link_transaction_categories(session):
+    # Category names are resolved per (name, type) pair; names that never had a
+    # categories row get one, so every existing transaction keeps its label
+    connection = session.connection()
+    columns = transaction_columns(connection)
+    if 'category' in columns and 'category_id' not in columns:
+        connection.exec_driver_sql(
+            "INSERT INTO categories (name, category_type) "
+            "SELECT DISTINCT category, transaction_type FROM transactions t WHERE category IS NOT NULL "
+            "AND NOT EXISTS (SELECT 1 FROM categories c "
+            "WHERE c.name = t.category AND c.category_type = t.transaction_type)")
+        connection.exec_driver_sql("ALTER TABLE transactions ADD COLUMN category_id INTEGER REFERENCES categories(id)")
+        connection.exec_driver_sql(
+            "UPDATE transactions SET category_id = (SELECT min(c.id) FROM categories c "
+            "WHERE c.name = transactions.category AND c.category_type = transactions.transaction_type)")
+        connection.exec_driver_sql("DROP INDEX IF EXISTS ix_transactions_category_date")
+        connection.exec_driver_sql("ALTER TABLE transactions DROP COLUMN category")
+
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_transactions_category_id_date ON transactions (category_id, date)")
+    replace_summaries(connection, 'category_id', 'INTEGER', 'total_cents', 'INTEGER', 'amount_cents')
+
+
+def add_running_totals(session):
+    replace_summaries(session.connection(), 'category_id', 'INTEGER', 'total_cents', 'INTEGER', 'amount_cents',
+                      running=True)
+
+
+def add_change_counter(session):
+    session.connection().exec_driver_sql(
+        "INSERT INTO ledger_state (id, version) SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM ledger_state)")
+
+
+def restore_search_trigger(session):
+    # A failed bulk import used to leave the insert trigger dropped, and every row added
+    # since then missing from the search index
+    if session.bind.dialect.name != 'sqlite':
+        return
+    connection = session.connection()
+    found = {name for name, in connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE name IN ('transactions_fts', 'transactions_fts_insert')")}
+    if found == {'transactions_fts'}:
+        for statement in SEARCH_INDEX_DDL:
+            connection.exec_driver_sql(statement)
+
+
+# Steps run in order, once per database; append new steps, never reorder or edit applied ones
+MIGRATIONS = [
+    build_monthly_summaries,
+    create_transaction_indexes,
+    create_description_search_index,
+    analyze_statistics,
+    convert_amounts_to_cents,
+    link_transaction_categories,
+    add_running_totals,
+    add_change_counter,
+    restore_search_trigger,
+]
+
+
+def current_version(session):
+    return session.query(func.max(SchemaVersion.version)).scalar() or 0
+
+
+def upgrade_schema(engine):
+    # create_all only adds missing tables; changes to existing tables need a migration step
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        version = current_version(session)
+        for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            step(session)
+            session.add(SchemaVersion(version=number))
+            session.commit()
+        return current_version(session)
+    finally:
+        session.close()
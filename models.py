@@ -0,0 +1,91 @@
+import os
+
+from sqlalchemy import Column, Integer, String, Date, Index, ForeignKey
+from sqlalchemy.ext.declarative import declarative_base
+
+# Any SQLAlchemy URL: an SQLite file or a server database such as PostgreSQL
+DATABASE_URL = os.environ.get('FINANCE_TRACKER_DB', 'sqlite:///finance_tracker.db')
+
+Base = declarative_base()
+
+
+class Transaction(Base):
+    __tablename__ = 'transactions'
+    id = Column(Integer, primary_key=True)
+    date = Column(Date)
+    amount_cents = Column(Integer)
+    category_id = Column(Integer, ForeignKey('categories.id'))
+    transaction_type = Column(String)
+    description = Column(String)
+
+    __table_args__ = (
+        Index('ix_transactions_date_id', 'date', 'id'),
+        Index('ix_transactions_category_id_date', 'category_id', 'date'),
+        Index('ix_transactions_type_date', 'transaction_type', 'date'),
+    )
+
+
+class Category(Base):
+    __tablename__ = 'categories'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    category_type = Column(String)
+
+
+class MonthlySummary(Base):
+    __tablename__ = 'monthly_summaries'
+    month = Column(String, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    transaction_type = Column(String, primary_key=True)
+    total_cents = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+    # Running total of the (category_id, transaction_type) series up to and including this month
+    cumulative_cents = Column(Integer, nullable=False, default=0)
+
+
+class RecurringRule(Base):
+    __tablename__ = 'recurring_rules'
+    id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, ForeignKey('categories.id'))
+    transaction_type = Column(String)
+    amount_cents = Column(Integer)
+    description = Column(String)
+    # 'monthly', 'weekly' or a cron-like "day-of-month month day-of-week" expression
+    schedule = Column(String, nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date)
+    # First occurrence not yet materialized; the evaluator only reads rules that are due
+    next_date = Column(Date, index=True)
+
+
+class CategoryRule(Base):
+    __tablename__ = 'category_rules'
+    id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, ForeignKey('categories.id'), nullable=False)
+    # Copied from the category, so the matcher is loaded without a join
+    transaction_type = Column(String, nullable=False)
+    # 'keyword' (a substring of the description) or 'regex'; without a pattern only the amount is checked
+    kind = Column(String, nullable=False, default='keyword')
+    pattern = Column(String)
+    amount_min_cents = Column(Integer)
+    amount_max_cents = Column(Integer)
+    # Lower numbers are tried first; equal priorities keep the order of creation
+    priority = Column(Integer, nullable=False, default=0)
+
+
+class Budget(Base):
+    __tablename__ = 'budgets'
+    category_id = Column(Integer, ForeignKey('categories.id'), primary_key=True)
+    limit_cents = Column(Integer, nullable=False)
+
+
+class LedgerState(Base):
+    __tablename__ = 'ledger_state'
+    id = Column(Integer, primary_key=True)
+    # Bumped by every write; other instances poll it to notice changes to the ledger
+    version = Column(Integer, nullable=False, default=0)
+
+
+class SchemaVersion(Base):
+    __tablename__ = 'schema_version'
+    version = Column(Integer, primary_key=True)
@@ -0,0 +1,45 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+import numpy as np
+
+# Amounts are stored as integer minor units (cents); floats only appear when plotting
+CENTS = 100
+# Cents must fit the 64-bit INTEGER columns and the int64 arrays used for formatting
+MAX_CENTS = 2 ** 63 - 1
+
+
+def to_cents(value):
+    if isinstance(value, int):
+        cents = value * CENTS
+    else:
+        if isinstance(value, str):
+            value = value.replace('\xa0', '').replace(' ', '').replace(',', '.')
+        try:
+            amount = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+        except (InvalidOperation, ValueError):
+            raise ValueError(f"neteisinga suma '{value}'") from None
+        # inf, nan and 1e400 parse fine but have no place in an INTEGER column
+        if not amount.is_finite() or abs(amount) > MAX_CENTS // CENTS:
+            raise ValueError(f"neteisinga suma '{value}'")
+        cents = int((amount * CENTS).to_integral_value(rounding=ROUND_HALF_UP))
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f"neteisinga suma '{value}'")
+    return cents
+
+
+def to_units(cents):
+    return np.asarray(cents, dtype=np.int64) / CENTS
+
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    units, fraction = divmod(abs(cents), CENTS)
+    return f"{sign}{units}.{fraction:02d}"
+
+
+def format_amounts(cents, signs):
+    # One vectorised pass over a page of rows instead of a format call per row
+    cents = np.abs(np.asarray(cents, dtype=np.int64))
+    units = (cents // CENTS).astype(str)
+    fractions = np.char.zfill((cents % CENTS).astype(str), 2)
+    return np.char.add(np.char.add(np.char.add(np.asarray(signs, dtype=str), units), '.'), fractions)
@@ -0,0 +1,170 @@
+import calendar
+from collections import Counter, namedtuple
+from datetime import timedelta
+from functools import lru_cache
+from operator import itemgetter
+
+from sqlalchemy import bindparam, insert, select, update
+
+from filters import deferred_search_indexing
+from models import Transaction, RecurringRule
+from summaries import apply_summary_deltas
+
+SCHEDULES = {
+    'monthly': 'Kas mėnesį',
+    'weekly': 'Kas savaitę',
+}
+# A cron expression that matches nothing within this many days is rejected as a typo
+MAX_SEARCH_DAYS = 366 * 8
+
+CronSchedule = namedtuple('CronSchedule', ['days', 'months', 'weekdays', 'any_day', 'any_weekday'])
+
+# (field name, lowest value, highest value) of the three date fields of a cron expression
+CRON_FIELDS = [
+    ('mėnesio diena', 1, 31),
+    ('mėnuo', 1, 12),
+    ('savaitės diena', 0, 7),
+]
+
+
+def parse_cron_field(text, name, low, high):
+    values = set()
+    for part in text.split(','):
+        value_range, _, step = part.partition('/')
+        if value_range == '*':
+            first, last = low, high
+        elif '-' in value_range:
+            first, last = (int(value) for value in value_range.split('-', 1))
+        else:
+            first = last = int(value_range)
+        step = int(step) if step else 1
+        if not (low <= first <= last <= high) or step < 1:
+            raise ValueError(f"neteisingas laukas „{name}“: {part}")
+        values.update(range(first, last + 1, step))
+    return frozenset(values)
+
+
+@lru_cache(maxsize=None)
+def parse_cron(expression):
+    # Standard cron syntax for the date part only: "dom mon dow", or the usual five fields
+    # with minute and hour ignored, since transactions carry no time of day
+    fields = expression.split()
+    if len(fields) == 5:
+        fields = fields[2:]
+    if len(fields) != 3:
+        raise ValueError(f"neteisinga cron išraiška „{expression}“")
+    try:
+        days, months, weekdays = (parse_cron_field(field, *spec) for field, spec in zip(fields, CRON_FIELDS))
+    except ValueError as e:
+        raise ValueError(f"neteisinga cron išraiška „{expression}“: {e}") from None
+    # cron counts Sunday as 0 or 7; Python's weekday() counts Monday as 0
+    weekdays = frozenset((weekday - 1) % 7 for weekday in weekdays)
+    return CronSchedule(days, months, weekdays, fields[0] == '*', fields[2] == '*')
+
+
+def cron_matches(schedule, day):
+    if day.month not in schedule.months:
+        return False
+    day_match = day.day in schedule.days
+    weekday_match = day.weekday() in schedule.weekdays
+    # As in cron, when both day fields are restricted either one may match
+    if schedule.any_day:
+        return weekday_match
+    if schedule.any_weekday:
+        return day_match
+    return day_match or weekday_match
+
+
+@lru_cache(maxsize=4096)
+def next_cron_date(expression, day):
+    # Cached per (expression, day): rules sharing an expression share the calendar walk
+    schedule = parse_cron(expression)
+    for offset in range(MAX_SEARCH_DAYS):
+        candidate = day + timedelta(days=offset)
+        if cron_matches(schedule, candidate):
+            return candidate
+    raise ValueError(f"cron išraiška „{expression}“ neatitinka jokios datos")
+
+
+def validate_schedule(schedule, start_date):
+    if schedule not in SCHEDULES:
+        next_cron_date(schedule, start_date)
+
+
+def add_month(day, anchor_day):
+    year, month = (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1)
+    return day.replace(year=year, month=month, day=min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def first_occurrence(schedule, start_date):
+    if schedule in SCHEDULES:
+        return start_date
+    return next_cron_date(schedule, start_date)
+
+
+def following_occurrence(rule, day):
+    if rule.schedule == 'monthly':
+        # Anchored to the start date, so a rule for the 31st returns to it after short months
+        return add_month(day, rule.start_date.day)
+    if rule.schedule == 'weekly':
+        return day + timedelta(days=7)
+    return next_cron_date(rule.schedule, day + timedelta(days=1))
+
+
+def due_dates(rule, today):
+    dates, day = [], rule.next_date
+    while day is not None and day <= today:
+        if rule.end_date is not None and day > rule.end_date:
+            day = None
+            break
+        dates.append(day)
+        day = following_occurrence(rule, day)
+    if day is not None and rule.end_date is not None and day > rule.end_date:
+        day = None
+    return dates, day
+
+
+def occurrence_deltas(rule, dates, deltas):
+    # All occurrences of a rule share its amount, category and type, so the summary
+    # delta of a month is the amount times the number of occurrences in it
+    for month, count in Counter(f"{day:%Y-%m}" for day in dates).items():
+        key = (month, rule.category_id, rule.transaction_type)
+        total, previous = deltas.get(key, (0, 0))
+        deltas[key] = (total + rule.amount_cents * count, previous + count)
+
+
+def materialize_due(connection, today):
+    # Every occurrence due up to today, for every rule, goes in with one executemany insert,
+    # one round of summary deltas and one batched update of the rules' next dates.
+    # Only due rules are read, through the index on next_date. The caller holds the write
+    # lock on SQLite; on PostgreSQL the rows are locked, so a second instance waits and then
+    # finds them no longer due instead of creating the same occurrences again.
+    rules = connection.execute(
+        select(RecurringRule).where(RecurringRule.next_date <= today).with_for_update()
+    ).all()
+
+    occurrences, deltas, advanced = [], {}, []
+    for rule in rules:
+        dates, next_date = due_dates(rule, today)
+        occurrences.extend({'date': day, 'amount_cents': rule.amount_cents, 'category_id': rule.category_id,
+                            'transaction_type': rule.transaction_type, 'description': rule.description}
+                           for day in dates)
+        occurrence_deltas(rule, dates, deltas)
+        advanced.append({'rule_id': rule.id, 'next_date': next_date})
+
+    if occurrences:
+        occurrences.sort(key=itemgetter('date'))
+        with deferred_search_indexing(connection):
+            connection.execute(insert(Transaction), occurrences)
+        apply_summary_deltas(connection, deltas)
+    if advanced:
+        connection.execute(
+            update(RecurringRule).where(RecurringRule.id == bindparam('rule_id'))
+            .values(next_date=bindparam('next_date')),
+            advanced
+        )
+    return len(occurrences)
+
+
+def describe_schedule(schedule):
+    return SCHEDULES.get(schedule, schedule)
@@ -0,0 +1,356 @@
+import argparse
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import sessionmaker
+
+from archive import archive_dir, archived_summary_rows, archived_transactions, last_closed_month
+from database import create_database_engine
+from filters import TransactionFilter, build_criteria
+from migrations import upgrade_schema
+from models import DATABASE_URL, Transaction, Category, MonthlySummary
+from money import to_cents, to_units
+from summaries import raw_summaries
+
+# Headless report service: everything here takes a session and returns pandas objects,
+# so the same code serves the Tk client, batch exports and benchmarks.
+SUMMARY_COLUMNS = ['month', 'category_id', 'transaction_type', 'amount']
+TRANSACTION_COLUMNS = ['id', 'date', 'amount_cents', 'category', 'transaction_type', 'description']
+
+
+def category_names(session):
+    return dict(session.query(Category.id, Category.name))
+
+
+def summary_rows(session, transaction_filter=None):
+    # Unfiltered reports read the maintained monthly summaries; a filter needs the
+    # same grouping computed over the matching transactions instead. Archived months
+    # are appended from their partitions either way.
+    cold = archived_summary_rows(archive_dir(session.get_bind().url), transaction_filter)
+    if transaction_filter is None or transaction_filter == TransactionFilter():
+        return session.query(
+            MonthlySummary.month,
+            MonthlySummary.category_id,
+            MonthlySummary.transaction_type,
+            MonthlySummary.total_cents
+        ).all() + cold
+    criteria = build_criteria(session, transaction_filter)
+    return [row[:4] for row in session.execute(raw_summaries().where(*criteria))] + cold
+
+
+def summary_frame(rows):
+    frame = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    frame['amount'] = frame['amount'].astype('int64')
+    return frame
+
+
+def totals_by(frame, transaction_type, column):
+    return frame[frame['transaction_type'] == transaction_type].groupby(column)['amount'].sum()
+
+
+def by_category(frame, transaction_type, names):
+    # Grouping happens on the integer id; names are only attached to the finished totals
+    totals = totals_by(frame, transaction_type, 'category_id').sort_values()
+    totals.index = pd.Index([names.get(category_id, '') for category_id in totals.index], name='category')
+    return totals
+
+
+def expenses_by_category(frame, names):
+    return by_category(frame, 'expense', names)
+
+
+def income_by_category(frame, names):
+    return by_category(frame, 'income', names)
+
+
+def monthly_expenses(frame, names):
+    return totals_by(frame, 'expense', 'month')
+
+
+def monthly_income(frame, names):
+    return totals_by(frame, 'income', 'month')
+
+
+def balance(frame, names):
+    income = totals_by(frame, 'income', 'month')
+    expenses = totals_by(frame, 'expense', 'month')
+    return income.subtract(expenses, fill_value=0).astype('int64')
+
+
+REPORTS = {
+    'expenses_by_category': expenses_by_category,
+    'income_by_category': income_by_category,
+    'monthly_expenses': monthly_expenses,
+    'monthly_income': monthly_income,
+    'balance': balance,
+}
+
+
+def compute_report(frame, report_type, names):
+    # Returns an int64 Series of totals in cents, indexed by category name or month
+    try:
+        report = REPORTS[report_type]
+    except KeyError:
+        raise ValueError(f"Nežinoma ataskaita: {report_type}") from None
+    return report(frame, names).rename('amount_cents')
+
+
+def pivot_months(rows):
+    frame = summary_frame(rows)
+    if frame.empty:
+        return pd.DataFrame(index=pd.Index([], name='month'),
+                            columns=pd.MultiIndex.from_tuples([], names=['transaction_type', 'category_id']))
+    return frame.pivot_table(index='month', columns=['transaction_type', 'category_id'], values='amount',
+                             aggfunc='sum')
+
+
+def month_grid(*frames):
+    months = [month for frame in frames for month in frame.index]
+    if not months:
+        return pd.Index([], name='month')
+    return pd.Index(pd.period_range(min(months), max(months), freq='M').strftime('%Y-%m'), name='month')
+
+
+def running_totals(session, transaction_filter=None):
+    # Months x (transaction_type, category_id) of running totals in cents, one row per
+    # calendar month. Unfiltered, this only reshapes the persisted cumulative_cents (the
+    # hot tier) and adds the archived months; a filter has no stored prefix sums, so its
+    # monthly totals are accumulated here.
+    if transaction_filter is None or transaction_filter == TransactionFilter():
+        hot = pivot_months(session.query(
+            MonthlySummary.month,
+            MonthlySummary.category_id,
+            MonthlySummary.transaction_type,
+            MonthlySummary.cumulative_cents
+        ).all())
+        cold = pivot_months(archived_summary_rows(archive_dir(session.get_bind().url)))
+        months = month_grid(hot, cold)
+        cumulative = hot.reindex(months).ffill().add(cold.reindex(months).fillna(0).cumsum(), fill_value=0)
+    else:
+        totals = pivot_months(summary_rows(session, transaction_filter))
+        cumulative = totals.reindex(month_grid(totals)).fillna(0).cumsum()
+    return cumulative.fillna(0).astype('int64')
+
+
+def type_total(cumulative, transaction_type):
+    if transaction_type not in cumulative.columns.get_level_values(0):
+        return pd.Series(0, index=cumulative.index, dtype='int64')
+    return cumulative[transaction_type].sum(axis=1)
+
+
+def moving_averages(cumulative, window):
+    # Average monthly total over the last `window` months, straight from the prefix sums.
+    # A ledger younger than the window is averaged over the months it has
+    covered = np.minimum(np.arange(1, len(cumulative) + 1), window)
+    return (cumulative - cumulative.shift(window, fill_value=0)).div(covered, axis=0)
+
+
+def cumulative_balance(cumulative, names):
+    return type_total(cumulative, 'income') - type_total(cumulative, 'expense')
+
+
+def expense_average_series(cumulative, window):
+    # Months x category_id of average monthly expenses in cents. The open month is still
+    # filling up, so the series ends at the last closed month
+    if cumulative.empty or 'expense' not in cumulative.columns.get_level_values(0):
+        return pd.DataFrame(index=pd.Index([], name='month'), dtype='int64')
+    averages = moving_averages(cumulative['expense'], window)
+    return averages[averages.index <= last_closed_month()].round().astype('int64')
+
+
+def expense_averages(cumulative, names, window):
+    # The chart shows the latest closed window per category; the export has every month
+    series = expense_average_series(cumulative, window)
+    if series.empty:
+        return pd.Series(dtype='int64', index=pd.Index([], name='category'))
+    latest = series.iloc[-1].sort_values()
+    latest.index = pd.Index([names.get(category_id, '') for category_id in latest.index], name='category')
+    return latest
+
+
+def moving_average_3(cumulative, names):
+    return expense_averages(cumulative, names, 3)
+
+
+def moving_average_12(cumulative, names):
+    return expense_averages(cumulative, names, 12)
+
+
+def year_over_year(cumulative, names):
+    # Expenses of each year minus the same months of the previous year; the latest
+    # year is compared only up to its last month with data
+    expenses = type_total(cumulative, 'expense')
+    if expenses.empty:
+        return pd.Series(dtype='int64', index=pd.Index([], name='year'))
+
+    def through(year, month):
+        key = f"{year}-{month:02d}"
+        # Months before the first one with data have a running total of zero
+        return int(expenses[key]) if key in expenses.index else 0
+
+    last_year, last_month = map(int, expenses.index[-1].split('-'))
+    first_year = int(expenses.index[0][:4])
+    changes = {}
+    for year in range(first_year + 1, last_year + 1):
+        month = last_month if year == last_year else 12
+        current = through(year, month) - through(year - 1, 12)
+        previous = through(year - 1, month) - through(year - 2, 12)
+        changes[str(year)] = current - previous
+    return pd.Series(changes, dtype='int64').rename_axis('year')
+
+
+TREND_REPORTS = {
+    'cumulative_balance': cumulative_balance,
+    'moving_average_3': moving_average_3,
+    'moving_average_12': moving_average_12,
+    'year_over_year': year_over_year,
+}
+
+REPORT_TYPES = [*REPORTS, *TREND_REPORTS]
+
+# Trend reports exported as a month-by-category series rather than their latest value
+SERIES_EXPORTS = {
+    'moving_average_3': 3,
+    'moving_average_12': 12,
+}
+
+
+def compute_trend_report(cumulative, report_type, names):
+    try:
+        report = TREND_REPORTS[report_type]
+    except KeyError:
+        raise ValueError(f"Nežinoma ataskaita: {report_type}") from None
+    return report(cumulative, names).rename('amount_cents')
+
+
+def run_report(session, report_type, transaction_filter=None):
+    if report_type in TREND_REPORTS:
+        return compute_trend_report(running_totals(session, transaction_filter), report_type,
+                                    category_names(session))
+    frame = summary_frame(summary_rows(session, transaction_filter))
+    return compute_report(frame, report_type, category_names(session))
+
+
+def filtered_transactions(session, transaction_filter=TransactionFilter(), limit=None):
+    hot = hot_transactions(session, transaction_filter, limit)
+    cold = archived_transactions(archive_dir(session.get_bind().url), transaction_filter)
+    if cold is None or cold.empty:
+        return hot
+
+    names = category_names(session)
+    cold['category'] = cold.pop('category_id').map(lambda category_id: names.get(category_id))
+    frame = pd.concat([hot, cold[TRANSACTION_COLUMNS]], ignore_index=True)
+    frame = frame.sort_values(['date', 'id'], ascending=False, ignore_index=True)
+    return frame.head(limit) if limit is not None else frame
+
+
+def hot_transactions(session, transaction_filter=TransactionFilter(), limit=None):
+    query = session.query(
+        Transaction.id,
+        Transaction.date,
+        Transaction.amount_cents,
+        Category.name,
+        Transaction.transaction_type,
+        Transaction.description
+    ).outerjoin(Category, Category.id == Transaction.category_id).filter(
+        *build_criteria(session, transaction_filter)
+    ).order_by(Transaction.date.desc(), Transaction.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return pd.DataFrame(query.all(), columns=TRANSACTION_COLUMNS)
+
+
+def export_table(report):
+    table = report.reset_index()
+    table['amount'] = to_units(table['amount_cents'])
+    return table
+
+
+def export_series(session, window, transaction_filter=None):
+    # One row per (month, category): month, category, amount_cents, amount
+    series = expense_average_series(running_totals(session, transaction_filter), window)
+    table = series.stack().rename('amount_cents').reset_index()
+    names = category_names(session)
+    table.insert(1, 'category', table.pop('category_id').map(lambda category_id: names.get(category_id, '')))
+    table['amount'] = to_units(table['amount_cents'])
+    return table
+
+
+def write_table(table, output, file_format):
+    if file_format == 'parquet':
+        try:
+            table.to_parquet(output, index=False)
+        except ImportError as e:
+            raise ValueError("Parquet eksportui reikia įdiegti pyarrow") from e
+    else:
+        table.to_csv(output if output is not None else sys.stdout, index=False)
+
+
+def category_ids(session, names):
+    found = dict(session.query(Category.name, Category.id).filter(Category.name.in_(names)))
+    missing = [name for name in names if name not in found]
+    if missing:
+        raise ValueError(f"nežinomos kategorijos: {', '.join(missing)}")
+    return tuple(found[name] for name in names)
+
+
+def read_filter(session, args):
+    def parse_date(value):
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+    return TransactionFilter(
+        date_from=parse_date(args.date_from),
+        date_to=parse_date(args.date_to),
+        amount_min=to_cents(args.amount_min) if args.amount_min else None,
+        amount_max=to_cents(args.amount_max) if args.amount_max else None,
+        categories=category_ids(session, args.category),
+        transaction_type=args.type,
+        search=args.search
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ataskaitų eksportas be grafinės sąsajos")
+    parser.add_argument('report', choices=[*REPORT_TYPES, 'transactions'])
+    parser.add_argument('--db', default=DATABASE_URL, help="duomenų bazės adresas")
+    parser.add_argument('--format', choices=['csv', 'parquet'], help="numatytasis nustatomas pagal failo plėtinį")
+    parser.add_argument('--output', '-o', help="failas; CSV be jo rašomas į standartinę išvestį")
+    parser.add_argument('--from', dest='date_from', help="data nuo (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='date_to', help="data iki (YYYY-MM-DD)")
+    parser.add_argument('--min', dest='amount_min', help="mažiausia suma")
+    parser.add_argument('--max', dest='amount_max', help="didžiausia suma")
+    parser.add_argument('--category', action='append', default=[], help="kategorija (galima kartoti)")
+    parser.add_argument('--type', choices=['', 'expense', 'income'], default='')
+    parser.add_argument('--search', default='', help="aprašymo paieška")
+    args = parser.parse_args(argv)
+
+    file_format = args.format or ('parquet' if (args.output or '').endswith('.parquet') else 'csv')
+    if file_format == 'parquet' and args.output is None:
+        parser.error("Parquet eksportui nurodykite --output")
+
+    engine = create_database_engine(args.db)
+    upgrade_schema(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        transaction_filter = read_filter(session, args)
+        if args.report == 'transactions':
+            table = filtered_transactions(session, transaction_filter)
+            table['amount'] = to_units(table['amount_cents'])
+        elif args.report in SERIES_EXPORTS:
+            table = export_series(session, SERIES_EXPORTS[args.report], transaction_filter)
+        else:
+            table = export_table(run_report(session, args.report, transaction_filter))
+        write_table(table, args.output, file_format)
+    except ValueError as e:
+        print(f"Klaida: {e}", file=sys.stderr)
+        return 1
+    finally:
+        session.close()
+        engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,155 @@
+import argparse
+
+from sqlalchemy import String, delete, func, insert, select, update
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.functions import FunctionElement
+
+from database import create_database_engine, upsert
+from models import DATABASE_URL, Base, Transaction, MonthlySummary
+from money import format_cents
+
+
+class month_of(FunctionElement):
+    # 'YYYY-MM' of a date column, in whatever spelling the dialect has
+    type = String()
+    inherit_cache = True
+
+
+@compiles(month_of)
+def compile_month_of(element, compiler, **kw):
+    return f"strftime('%Y-%m', {compiler.process(element.clauses, **kw)})"
+
+
+@compiles(month_of, 'postgresql')
+def compile_month_of_postgresql(element, compiler, **kw):
+    return f"to_char({compiler.process(element.clauses, **kw)}, 'YYYY-MM')"
+
+
+def summary_deltas(rows, sign=1):
+    deltas = {}
+    for row in rows:
+        key = (row.date.strftime("%Y-%m"), row.category_id, row.transaction_type)
+        total, count = deltas.get(key, (0, 0))
+        deltas[key] = (total + sign * row.amount_cents, count + sign)
+    return deltas
+
+
+def same_series(category_id, transaction_type):
+    return (MonthlySummary.category_id.is_not_distinct_from(category_id),
+            MonthlySummary.transaction_type == transaction_type)
+
+
+def apply_summary_deltas(connection, deltas):
+    # Runs inside the caller's transaction (a Session or a Core Connection) so summaries
+    # commit or roll back together with the rows they describe.
+    # cumulative_cents is a running total per (category, type) series: a change in month m
+    # only shifts the rows of that series from m onwards, so an append touches one row and
+    # a backdated insert touches the suffix after it.
+    for (month, category_id, transaction_type), (total, count) in deltas.items():
+        prefix_before = select(MonthlySummary.cumulative_cents).where(
+            *same_series(category_id, transaction_type), MonthlySummary.month < month
+        ).order_by(MonthlySummary.month.desc()).limit(1).scalar_subquery()
+        statement = upsert(connection, MonthlySummary).values(
+            month=month,
+            category_id=category_id,
+            transaction_type=transaction_type,
+            total_cents=total,
+            count=count,
+            cumulative_cents=func.coalesce(prefix_before, 0)
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[MonthlySummary.month, MonthlySummary.category_id, MonthlySummary.transaction_type],
+            set_={
+                'total_cents': MonthlySummary.total_cents + statement.excluded.total_cents,
+                'count': MonthlySummary.count + statement.excluded.count
+            }
+        )
+        connection.execute(statement)
+        connection.execute(
+            update(MonthlySummary)
+            .where(*same_series(category_id, transaction_type), MonthlySummary.month >= month)
+            .values(cumulative_cents=MonthlySummary.cumulative_cents + total)
+        )
+
+    if any(count < 0 for _, count in deltas.values()):
+        connection.execute(delete(MonthlySummary).where(MonthlySummary.count <= 0))
+
+
+def raw_summaries():
+    month = month_of(Transaction.date)
+    return select(
+        month.label('month'),
+        Transaction.category_id,
+        Transaction.transaction_type,
+        func.sum(Transaction.amount_cents).label('total_cents'),
+        func.count(Transaction.id).label('count')
+    ).group_by(month, Transaction.category_id, Transaction.transaction_type)
+
+
+def rebuild_summaries(session):
+    totals = raw_summaries().subquery()
+    cumulative = func.sum(totals.c.total_cents).over(
+        partition_by=(totals.c.category_id, totals.c.transaction_type), order_by=totals.c.month)
+    session.query(MonthlySummary).delete()
+    session.execute(insert(MonthlySummary).from_select(
+        ['month', 'category_id', 'transaction_type', 'total_cents', 'count', 'cumulative_cents'],
+        select(*totals.c, cumulative)
+    ))
+    session.commit()
+
+
+def running_totals(totals):
+    cumulative, running = {}, {}
+    for (month, category_id, transaction_type), (total, count) in sorted(
+            totals.items(), key=lambda item: (str(item[0][1]), item[0][2], item[0][0])):
+        series = (category_id, transaction_type)
+        running[series] = running.get(series, 0) + total
+        cumulative[(month, category_id, transaction_type)] = (total, count, running[series])
+    return cumulative
+
+
+def verify_summaries(session):
+    expected = running_totals({
+        (month, category_id, transaction_type): (total, count)
+        for month, category_id, transaction_type, total, count in session.execute(raw_summaries())
+    })
+    stored = {
+        (summary.month, summary.category_id, summary.transaction_type):
+            (summary.total_cents, summary.count, summary.cumulative_cents)
+        for summary in session.query(MonthlySummary)
+    }
+
+    mismatches = []
+    for key in sorted(expected.keys() | stored.keys()):
+        expected_values = expected.get(key, (0, 0, 0))
+        stored_values = stored.get(key, (0, 0, 0))
+        if expected_values != stored_values:
+            mismatches.append((key, expected_values, stored_values))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mėnesinių suvestinių perskaičiavimas ir tikrinimas")
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    parser.add_argument('--db', default=DATABASE_URL, help="duomenų bazės adresas")
+    args = parser.parse_args(argv)
+
+    engine = create_database_engine(args.db)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    if args.command == 'rebuild':
+        rebuild_summaries(session)
+
+    mismatches = verify_summaries(session)
+    for key, expected, stored in mismatches:
+        print(f"{' / '.join(map(str, key))}: lentelėje {format_cents(expected[0])} ({expected[1]}, "
+              f"sukaupta {format_cents(expected[2])}), suvestinėje {format_cents(stored[0])} ({stored[1]}, "
+              f"sukaupta {format_cents(stored[2])})")
+    print("Suvestinės atitinka operacijas" if not mismatches else f"Neatitikimų: {len(mismatches)}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
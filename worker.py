@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from diagnostics import metrics, profiler
+
+POLL_INTERVAL_MS = 20
+
+
+class BackgroundWorker:
+    # Runs database and aggregation jobs on one thread, each in a session of its own drawn
+    # from the app's connection pool.
+    # Each job belongs to a channel; submitting to a channel supersedes whatever is still
+    # queued or running there, and superseded results are dropped instead of delivered.
+    def __init__(self, root, engine):
+        self.root = root
+        self.Session = sessionmaker(bind=engine)
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.generations = {}
+        self.running = True
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll)
+
+    def submit(self, channel, job, callback, error_callback=None):
+        generation = self.cancel(channel)
+        self.jobs.put((channel, generation, job, callback, error_callback, time.perf_counter()))
+
+    def cancel(self, channel):
+        generation = self.generations.get(channel, 0) + 1
+        self.generations[channel] = generation
+        return generation
+
+    def is_current(self, channel, generation):
+        return self.generations.get(channel) == generation
+
+    def run(self):
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                break
+
+            channel, generation, job, callback, error_callback, submitted = item
+            if not self.is_current(channel, generation):
+                continue
+            # Time spent queued behind other jobs is kept apart from the job itself
+            metrics.record(f"worker.{channel}.wait", (time.perf_counter() - submitted) * 1000)
+
+            session = self.Session()
+            try:
+                with metrics.phase(f"worker.{channel}"), profiler.thread_profile():
+                    result, failed = job(session), False
+            except Exception as e:
+                result, failed = e, True
+            finally:
+                # Closing ends the read transaction so the next job sees fresh commits
+                session.close()
+            self.results.put((channel, generation, result, failed, callback, error_callback))
+
+    def poll(self):
+        # After shutdown nothing is delivered: the widgets the callbacks refer to may be gone
+        if not self.running:
+            return
+        self.root.after(POLL_INTERVAL_MS, self.poll)
+
+        while True:
+            try:
+                channel, generation, result, failed, callback, error_callback = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            if not self.is_current(channel, generation):
+                continue
+            if not failed:
+                callback(result)
+            elif error_callback is not None:
+                error_callback(result)
+            else:
+                raise result
+
+    def shutdown(self):
+        self.running = False
+        self.jobs.put(None)
+        self.thread.join(timeout=1)